@@ -1,9 +1,9 @@
 # app/crud.py
-from sqlalchemy import asc, desc
+from sqlalchemy import asc, desc, inspect, text
 from typing import List
 from sqlalchemy.orm import Session
 from typing import Optional
-from . import models, schemas
+from . import models, schemas, crud_stats, notifications, dice
 from sqlalchemy.orm import joinedload
 import json
 
@@ -34,8 +34,7 @@ def create_campaign(db: Session, campaign: schemas.CampaignCreate, owner_id: int
         owner_id=owner_id,
     )
     db.add(db_campaign)
-    db.commit()
-    db.refresh(db_campaign)
+    db.flush()
     
     # Автоматически добавляем владельца как GM в campaign_members
     db_member = models.CampaignMember(
@@ -44,7 +43,9 @@ def create_campaign(db: Session, campaign: schemas.CampaignCreate, owner_id: int
         role=models.MemberRole.gm
     )
     db.add(db_member)
+    crud_stats.apply_delta(db, owner_id, gm_campaigns=1)
     db.commit()
+    db.refresh(db_campaign)
     
     return db_campaign
 
@@ -98,6 +99,27 @@ def update_character(db: Session, character_id: int, character_update: schemas.C
     return db_character
 
 
+def set_character_user(db: Session, character_id: int, user_id: Optional[int]):
+    """Привязать персонажа к игроку (tg id) или отвязать (None)"""
+    db_character = get_character(db, character_id)
+    if not db_character:
+        return None
+
+    db_character.user_id = user_id
+    db.commit()
+    db.refresh(db_character)
+    return db_character
+
+
+def ensure_character_user_column(db: Session) -> None:
+    """Добавить колонку user_id в таблицу персонажей, созданную до её появления"""
+    columns = {column["name"] for column in inspect(db.get_bind()).get_columns("characters")}
+    if "user_id" not in columns:
+        db.execute(text("ALTER TABLE characters ADD COLUMN user_id INTEGER"))
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_characters_user_id ON characters (user_id)"))
+        db.commit()
+
+
 def delete_character(db: Session, character_id: int):
     db_character = get_character(db, character_id)
     if not db_character:
@@ -107,6 +129,70 @@ def delete_character(db: Session, character_id: int):
     return True
 
 
+# ----- ENEMY LIBRARY -----
+
+
+def _pack_enemy_stats(data: schemas.MobStats) -> str:
+    stats = {"max_hp": data.max_hp, "ac": data.ac, "initiative_mod": data.initiative_mod}
+    if data.attacks:
+        stats["attacks"] = [a.dict() for a in data.attacks]
+    return json.dumps(stats, ensure_ascii=False, separators=(",", ":"))
+
+
+def enemy_template_to_schema(template: models.EnemyTemplate) -> schemas.EnemyTemplate:
+    return schemas.EnemyTemplate(
+        id=template.id,
+        campaign_id=template.campaign_id,
+        name=template.name,
+        **json.loads(template.stats),
+    )
+
+
+def create_enemy_template(db: Session, campaign_id: int, data: schemas.EnemyTemplateCreate) -> models.EnemyTemplate:
+    template = models.EnemyTemplate(
+        campaign_id=campaign_id,
+        name=data.name,
+        stats=_pack_enemy_stats(data),
+    )
+    db.add(template)
+    db.commit()
+    db.refresh(template)
+    return template
+
+
+def get_enemy_templates(db: Session, campaign_id: int) -> List[models.EnemyTemplate]:
+    return (
+        db.query(models.EnemyTemplate)
+        .filter(models.EnemyTemplate.campaign_id == campaign_id)
+        .order_by(models.EnemyTemplate.name, models.EnemyTemplate.id)
+        .all()
+    )
+
+
+def get_enemy_templates_by_ids(db: Session, campaign_id: int, ids: List[int]) -> dict:
+    """id -> шаблон (только шаблоны этой кампании), одним запросом"""
+    if not ids:
+        return {}
+    templates = (
+        db.query(models.EnemyTemplate)
+        .filter(models.EnemyTemplate.campaign_id == campaign_id)
+        .filter(models.EnemyTemplate.id.in_(set(ids)))
+        .all()
+    )
+    return {t.id: t for t in templates}
+
+
+def delete_enemy_template(db: Session, campaign_id: int, enemy_id: int) -> bool:
+    deleted = (
+        db.query(models.EnemyTemplate)
+        .filter(models.EnemyTemplate.campaign_id == campaign_id)
+        .filter(models.EnemyTemplate.id == enemy_id)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted > 0
+
+
 # ----- ENCOUNTERS -----
 
 
@@ -139,13 +225,17 @@ def add_participants_to_encounter(
     encounter_id: int,
     participants_data: schemas.EncounterParticipantsCreate,
 ):
-    import random
-
     encounter = db.query(models.Encounter).filter(
         models.Encounter.id == encounter_id).first()
     if not encounter:
         return None
 
+    # d20 на инициативу всех мобов - одним броском
+    d20 = dice.initiative_rolls(
+        len(participants_data.unique_monsters)
+        + sum(g.count for g in participants_data.group_monsters)
+    )
+
     # 1) Игроки
     for p in participants_data.players:
         db_part = models.Participant(
@@ -164,7 +254,7 @@ def add_participants_to_encounter(
 
     # 2) Уникальные мобы
     for m in participants_data.unique_monsters:
-        roll = random.randint(1, 20) + m.initiative_mod
+        roll = next(d20) + m.initiative_mod
         
         # Сериализуем атаки в JSON, если они есть
         attacks_json = None
@@ -197,7 +287,7 @@ def add_participants_to_encounter(
             attacks_json = json.dumps([a.dict() for a in g.attacks])
         
         for i in range(g.count):
-            roll = random.randint(1, 20) + g.initiative_mod
+            roll = next(d20) + g.initiative_mod
             db_part = models.Participant(
                 encounter_id=encounter_id,
                 type=models.ParticipantType.npc_group,
@@ -237,73 +327,134 @@ def _get_next_group_id(db: Session, encounter_id: int) -> int:
 
 # ----- Добавление участников в активную схватку -----
 
+def _current_actor_id(db: Session, encounter_id: int, state: models.EncounterState) -> Optional[int]:
+    """id участника, чей сейчас ход (позиция current_index в порядке ходов)"""
+    return (
+        db.query(models.Participant.id)
+        .filter(models.Participant.encounter_id == encounter_id)
+        .order_by(models.Participant.initiative_total.desc(), models.Participant.id.asc())
+        .offset(state.current_index)
+        .limit(1)
+        .scalar()
+    )
+
+
+def _keep_current_actor(db: Session, encounter_id: int, state: models.EncounterState, actor_id: Optional[int]):
+    """
+    Новые участники встают в порядок ходов по инициативе и сдвигают позиции.
+    current_index переставляется на прежнего участника, чтобы ход не перешёл
+    к новичку посреди раунда.
+    """
+    if actor_id is None:
+        return
+    actor = db.query(models.Participant).filter(models.Participant.id == actor_id).first()
+    state.current_index = (
+        db.query(models.Participant)
+        .filter(models.Participant.encounter_id == encounter_id)
+        .filter(
+            (models.Participant.initiative_total > actor.initiative_total)
+            | ((models.Participant.initiative_total == actor.initiative_total)
+               & (models.Participant.id < actor.id))
+        )
+        .count()
+    )
+
+
+def _add_mob_copies(db: Session, encounter_id: int, stats: schemas.MobStats, hp_values: List[int], d20):
+    """
+    Копии одного моба, по одной на каждое значение hp_values.
+    Одна копия - уникальный моб, несколько - группа "#1", "#2", ...
+    """
+    attacks_json = None
+    if stats.attacks:
+        attacks_json = json.dumps([a.dict() for a in stats.attacks])
+
+    if len(hp_values) == 1:
+        # Уникальный моб
+        db.add(models.Participant(
+            encounter_id=encounter_id,
+            type=models.ParticipantType.npc_unique,
+            character_id=None,
+            name=stats.name,
+            max_hp=hp_values[0],
+            current_hp=hp_values[0],
+            ac=stats.ac,
+            initiative_total=next(d20) + stats.initiative_mod,
+            is_enemy=True,
+            attacks=attacks_json,
+        ))
+        return
+
+    # Группа мобов
+    group_id = _get_next_group_id(db, encounter_id)
+    for i, hp in enumerate(hp_values):
+        db.add(models.Participant(
+            encounter_id=encounter_id,
+            type=models.ParticipantType.npc_group,
+            character_id=None,
+            name=f"{stats.name} #{i+1}",
+            max_hp=hp,
+            current_hp=hp,
+            ac=stats.ac,
+            initiative_total=next(d20) + stats.initiative_mod,
+            is_enemy=True,
+            group_id=group_id,
+            attacks=attacks_json,
+        ))
+
+
 def add_participants_to_active_encounter(
     db: Session,
     encounter_id: int,
     participants_data: schemas.AddParticipantsToActiveEncounter,
-):
+) -> tuple[Optional[models.Encounter], Optional[str]]:
     """
     Добавляет новых участников в активную схватку используя шаблоны мобов.
     Новые участники вставляются в порядок ходов согласно инициативе.
+    Возвращает (encounter, None) или (None, причина), если схватки или
+    врага из библиотеки нет - тогда ничего не добавляется.
     """
-    import random
-
     encounter = db.query(models.Encounter).filter(
         models.Encounter.id == encounter_id).first()
     if not encounter:
-        return None
+        return None, "Encounter not found"
 
     # Получаем текущее состояние
     state = encounter.state
     if not state:
-        return None
+        return None, "Encounter not found"
+
+    # Враги из библиотеки кампании превращаются в такие же шаблоны
+    library = get_enemy_templates_by_ids(
+        db, encounter.campaign_id, [e.enemy_id for e in participants_data.from_library]
+    )
+    missing = sorted({e.enemy_id for e in participants_data.from_library} - library.keys())
+    if missing:
+        return None, f"Враг не найден в библиотеке кампании: {', '.join(map(str, missing))}"
+
+    templates = list(participants_data.from_templates)
+    for entry in participants_data.from_library:
+        enemy = library[entry.enemy_id]
+        templates.append(schemas.MobTemplate(
+            name=enemy.name, count=entry.count, **json.loads(enemy.stats)
+        ))
+
+    actor_id = _current_actor_id(db, encounter_id, state)
+
+    # d20 на инициативу всех новых мобов - одним броском
+    d20 = dice.initiative_rolls(
+        sum(t.count for t in templates)
+        + len(participants_data.unique_monsters)
+        + sum(g.count for g in participants_data.group_monsters)
+    )
 
     # 1) Добавление мобов из шаблонов
-    for template in participants_data.from_templates:
-        # Сериализуем атаки
-        attacks_json = None
-        if template.attacks:
-            attacks_json = json.dumps([a.dict() for a in template.attacks])
-        
-        if template.count == 1:
-            # Уникальный моб
-            roll = random.randint(1, 20) + template.initiative_mod
-            db_part = models.Participant(
-                encounter_id=encounter_id,
-                type=models.ParticipantType.npc_unique,
-                character_id=None,
-                name=template.name,
-                max_hp=template.max_hp,
-                current_hp=template.max_hp,
-                ac=template.ac,
-                initiative_total=roll,
-                is_enemy=True,
-                attacks=attacks_json,
-            )
-            db.add(db_part)
-        else:
-            # Группа мобов
-            group_id = _get_next_group_id(db, encounter_id)
-            for i in range(template.count):
-                roll = random.randint(1, 20) + template.initiative_mod
-                db_part = models.Participant(
-                    encounter_id=encounter_id,
-                    type=models.ParticipantType.npc_group,
-                    character_id=None,
-                    name=f"{template.name} #{i+1}",
-                    max_hp=template.max_hp,
-                    current_hp=template.max_hp,
-                    ac=template.ac,
-                    initiative_total=roll,
-                    is_enemy=True,
-                    group_id=group_id,
-                    attacks=attacks_json,
-                )
-                db.add(db_part)
+    for template in templates:
+        _add_mob_copies(db, encounter_id, template, [template.max_hp] * template.count, d20)
 
     # 2) Уникальные мобы
     for m in participants_data.unique_monsters:
-        roll = random.randint(1, 20) + m.initiative_mod
+        roll = next(d20) + m.initiative_mod
         
         attacks_json = None
         if m.attacks:
@@ -334,7 +485,7 @@ def add_participants_to_active_encounter(
             attacks_json = json.dumps([a.dict() for a in g.attacks])
         
         for i in range(g.count):
-            roll = random.randint(1, 20) + g.initiative_mod
+            roll = next(d20) + g.initiative_mod
             db_part = models.Participant(
                 encounter_id=encounter_id,
                 type=models.ParticipantType.npc_group,
@@ -352,21 +503,29 @@ def add_participants_to_active_encounter(
 
     db.commit()
     
-    # Пересчитываем current_index после добавления (новые участники могут изменить порядок)
-    # Для этого найдём текущего участника и пересчитаем его позицию
-    participants_sorted = (
-        db.query(models.Participant)
-        .filter(models.Participant.encounter_id == encounter_id)
-        .order_by(models.Participant.initiative_total.desc(), models.Participant.id.asc())
-        .all()
-    )
-    
-    # Если есть участники, находим текущего
-    if participants_sorted and state.current_index < len(participants_sorted):
-        # Текущий индекс остаётся на том же участнике (по ID)
-        # Новые участники вставятся согласно инициативе
-        pass  # current_index оставляем без изменений
-    
+    # Ход остаётся у того же участника, хотя его позиция могла сдвинуться
+    _keep_current_actor(db, encounter_id, state, actor_id)
+    db.commit()
+    db.refresh(encounter)
+    return encounter, None
+
+
+def spawn_mobs_in_active_encounter(
+    db: Session,
+    encounter_id: int,
+    stats: schemas.MobStats,
+    hp_values: List[int],
+):
+    """Добавить в активную схватку копии одного моба (существо из бестиария)"""
+    encounter = db.query(models.Encounter).filter(
+        models.Encounter.id == encounter_id).first()
+    if not encounter or not encounter.state:
+        return None
+
+    actor_id = _current_actor_id(db, encounter_id, encounter.state)
+    _add_mob_copies(db, encounter_id, stats, hp_values, dice.initiative_rolls(len(hp_values)))
+    db.commit()
+    _keep_current_actor(db, encounter_id, encounter.state, actor_id)
     db.commit()
     db.refresh(encounter)
     return encounter
@@ -393,6 +552,8 @@ def start_encounter(db: Session, encounter_id: int):
         return encounter  # пока просто не трогаем
 
     # делаем статус active и ставим текущий индекс = 0
+    if encounter.status != models.EncounterStatus.active:
+        crud_stats.apply_delta(db, encounter.gm_id, active_encounters=1)
     encounter.status = models.EncounterStatus.active
 
     state = encounter.state
@@ -410,6 +571,9 @@ def start_encounter(db: Session, encounter_id: int):
     db.commit()
     db.refresh(encounter)
     db.refresh(state)
+
+    _notify_combat_started(db, encounter)
+    _notify_turn(db, encounter)
     return encounter
 
 
@@ -560,9 +724,68 @@ def next_turn(db: Session, encounter_id: int):
     db.commit()
     db.refresh(state)
     db.refresh(encounter)
+
+    _notify_turn(db, encounter)
     return encounter
 
 
+# ----- NOTIFICATIONS -----
+# Уведомления уходят в фоне (app/notifications.py) и не задерживают ответ
+
+
+def _encounter_title(encounter: models.Encounter) -> str:
+    if encounter.name:
+        return f"«{encounter.name}» ({encounter.campaign.name})"
+    return encounter.campaign.name
+
+
+def _notify_combat_started(db: Session, encounter: models.Encounter):
+    """«Бой начался» наблюдателям кампании и игрокам, чьи персонажи участвуют"""
+    if not notifications.enabled():
+        return
+
+    observers = db.query(models.CampaignMember.user_id).filter(
+        models.CampaignMember.campaign_id == encounter.campaign_id,
+        models.CampaignMember.role == models.MemberRole.observer
+    ).all()
+    players = (
+        db.query(models.Character.user_id)
+        .join(models.Participant, models.Participant.character_id == models.Character.id)
+        .filter(models.Participant.encounter_id == encounter.id)
+        .filter(models.Character.user_id.isnot(None))
+        .all()
+    )
+
+    recipients = {user_id for (user_id,) in observers + players} - {encounter.gm_id}
+    message = f"⚔️ Бой начался: {_encounter_title(encounter)}"
+    for user_id in recipients:
+        notifications.notify(user_id, message, key=("start", encounter.id))
+
+
+def _notify_turn(db: Session, encounter: models.Encounter):
+    """«Твой ход» игроку, к которому привязан персонаж текущего участника"""
+    if not notifications.enabled() or encounter.state is None:
+        return
+
+    # Тот же порядок, что в get_encounter_state_for_gm
+    row = (
+        db.query(models.Participant.name, models.Character.user_id)
+        .outerjoin(models.Character, models.Participant.character_id == models.Character.id)
+        .filter(models.Participant.encounter_id == encounter.id)
+        .order_by(models.Participant.initiative_total.desc(), models.Participant.id.asc())
+        .offset(encounter.state.current_index)
+        .first()
+    )
+    if row is None or row.user_id is None:
+        return
+
+    notifications.notify(
+        row.user_id,
+        f"🎯 Твой ход, {row.name}! {_encounter_title(encounter)}, раунд {encounter.state.round}",
+        key=("turn", encounter.id),
+    )
+
+
 # ----- HP CHANGE / FINISH / DELETE -----
 
 
@@ -600,6 +823,8 @@ def finish_encounter(db: Session, encounter_id: int):
     if not encounter:
         return None
 
+    if encounter.status == models.EncounterStatus.active:
+        crud_stats.apply_delta(db, encounter.gm_id, active_encounters=-1)
     encounter.status = models.EncounterStatus.finished
     db.commit()
     db.refresh(encounter)
@@ -615,6 +840,8 @@ def delete_encounter(db: Session, encounter_id: int):
     if not encounter:
         return False
 
+    if encounter.status == models.EncounterStatus.active:
+        crud_stats.apply_delta(db, encounter.gm_id, active_encounters=-1)
     db.delete(encounter)
     db.commit()
     return True
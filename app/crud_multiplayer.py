@@ -2,11 +2,13 @@
 # CRUD операции для мультиплеерной системы доступа
 
 from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import update, and_, or_, func, inspect
+from sqlalchemy.exc import IntegrityError
 from typing import Optional, List
 from datetime import datetime, timedelta
 import secrets
 import json
-from . import models, schemas
+from . import models, schemas, crud_stats
 
 
 # ----- CAMPAIGN MEMBERS -----
@@ -73,6 +75,7 @@ def remove_campaign_member(db: Session, campaign_id: int, user_id: int) -> bool:
         return False
     
     db.delete(member)
+    crud_stats.apply_delta(db, user_id, observer_campaigns=-1)
     db.commit()
     return True
 
@@ -131,6 +134,18 @@ def get_invite_by_token(db: Session, token: str) -> Optional[models.CampaignInvi
     ).first()
 
 
+def get_invite_with_campaign_name(
+    db: Session,
+    token: str
+) -> Optional[tuple[models.CampaignInvite, str]]:
+    """Инвайт и название его кампании одним запросом"""
+    return db.query(models.CampaignInvite, models.Campaign.name).join(
+        models.Campaign, models.Campaign.id == models.CampaignInvite.campaign_id
+    ).filter(
+        models.CampaignInvite.invite_token == token
+    ).first()
+
+
 def validate_invite(invite: models.CampaignInvite) -> tuple[bool, Optional[str]]:
     """Проверить валидность инвайта. Возвращает (is_valid, error_message)"""
     if not invite.is_active:
@@ -150,45 +165,71 @@ def join_campaign_by_invite(
     invite_token: str,
     user_id: int
 ) -> tuple[Optional[models.Campaign], Optional[str]]:
-    """Присоединиться к кампании по инвайт-токену. Возвращает (campaign, error)"""
+    """
+    Присоединиться к кампании по инвайт-токену. Возвращает (campaign, error)
+    
+    Безопасно при одновременных вступлениях: использование инвайта занимается
+    одним условным UPDATE (условия валидности - в WHERE), членство добавляется
+    INSERT под уникальным индексом (campaign_id, user_id), всё в одной короткой транзакции.
+    """
     invite = get_invite_by_token(db, invite_token)
     
     if not invite:
         return None, "Неверный токен приглашения"
     
-    # Проверяем валидность
+    # Быстрая проверка без блокировок - понятная ошибка для заведомо негодного инвайта
     is_valid, error = validate_invite(invite)
     if not is_valid:
         return None, error
     
     campaign_id = invite.campaign_id
     
-    # Проверяем, не является ли пользователь уже участником
-    existing = db.query(models.CampaignMember).filter(
+    # Уже участник - просто возвращаем кампанию, использование не расходуем
+    existing = db.query(models.CampaignMember.id).filter(
         models.CampaignMember.campaign_id == campaign_id,
         models.CampaignMember.user_id == user_id
     ).first()
     
-    if existing:
-        # Уже участник - просто возвращаем кампанию
-        campaign = db.query(models.Campaign).filter(
-            models.Campaign.id == campaign_id
-        ).first()
-        return campaign, None
-    
-    # Добавляем как observer
-    member = models.CampaignMember(
-        campaign_id=campaign_id,
-        user_id=user_id,
-        role=models.MemberRole.observer
-    )
-    db.add(member)
-    
-    # Увеличиваем счётчик использований
-    invite.current_uses += 1
-    
-    db.commit()
-    db.refresh(member)
+    if not existing:
+        # Атомарно занимаем одно использование: лимит и срок проверяет сама БД
+        Invite = models.CampaignInvite
+        result = db.execute(
+            update(Invite)
+            .where(
+                Invite.id == invite.id,
+                Invite.is_active.is_(True),
+                or_(Invite.expires_at.is_(None), Invite.expires_at >= datetime.utcnow()),
+                or_(
+                    Invite.max_uses.is_(None),
+                    Invite.max_uses == 0,
+                    func.coalesce(Invite.current_uses, 0) < Invite.max_uses
+                )
+            )
+            .values(current_uses=func.coalesce(Invite.current_uses, 0) + 1)
+            .execution_options(synchronize_session=False)
+        )
+        
+        if result.rowcount == 0:
+            # Инвайт успели исчерпать или отключить
+            db.rollback()
+            db.refresh(invite)
+            is_valid, error = validate_invite(invite)
+            return None, error or "Приглашение недоступно"
+        
+        # Добавляем как observer
+        db.add(models.CampaignMember(
+            campaign_id=campaign_id,
+            user_id=user_id,
+            role=models.MemberRole.observer
+        ))
+        crud_stats.apply_delta(db, user_id, observer_campaigns=1)
+        
+        try:
+            db.commit()
+        except IntegrityError:
+            # Параллельный запрос того же пользователя успел раньше:
+            # откат возвращает и занятое использование
+            db.rollback()
     
     campaign = db.query(models.Campaign).filter(
         models.Campaign.id == campaign_id
@@ -197,6 +238,27 @@ def join_campaign_by_invite(
     return campaign, None
 
 
+def ensure_member_unique_index(db: Session) -> int:
+    """
+    Уникальный индекс (campaign_id, user_id) для баз, созданных до его появления.
+    Дубли членства, оставшиеся от гонок, удаляются (остаётся самая ранняя запись).
+    Возвращает число удалённых дублей.
+    """
+    index = next(i for i in models.CampaignMember.__table__.indexes if i.name == "uq_campaign_member")
+    existing = {i["name"] for i in inspect(db.get_bind()).get_indexes(models.CampaignMember.__tablename__)}
+    if index.name in existing:
+        return 0
+    
+    Member = models.CampaignMember
+    keep = db.query(func.min(Member.id)).group_by(Member.campaign_id, Member.user_id)
+    removed = db.query(Member).filter(Member.id.not_in(keep.scalar_subquery())).delete(
+        synchronize_session=False
+    )
+    db.commit()
+    index.create(bind=db.get_bind())
+    return removed
+
+
 def deactivate_invite(db: Session, invite_id: int) -> bool:
     """Деактивировать инвайт"""
     invite = db.query(models.CampaignInvite).filter(
@@ -211,6 +273,33 @@ def deactivate_invite(db: Session, invite_id: int) -> bool:
     return True
 
 
+def sweep_invites(db: Session, purge_after_days: int = 30) -> tuple[int, int]:
+    """
+    Обслуживание таблицы инвайтов: деактивировать истёкшие и исчерпанные,
+    удалить неактивные старше purge_after_days. Возвращает (деактивировано, удалено).
+    """
+    Invite = models.CampaignInvite
+    now = datetime.utcnow()
+    
+    deactivated = db.query(Invite).filter(
+        Invite.is_active.is_(True),
+        or_(
+            Invite.expires_at < now,
+            and_(Invite.max_uses > 0, Invite.current_uses >= Invite.max_uses)
+        )
+    ).update({Invite.is_active: False}, synchronize_session=False)
+    
+    cutoff = now - timedelta(days=purge_after_days)
+    purged = db.query(Invite).filter(
+        Invite.is_active.is_(False),
+        Invite.created_at < cutoff,
+        or_(Invite.expires_at.is_(None), Invite.expires_at < cutoff)
+    ).delete(synchronize_session=False)
+    
+    db.commit()
+    return deactivated, purged
+
+
 def get_campaign_invites(db: Session, campaign_id: int) -> List[models.CampaignInvite]:
     """Получить все инвайты кампании"""
     return db.query(models.CampaignInvite).filter(
@@ -285,3 +374,93 @@ def get_active_encounters_for_campaign(
         models.Encounter.campaign_id == campaign_id,
         models.Encounter.status == models.EncounterStatus.active
     ).all()
+
+
+def ensure_dashboard_indexes(db: Session) -> None:
+    """Индексы сводки наблюдателя (статус схватки, участники схватки) для старых баз"""
+    bind = db.get_bind()
+    for column in (models.Encounter.__table__.c.status, models.Participant.__table__.c.encounter_id):
+        existing = {i["name"] for i in inspect(bind).get_indexes(column.table.name)}
+        for index in column.table.indexes:
+            if index.name not in existing and list(index.columns) == [column]:
+                index.create(bind=bind)
+
+
+def get_active_encounters_dashboard(
+    db: Session,
+    user_id: int
+) -> List[schemas.ObserverDashboardEncounter]:
+    """
+    Активные схватки всех кампаний пользователя (GM или участник) с раундом
+    и тем, чей сейчас ход, - одним запросом. Участник на current_index
+    находится оконной функцией в порядке ходов (инициатива по убыванию, id).
+    """
+    member_campaigns = db.query(models.CampaignMember.campaign_id).filter(
+        models.CampaignMember.user_id == user_id
+    )
+    # Активные схватки кампаний пользователя: по ним же ограничено и окно
+    # участников, чтобы опрос не зависел от числа схваток на сервере
+    mine = and_(
+        models.Encounter.status == models.EncounterStatus.active,
+        models.Encounter.campaign_id.in_(
+            db.query(models.Campaign.id).filter(models.Campaign.owner_id == user_id)
+            .union(member_campaigns)
+        ),
+    )
+
+    order = (models.Participant.initiative_total.desc(), models.Participant.id.asc())
+    ranked = (
+        db.query(
+            models.Participant.encounter_id,
+            models.Participant.id,
+            models.Participant.name,
+            models.Participant.is_enemy,
+            func.row_number().over(
+                partition_by=models.Participant.encounter_id, order_by=order
+            ).label("position"),
+            func.count().over(partition_by=models.Participant.encounter_id).label("total"),
+        )
+        .join(models.Encounter, models.Encounter.id == models.Participant.encounter_id)
+        .filter(mine)
+        .subquery()
+    )
+
+    rows = (
+        db.query(
+            models.Encounter.id,
+            models.Encounter.name,
+            models.Campaign.id.label("campaign_id"),
+            models.Campaign.name.label("campaign_name"),
+            models.EncounterState.round,
+            models.EncounterState.current_index,
+            ranked.c.id.label("participant_id"),
+            ranked.c.name.label("participant_name"),
+            ranked.c.is_enemy,
+            ranked.c.total,
+        )
+        .join(models.Campaign, models.Campaign.id == models.Encounter.campaign_id)
+        .join(models.EncounterState, models.EncounterState.encounter_id == models.Encounter.id)
+        .outerjoin(ranked, and_(
+            ranked.c.encounter_id == models.Encounter.id,
+            ranked.c.position == models.EncounterState.current_index + 1,
+        ))
+        .filter(mine)
+        .order_by(models.Campaign.name, models.Encounter.id)
+        .all()
+    )
+
+    return [
+        schemas.ObserverDashboardEncounter(
+            encounter_id=r.id,
+            encounter_name=r.name,
+            campaign_id=r.campaign_id,
+            campaign_name=r.campaign_name,
+            round=r.round,
+            current_index=r.current_index,
+            participants_count=r.total or 0,
+            current_participant_id=r.participant_id,
+            current_participant_name=r.participant_name,
+            current_is_enemy=r.is_enemy,
+        )
+        for r in rows
+    ]
@@ -1,16 +1,92 @@
 # app/crud_reference.py
+import hashlib
+import json
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
-from typing import List, Optional
+from sqlalchemy import or_, func, inspect, text
+from typing import Dict, List, Optional
 from . import models_reference, schemas_reference
 
 
+# ============ DATASET VERSION ============
+
+DATASET_VERSION_KEY = "dataset_version"
+
+
+def get_dataset_version(db: Session) -> int:
+    """Текущая версия набора данных справочника (0, если загрузок ещё не было)"""
+    meta = db.query(models_reference.ReferenceMeta).filter(
+        models_reference.ReferenceMeta.key == DATASET_VERSION_KEY
+    ).first()
+    return meta.value if meta else 0
+
+
+def bump_dataset_version(db: Session) -> int:
+    """Увеличить версию набора данных. Вызывается загрузчиками после изменения данных."""
+    meta = db.query(models_reference.ReferenceMeta).filter(
+        models_reference.ReferenceMeta.key == DATASET_VERSION_KEY
+    ).first()
+    
+    if meta:
+        meta.value = models_reference.ReferenceMeta.value + 1
+    else:
+        meta = models_reference.ReferenceMeta(key=DATASET_VERSION_KEY, value=1)
+        db.add(meta)
+    
+    db.commit()
+    db.refresh(meta)
+    return meta.value
+
+
+# ============ CONTENT HASH ============
+
+REFERENCE_MODELS = (
+    models_reference.ReferenceSpell,
+    models_reference.ReferenceItem,
+    models_reference.ReferenceCreature,
+)
+
+# Служебные колонки не входят в хэш содержимого
+_HASH_EXCLUDED = {"id", "content_hash", "updated_at"}
+
+
+def content_hash(model, record: dict) -> str:
+    """sha256 нормализованной записи: только колонки таблицы, ключи по алфавиту"""
+    normalized = {
+        column.name: record.get(column.name)
+        for column in model.__table__.columns
+        if column.name not in _HASH_EXCLUDED
+    }
+    payload = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_content_hashes(db: Session, model) -> Dict[int, Optional[str]]:
+    """external_id -> content_hash для всех записей таблицы (одним запросом)"""
+    return {
+        external_id: digest
+        for external_id, digest in db.query(model.external_id, model.content_hash).all()
+    }
+
+
+def ensure_content_hash_columns(db: Session) -> None:
+    """Добавить колонку content_hash в таблицы, созданные до её появления"""
+    inspector = inspect(db.get_bind())
+    for model in REFERENCE_MODELS:
+        table = model.__tablename__
+        columns = {column["name"] for column in inspector.get_columns(table)}
+        if "content_hash" not in columns:
+            db.execute(text(f"ALTER TABLE {table} ADD COLUMN content_hash VARCHAR(64)"))
+    db.commit()
+
+
 # ============ SPELLS CRUD ============
 
 def create_spell(db: Session, spell_data: dict) -> models_reference.ReferenceSpell:
     """Создать новое заклинание в базе"""
     db_spell = models_reference.ReferenceSpell(**spell_data)
     db.add(db_spell)
+    db.flush()
+    _sync_spell_classes(db, db_spell)
     db.commit()
     db.refresh(db_spell)
     return db_spell
@@ -29,11 +105,106 @@ def update_spell(db: Session, spell_id: int, spell_data: dict) -> Optional[model
     for key, value in spell_data.items():
         setattr(db_spell, key, value)
     
+    # Запись изменена в обход загрузчика - следующий обход перезапишет её
+    db_spell.content_hash = None
+    
+    _sync_spell_classes(db, db_spell)
     db.commit()
     db.refresh(db_spell)
     return db_spell
 
 
+def _class_key(name: str) -> str:
+    """Ключ класса для индекса (Python lower() корректно работает с кириллицей)"""
+    return name.strip().lower()
+
+
+def _sync_spell_classes(db: Session, db_spell: models_reference.ReferenceSpell):
+    """Пересобрать строки reference_spell_classes для заклинания (без commit)"""
+    db.query(models_reference.ReferenceSpellClass).filter(
+        models_reference.ReferenceSpellClass.spell_id == db_spell.id
+    ).delete(synchronize_session=False)
+    
+    if db_spell.level is None:
+        return
+    
+    keys = set()
+    for names, is_subclass in ((db_spell.classes, False), (db_spell.subclasses, True)):
+        for name in names or []:
+            if name and name.strip():
+                keys.add((_class_key(name), is_subclass))
+    
+    for class_key, is_subclass in keys:
+        db.add(models_reference.ReferenceSpellClass(
+            spell_id=db_spell.id,
+            class_key=class_key,
+            is_subclass=is_subclass,
+            level=db_spell.level
+        ))
+
+
+def rebuild_spell_class_index(db: Session) -> int:
+    """Заполнить reference_spell_classes по всем заклинаниям. Возвращает число заклинаний."""
+    spells = db.query(models_reference.ReferenceSpell).all()
+    for db_spell in spells:
+        _sync_spell_classes(db, db_spell)
+    db.commit()
+    return len(spells)
+
+
+def ensure_spell_class_index(db: Session) -> None:
+    """Построить индекс по классам, если заклинания загружены до его появления"""
+    has_spells = db.query(models_reference.ReferenceSpell.id).first() is not None
+    has_index = db.query(models_reference.ReferenceSpellClass.id).first() is not None
+    if has_spells and not has_index:
+        rebuild_spell_class_index(db)
+
+
+def sync_spell_classes_by_external_ids(db: Session, external_ids: List[int]) -> None:
+    """Пересобрать индекс по классам для заклинаний из списка (без commit)"""
+    spells = db.query(models_reference.ReferenceSpell).filter(
+        models_reference.ReferenceSpell.external_id.in_(external_ids)
+    ).all()
+    for db_spell in spells:
+        _sync_spell_classes(db, db_spell)
+
+
+def get_spells_by_class(
+    db: Session,
+    class_name: Optional[str] = None,
+    subclass: Optional[str] = None,
+    min_level: int = 0,
+    max_level: int = 9,
+    limit: int = 100
+) -> List[models_reference.ReferenceSpell]:
+    """
+    Заклинания, доступные классу и/или подклассу, в диапазоне уровней.
+    С подклассом в выдачу попадают и заклинания класса, и заклинания подкласса.
+    """
+    link = models_reference.ReferenceSpellClass
+    
+    conditions = []
+    if class_name:
+        conditions.append((link.class_key == _class_key(class_name)) & (link.is_subclass == False))  # noqa: E712
+    if subclass:
+        conditions.append((link.class_key == _class_key(subclass)) & (link.is_subclass == True))  # noqa: E712
+    if not conditions:
+        return []
+    
+    spell_ids = db.query(link.spell_id).filter(
+        or_(*conditions),
+        link.level >= min_level,
+        link.level <= max_level
+    )
+    
+    return db.query(models_reference.ReferenceSpell).filter(
+        models_reference.ReferenceSpell.id.in_(spell_ids.scalar_subquery())
+    ).order_by(
+        models_reference.ReferenceSpell.level,
+        models_reference.ReferenceSpell.name
+    ).limit(limit).all()
+
+
 def get_spell_by_id(db: Session, spell_id: int) -> Optional[models_reference.ReferenceSpell]:
     """Получить заклинание по ID"""
     return db.query(models_reference.ReferenceSpell).filter(
@@ -294,3 +465,75 @@ def get_all_suggestions(
         items=get_items_suggestions(db, query, limit_per_type),
         creatures=get_creatures_suggestions(db, query, limit_per_type)
     )
+
+
+# ============ BATCH ============
+
+def _get_by_ids(db: Session, model, ids: List[int]) -> dict:
+    """Загрузить записи одним IN-запросом. Возвращает {id: запись}."""
+    if not ids:
+        return {}
+    rows = db.query(model).filter(model.id.in_(set(ids))).all()
+    return {row.id: row for row in rows}
+
+
+def get_spells_by_ids(db: Session, ids: List[int]) -> dict:
+    """Заклинания по списку ID"""
+    return _get_by_ids(db, models_reference.ReferenceSpell, ids)
+
+
+def get_items_by_ids(db: Session, ids: List[int]) -> dict:
+    """Предметы по списку ID"""
+    return _get_by_ids(db, models_reference.ReferenceItem, ids)
+
+
+def get_creatures_by_ids(db: Session, ids: List[int]) -> dict:
+    """Существа по списку ID"""
+    return _get_by_ids(db, models_reference.ReferenceCreature, ids)
+
+
+# ============ REFERENCE BUNDLE ============
+
+def get_reference_bundle(db: Session, version: int) -> schemas_reference.ReferenceBundle:
+    """Все названия справочника с полями подсказок - для автодополнения на клиенте"""
+    spells = db.query(
+        models_reference.ReferenceSpell.id,
+        models_reference.ReferenceSpell.name,
+        models_reference.ReferenceSpell.level,
+        models_reference.ReferenceSpell.school
+    ).order_by(models_reference.ReferenceSpell.name).all()
+    
+    items = db.query(
+        models_reference.ReferenceItem.id,
+        models_reference.ReferenceItem.name,
+        models_reference.ReferenceItem.category
+    ).order_by(models_reference.ReferenceItem.name).all()
+    
+    creatures = db.query(
+        models_reference.ReferenceCreature.id,
+        models_reference.ReferenceCreature.name,
+        models_reference.ReferenceCreature.cr,
+        models_reference.ReferenceCreature.creature_type
+    ).order_by(models_reference.ReferenceCreature.name).all()
+    
+    return schemas_reference.ReferenceBundle(
+        version=version,
+        spells=[
+            schemas_reference.SpellSuggestion(
+                id=r.id, name=r.name, level=r.level, school=r.school, type='spell'
+            )
+            for r in spells
+        ],
+        items=[
+            schemas_reference.ItemSuggestion(
+                id=r.id, name=r.name, category=r.category, type='item'
+            )
+            for r in items
+        ],
+        creatures=[
+            schemas_reference.CreatureSuggestion(
+                id=r.id, name=r.name, cr=r.cr, creature_type=r.creature_type, type='creature'
+            )
+            for r in creatures
+        ]
+    )
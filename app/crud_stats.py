@@ -0,0 +1,89 @@
+# app/crud_stats.py
+# Материализованные счётчики пользователя для /me/stats.
+#
+# Вместо COUNT по campaigns и campaign_members на каждое открытие главного
+# экрана храним готовые числа в user_stats. Изменения применяются
+# инкрементом в той же транзакции, что и само изменение (без commit здесь).
+# Строки нет - инкремент пропускается: при первом чтении она будет
+# построена по актуальным данным, которые уже включают это изменение.
+
+from typing import Optional
+
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+
+_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def apply_delta(
+    db: Session,
+    user_id: Optional[int],
+    gm_campaigns: int = 0,
+    observer_campaigns: int = 0,
+    active_encounters: int = 0,
+) -> None:
+    """Изменить счётчики пользователя атомарным UPDATE (без commit)"""
+    if user_id is None:
+        return
+
+    Stats = models.UserStats
+    values = {}
+    for column, delta in (
+        (Stats.gm_campaigns, gm_campaigns),
+        (Stats.observer_campaigns, observer_campaigns),
+        (Stats.active_encounters, active_encounters),
+    ):
+        if delta:
+            values[column] = column + delta
+    if not values:
+        return
+
+    db.query(Stats).filter(Stats.user_id == user_id).update(values, synchronize_session=False)
+
+
+def _materialize(db: Session, user_id: int) -> None:
+    """Построить строку счётчиков по текущим данным одним INSERT ... SELECT"""
+    gm_campaigns = (
+        select(func.count(models.Campaign.id))
+        .where(models.Campaign.owner_id == user_id)
+        .scalar_subquery()
+    )
+    observer_campaigns = (
+        select(func.count(models.CampaignMember.id))
+        .where(
+            models.CampaignMember.user_id == user_id,
+            models.CampaignMember.role == models.MemberRole.observer,
+        )
+        .scalar_subquery()
+    )
+    active_encounters = (
+        select(func.count(models.Encounter.id))
+        .where(
+            models.Encounter.gm_id == user_id,
+            models.Encounter.status == models.EncounterStatus.active,
+        )
+        .scalar_subquery()
+    )
+
+    table = models.UserStats.__table__
+    stmt = _INSERTS[db.get_bind().dialect.name](table).from_select(
+        ["user_id", "gm_campaigns", "observer_campaigns", "active_encounters"],
+        select(literal(user_id), gm_campaigns, observer_campaigns, active_encounters),
+    ).on_conflict_do_nothing(index_elements=["user_id"])
+    db.execute(stmt)
+    db.commit()
+
+
+def get_user_stats(db: Session, user_id: int) -> models.UserStats:
+    """Счётчики пользователя: чтение по первичному ключу, при первом обращении - построение"""
+    stats = db.get(models.UserStats, user_id)
+    if stats is None:
+        _materialize(db, user_id)
+        stats = db.get(models.UserStats, user_id)
+    return stats
@@ -0,0 +1,281 @@
+# app/dice.py
+# Броски костей: разбор выражений вида 4d6kh3+2, 2d20kl1, 8d6, 1к20+5.
+#
+# Все кости одного слагаемого бросаются одним вызовом random.choices -
+# и для одного броска, и для пачки (инициатива сотни мобов, 40d6 метеоритного
+# дождя): без своего цикла и вызова randint на каждую кость, но сам
+# random.choices - тоже цикл на Python, так что время растёт с числом костей.
+# Генератор можно зафиксировать seed(...) или передать свой random.Random.
+
+import random
+import re
+from functools import lru_cache
+from math import exp, lgamma, log
+from itertools import accumulate
+from typing import Iterator, List, NamedTuple, Optional
+
+# Ограничения на выражение и на пачку бросков
+MAX_DICE = 1000  # костей в одном слагаемом
+MAX_SIDES = 1000
+MAX_TERMS = 20
+MAX_BATCH = 10000  # бросков выражения за раз
+MAX_ROLLED_DICE = 10000  # костей за вызов: все слагаемые выражения x число бросков
+
+_rng = random.Random()
+
+# Слагаемое: 4d6, d20, 4d6kh3, 2d20kl1, d%, 5
+_TERM_RE = re.compile(r"([+-])?(?:(\d*)d(\d+|%)(?:(kh|kl|k)(\d+))?|(\d+))")
+
+
+class DiceError(ValueError):
+    """Некорректное выражение броска"""
+
+
+class DiceTerm(NamedTuple):
+    count: int
+    sides: int
+    keep: Optional[int] = None  # сколько костей оставить (None - все)
+    keep_lowest: bool = False
+    sign: int = 1
+
+    @property
+    def notation(self) -> str:
+        text = f"{self.count}d{self.sides}"
+        if self.keep is not None:
+            text += f"{'kl' if self.keep_lowest else 'kh'}{self.keep}"
+        return text
+
+
+class DiceExpression:
+    """Разобранное выражение: слагаемые-кости и числовой модификатор"""
+
+    def __init__(self, terms: List[DiceTerm], modifier: int):
+        self.terms = terms
+        self.modifier = modifier
+
+    def __str__(self) -> str:
+        parts = []
+        for term in self.terms:
+            parts.append(("-" if term.sign < 0 else "+") + term.notation)
+        if self.modifier:
+            parts.append(f"{self.modifier:+d}")
+        return "".join(parts).lstrip("+") or "0"
+
+    @property
+    def dice(self) -> int:
+        """Сколько костей бросается за один бросок выражения"""
+        return sum(term.count for term in self.terms)
+
+    @property
+    def min(self) -> int:
+        return sum(term.sign * (term.keep or term.count) for term in self.terms) + self.modifier
+
+    @property
+    def max(self) -> int:
+        return sum(term.sign * (term.keep or term.count) * term.sides for term in self.terms) + self.modifier
+
+    @property
+    def average(self) -> float:
+        return sum(
+            term.sign * _expected_sum(term.count, term.sides, term.keep, term.keep_lowest)
+            for term in self.terms
+        ) + self.modifier
+
+
+@lru_cache(maxsize=1024)
+def _expected_sum(n: int, sides: int, keep: Optional[int], keep_lowest: bool) -> float:
+    """Матожидание суммы слагаемого, с учётом kh/kl (считается один раз на слагаемое)"""
+    if keep is None:
+        return n * (sides + 1) / 2
+
+    # E[сумма] = сумма по x от E[число оставленных костей со значением >= x];
+    # число костей >= x - биномиальное B. Оставленных из них min(B, keep) для kh
+    # и (B - (n - keep))+ для kl, а min(B, keep) = B - (B - keep)+
+    expected = float(keep)  # все оставленные кости >= 1
+    for x in range(2, sides + 1):
+        p = (sides - x + 1) / sides
+        if keep_lowest:
+            expected += _binomial_excess(n, p, n - keep)
+        else:
+            expected += n * p - _binomial_excess(n, p, keep)
+    return expected
+
+
+def _binomial_excess(n: int, p: float, c: int) -> float:
+    """
+    E[(B - c)+] для B ~ Bin(n, p), 0 < p < 1. Суммируется только хвост от c
+    в сторону от среднего, пока вероятности не станут пренебрежимо малы:
+    O(ширина распределения), а не O(n) на каждое значение грани.
+    """
+    q = 1 - p
+    mean = n * p
+    log_norm = lgamma(n + 1)
+
+    def pmf(m: int) -> float:
+        return exp(log_norm - lgamma(m + 1) - lgamma(n - m + 1) + m * log(p) + (n - m) * log(q))
+
+    total = 0.0
+    if c >= mean:
+        # Хвост справа: сумма (m - c) P(B = m) по m > c
+        m = c + 1
+        probability = pmf(m) if m <= n else 0.0
+        while probability > _NEGLIGIBLE:
+            total += (m - c) * probability
+            if m == n:
+                break
+            probability *= (n - m) / (m + 1) * p / q
+            m += 1
+        return total
+
+    # Хвост слева: E[(B - c)+] = E[B] - c + E[(c - B)+]
+    m = c - 1
+    probability = pmf(m) if m >= 0 else 0.0
+    while probability > _NEGLIGIBLE:
+        total += (c - m) * probability
+        if m == 0:
+            break
+        probability *= m / (n - m + 1) * q / p
+        m -= 1
+    return mean - c + total
+
+
+# Вероятность, дальше которой хвост биномиального распределения не суммируется
+_NEGLIGIBLE = 1e-18
+
+
+@lru_cache(maxsize=1024)
+def parse(expression: str) -> DiceExpression:
+    """Разобрать выражение. Русская "к" (1к20, 20к10 + 80) понимается как d."""
+    text = re.sub(r"\s*([+-])\s*", r"\1", expression.strip().lower())
+    text = text.replace("к", "d").replace("д", "d")
+    if not text:
+        raise DiceError("Пустое выражение")
+
+    terms: List[DiceTerm] = []
+    modifier = 0
+    pos = 0
+    while pos < len(text):
+        match = _TERM_RE.match(text, pos)
+        if not match or match.end() == pos or (pos > 0 and not match.group(1)):
+            raise DiceError(f"Не удалось разобрать бросок: {expression}")
+        pos = match.end()
+
+        sign = -1 if match.group(1) == "-" else 1
+        if match.group(6) is not None:
+            modifier += sign * int(match.group(6))
+            continue
+
+        count = int(match.group(2)) if match.group(2) else 1
+        sides = 100 if match.group(3) == "%" else int(match.group(3))
+        if not 1 <= count <= MAX_DICE:
+            raise DiceError(f"Костей в слагаемом должно быть от 1 до {MAX_DICE}")
+        if not 1 <= sides <= MAX_SIDES:
+            raise DiceError(f"Граней должно быть от 1 до {MAX_SIDES}")
+
+        keep = None
+        keep_lowest = False
+        if match.group(4):
+            keep = int(match.group(5))
+            keep_lowest = match.group(4) == "kl"
+            if not 1 <= keep <= count:
+                raise DiceError(f"Нельзя оставить {keep} из {count} костей")
+            if keep == count:
+                keep = None
+        terms.append(DiceTerm(count, sides, keep, keep_lowest, sign))
+
+    if len(terms) > MAX_TERMS:
+        raise DiceError(f"Слишком много слагаемых (максимум {MAX_TERMS})")
+    expr = DiceExpression(terms, modifier)
+    if expr.dice > MAX_ROLLED_DICE:
+        raise DiceError(f"Слишком много костей (максимум {MAX_ROLLED_DICE})")
+    return expr
+
+
+def seed(value) -> None:
+    """Зафиксировать генератор модуля (для тестов и воспроизводимых бросков)"""
+    _rng.seed(value)
+
+
+def roll_dice(count: int, sides: int, rng: Optional[random.Random] = None) -> List[int]:
+    """count костей с sides гранями - одним вызовом"""
+    return (rng or _rng).choices(range(1, sides + 1), k=count)
+
+
+class TermRoll(NamedTuple):
+    term: DiceTerm
+    values: List[int]  # все выпавшие кости
+    kept: List[int]  # учтённые в сумме (после kh/kl)
+    subtotal: int  # со знаком слагаемого
+
+
+class RollResult(NamedTuple):
+    total: int
+    terms: List[TermRoll]
+    modifier: int
+
+
+def _keep(values: List[int], term: DiceTerm) -> List[int]:
+    if term.keep is None:
+        return values
+    return sorted(values, reverse=not term.keep_lowest)[:term.keep]
+
+
+def _check_batch(expr: DiceExpression, times: int):
+    if not 1 <= times <= MAX_BATCH:
+        raise DiceError(f"Бросков за раз должно быть от 1 до {MAX_BATCH}")
+    if expr.dice * times > MAX_ROLLED_DICE:
+        raise DiceError(f"Слишком много костей за раз (максимум {MAX_ROLLED_DICE})")
+
+
+def roll_detailed(expression: str, times: int = 1, rng: Optional[random.Random] = None) -> List[RollResult]:
+    """Бросить выражение times раз, с выпавшими костями каждого броска"""
+    expr = parse(expression)
+    _check_batch(expr, times)
+
+    # Кости каждого слагаемого для всех бросков - одним вызовом
+    per_term = [roll_dice(term.count * times, term.sides, rng) for term in expr.terms]
+
+    results = []
+    for i in range(times):
+        term_rolls = []
+        total = expr.modifier
+        for term, values in zip(expr.terms, per_term):
+            chunk = values[i * term.count:(i + 1) * term.count]
+            kept = _keep(chunk, term)
+            subtotal = term.sign * sum(kept)
+            total += subtotal
+            term_rolls.append(TermRoll(term, chunk, kept, subtotal))
+        results.append(RollResult(total, term_rolls, expr.modifier))
+    return results
+
+
+def roll(expression: str, rng: Optional[random.Random] = None) -> RollResult:
+    return roll_detailed(expression, 1, rng)[0]
+
+
+def roll_many(expression: str, times: int, rng: Optional[random.Random] = None) -> List[int]:
+    """Только суммы times бросков выражения (без разбора по костям)"""
+    expr = parse(expression)
+    _check_batch(expr, times)
+
+    totals = [expr.modifier] * times
+    for term in expr.terms:
+        values = roll_dice(term.count * times, term.sides, rng)
+        if term.count == 1:
+            sums = values
+        elif term.keep is None:
+            # Суммы кусков по count костей через накопленную сумму
+            prefix = [0, *accumulate(values)]
+            sums = [prefix[(i + 1) * term.count] - prefix[i * term.count] for i in range(times)]
+        else:
+            sums = [
+                sum(_keep(values[i * term.count:(i + 1) * term.count], term))
+                for i in range(times)
+            ]
+        totals = [total + term.sign * value for total, value in zip(totals, sums)]
+    return totals
+
+
+def initiative_rolls(count: int, rng: Optional[random.Random] = None) -> Iterator[int]:
+    """count бросков d20 заранее - для выдачи по одному в цикле добавления участников"""
+    return iter(roll_dice(count, 20, rng)) if count else iter(())
@@ -0,0 +1,481 @@
+# app/ingest/pipeline.py
+"""
+Конвейер загрузки справочника с next.dnd.su.
+
+Стадии: discovery -> fetch -> parse -> validate -> upsert. Между стадиями -
+ограниченные asyncio.Queue: если медленная стадия не успевает, очередь перед
+ней заполняется и предыдущие стадии ждут (backpressure), а не копят страницы
+в памяти.
+
+Один и тот же конвейер загружает заклинания, предметы и существ - отличия
+собраны в KINDS.
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .. import crud_reference, models_reference
+from ..parsers.dndsu_extract import extract_creature, extract_item, extract_spell
+from ..parsers.dndsu_parser import NOT_MODIFIED, DndSuParser
+from ..parsers.http_cache import CachedPage
+from .sink import NEW, UNCHANGED, ReferenceSink
+from .state import CrawlState
+
+# Цель обхода: (external_id, slug)
+Target = Tuple[int, str]
+
+# Конец потока в очереди: каждая стадия передаёт его следующей
+_DONE = object()
+
+# Попыток загрузить страницу списка (сетевые ошибки, 5xx после повторов парсера)
+LISTING_ATTEMPTS = 3
+LISTING_RETRY_SECONDS = 5.0
+
+
+def _validate_spell(record: dict) -> Optional[str]:
+    if not record.get("name"):
+        return "нет названия"
+    if record.get("level") is None:
+        return "нет уровня"
+    return None
+
+
+def _validate_named(record: dict) -> Optional[str]:
+    if not record.get("name"):
+        return "нет названия"
+    return None
+
+
+class KindSpec:
+    """Что и как загружать для одного вида записей"""
+
+    def __init__(self, title: str, model, extractor: Callable, validate: Callable[[dict], Optional[str]]):
+        self.title = title
+        self.model = model
+        self.extractor = extractor
+        self.validate = validate
+
+
+KINDS: Dict[str, KindSpec] = {
+    "spells": KindSpec("заклинания", models_reference.ReferenceSpell, extract_spell, _validate_spell),
+    "items": KindSpec("предметы", models_reference.ReferenceItem, extract_item, _validate_named),
+    "creatures": KindSpec("существа", models_reference.ReferenceCreature, extract_creature, _validate_named),
+}
+
+
+async def listing_targets(
+    parser: DndSuParser,
+    kind: str,
+    max_pages: Optional[int] = None,
+    start_page: int = 1,
+    on_page: Optional[Callable[[int], None]] = None
+) -> AsyncIterator[Target]:
+    """
+    Записи со страниц списка раздела: ?page=1, 2, ... пока страницы дают новые ссылки.
+    Список кончается на странице, которой нет (404), пустой или повторяющей предыдущие.
+    Запрашиваются только существующие страницы записей.
+    on_page(page) вызывается, когда все записи страницы переданы дальше (отметка для --resume).
+    Страница, которую не удалось загрузить за LISTING_ATTEMPTS попыток, - исключение.
+    """
+    seen = set()
+    page = start_page
+    while max_pages is None or page <= max_pages:
+        for attempt in range(1, LISTING_ATTEMPTS + 1):
+            try:
+                entries = await parser.get_listing(kind, page)
+                break
+            except Exception as e:
+                if attempt == LISTING_ATTEMPTS:
+                    raise
+                delay = LISTING_RETRY_SECONDS * 2 ** (attempt - 1)
+                print(f"  ⚠️  Страница списка {page}: {e} - повтор через {delay:.0f} сек")
+                await asyncio.sleep(delay)
+        if entries is None:
+            print(f"📄 Страницы {page} нет - список закончился")
+            break
+        if not entries:
+            print(f"📄 Страница {page} пустая - список закончился")
+            break
+        new_entries = [entry for entry in entries if entry["external_id"] not in seen]
+        if not new_entries:
+            # Все ссылки уже были на предыдущих страницах - дальше сайт повторяется
+            print(f"📄 Страница {page} повторяет предыдущие - список закончился")
+            break
+
+        print(f"📄 Страница списка {page}: +{len(new_entries)}")
+        for entry in new_entries:
+            seen.add(entry["external_id"])
+            yield entry["external_id"], entry["slug"]
+        if on_page:
+            on_page(page)
+        page += 1
+
+
+async def sitemap_targets(parser: DndSuParser, kind: str) -> AsyncIterator[Target]:
+    """Записи раздела из sitemap.xml"""
+    entries = await parser.get_sitemap_entries(kind)
+    print(f"🗺️  В sitemap найдено: {len(entries)}")
+    for entry in entries:
+        yield entry["external_id"], entry["slug"]
+
+
+async def range_targets(start_id: int, end_id: int) -> AsyncIterator[Target]:
+    """
+    Перебор ID подряд (сайт сам редиректит с ID на страницу записи).
+    Запасной вариант, если списки недоступны: большинство ID в диапазоне - 404.
+    """
+    for external_id in range(start_id, end_id + 1):
+        yield external_id, str(external_id)
+
+
+DISCOVERY_MODES = ("listing", "sitemap", "range")
+
+
+class PipelineStats:
+    """Счётчики и время работы стадий конвейера"""
+
+    COUNTERS = (
+        "discovered", "fetched", "unchanged", "identical", "not_found", "errors", "retried", "failed",
+        "parsed", "invalid", "created", "updated",
+    )
+
+    def __init__(self):
+        self.counters = {name: 0 for name in self.COUNTERS}
+        self.stage_time: Dict[str, float] = {}
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        # Почему не удалось пройти списки до конца (None - поиск записей завершён)
+        self.discovery_error: Optional[str] = None
+
+    def add(self, counter: str, value: int = 1):
+        self.counters[counter] += value
+
+    def add_time(self, stage: str, seconds: float):
+        self.stage_time[stage] = self.stage_time.get(stage, 0.0) + seconds
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.started
+
+    @property
+    def changed(self) -> int:
+        return self.counters["created"] + self.counters["updated"]
+
+    def progress(self) -> str:
+        c = self.counters
+        return (f"найдено {c['discovered']}, скачано {c['fetched']}, 304 {c['unchanged']}, "
+                f"без изменений {c['identical']}, 404 {c['not_found']}, записано {self.changed}")
+
+    def report(self, parser: Optional[DndSuParser] = None) -> str:
+        c = self.counters
+        elapsed = self.elapsed
+        lines = [
+            "=" * 60,
+            f"✅ Загружено новых: {c['created']}",
+            f"🔄 Обновлено: {c['updated']}",
+            f"💤 Без изменений: {c['unchanged'] + c['identical']} "
+            f"(304: {c['unchanged']}, совпал хэш: {c['identical']})",
+            f"⚠️  Пропущено (невалидные): {c['invalid']}",
+            f"❌ Не найдено (404): {c['not_found']}",
+            f"💥 Ошибки загрузки: {c['errors']}, повторов: {c['retried']}, "
+            f"не удалось загрузить: {c['failed']}",
+            f"📊 Проверено: {c['discovered']}",
+            f"⏱️  Время: {elapsed:.1f} сек, {c['discovered'] / elapsed if elapsed else 0:.2f} записей/сек",
+        ]
+        if self.discovery_error:
+            lines.append(f"🚧 Поиск записей не завершён: {self.discovery_error} "
+                         f"(продолжить: --resume)")
+        if self.stage_time:
+            lines.append("🧩 Время стадий: " + ", ".join(
+                f"{stage} {seconds:.2f}с" for stage, seconds in self.stage_time.items()
+            ))
+        if parser is not None:
+            requests_made = parser.stats["requests"]
+            avg_request = parser.stats["request_time"] / requests_made if requests_made else 0.0
+            lines.append(
+                f"🌐 Запросов: {requests_made}, из них 429/503: {parser.stats['throttled']}, "
+                f"среднее время ответа: {avg_request:.2f} сек, "
+                f"получено по сети {parser.stats['bytes'] / 1024:.1f} КБ (сжатыми)"
+            )
+        lines.append("=" * 60)
+        return "\n".join(lines)
+
+
+class IngestPipeline:
+    """Конвейер загрузки одного вида записей справочника"""
+
+    PROGRESS_EVERY = 50
+
+    def __init__(
+        self,
+        kind: str,
+        parser: DndSuParser,
+        db: Session,
+        fetch_workers: int = 4,
+        parse_workers: int = 1,
+        batch_size: int = 100,
+        limit: Optional[int] = None,
+        conditional: bool = False,
+        verbose: bool = True,
+        state: Optional[CrawlState] = None,
+    ):
+        """
+        Args:
+            kind: spells | items | creatures
+            parser: Парсер сайта (лимиты запросов, кэш, воспроизведение)
+            db: Сессия БД - используется только стадией upsert
+            fetch_workers: Параллельных загрузчиков страниц
+            parse_workers: Параллельных разборщиков (имеет смысл с пулом процессов парсера)
+            batch_size: Сколько записей писать в БД одним запросом
+            limit: Остановиться после стольких новых/обновлённых записей
+            conditional: Условные запросы для уже загруженных записей (нужен HTTP-кэш)
+            verbose: Печатать каждую записанную запись
+            state: Состояние обхода на диске - для повторов и продолжения (--resume)
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Неизвестный вид справочника: {kind}")
+
+        self.kind = kind
+        self.spec = KINDS[kind]
+        self.parser = parser
+        self.db = db
+        self.fetch_workers = max(1, fetch_workers)
+        self.parse_workers = max(1, parse_workers)
+        self.limit = limit
+        self.conditional = conditional
+        self.verbose = verbose
+        self.state = state
+        self.sink = ReferenceSink(db, self.spec.model, batch_size=batch_size)
+        self.stats = PipelineStats()
+        # Валидаторы скачанных страниц, чьи записи ещё не в БД: в HTTP-кэш они
+        # попадают только после commit, иначе изменения потерялись бы за 304
+        self._validators: Dict[int, CachedPage] = {}
+
+    # ----- состояние обхода -----
+
+    def _done(self, *external_ids: int):
+        if self.state:
+            self.state.mark_done(external_ids)
+
+    def _saved(self, *external_ids: int):
+        """Записи совпадают с БД: теперь их страницы можно перепроверять условным запросом"""
+        for external_id in external_ids:
+            self.parser.remember(self._validators.pop(external_id, None))
+        self._done(*external_ids)
+
+    def _failed(self, external_id: int, error: str, retry: bool = True):
+        """Неудачная загрузка: в очередь повторов, пока не кончатся попытки"""
+        self.stats.add("errors")
+        delay = self.state.mark_failed(external_id, error, retry=retry) if self.state else None
+        if delay is None:
+            self.stats.add("failed")
+            print(f"  ❌ [{external_id}] {error}")
+        else:
+            print(f"  ⚠️  [{external_id}] {error} - повтор через {delay:.0f} сек")
+
+    # ----- стадии -----
+
+    async def _discover(self, targets: Optional[AsyncIterator[Target]], requeue: List[Target]):
+        # Записи из очереди повторов и прерванного запуска - первыми
+        for target in requeue:
+            await self._to_fetch.put(target)
+
+        if targets is not None:
+            try:
+                async for external_id, slug in targets:
+                    # Уже известные записи (повтор в списках, продолжение обхода) пропускаем
+                    if self.state and not self.state.add(external_id, slug):
+                        continue
+                    self.stats.add("discovered")
+                    await self._to_fetch.put((external_id, slug))
+            except Exception as e:
+                # Найденные записи догружаются, но обход списков не завершён:
+                # --resume продолжит его с последней пройденной страницы
+                self.stats.discovery_error = str(e)
+                print(f"  ❌ Поиск записей прерван: {e}")
+            else:
+                if self.state:
+                    self.state.set_meta("discovery_complete", 1)
+
+        await self._to_fetch.put(_DONE)
+
+    async def _fetch(self, target: Target):
+        external_id, slug = target
+        url = self.parser.entry_url(self.kind, external_id, slug)
+        conditional = self.conditional and external_id in self.sink.known
+        try:
+            html, validators = await self.parser.fetch_entry(url, conditional=conditional)
+        except Exception as e:
+            self._failed(external_id, f"{url}: {e}")
+            return None
+
+        if html is NOT_MODIFIED:
+            # Страница не менялась - не разбираем и не пишем в БД
+            self.stats.add("unchanged")
+            self._done(external_id)
+            return None
+        if html is None:
+            self.stats.add("not_found")
+            self._done(external_id)
+            return None
+
+        self.stats.add("fetched")
+        if validators is not None:
+            self._validators[external_id] = validators
+        return external_id, slug, url, html
+
+    async def _parse(self, page):
+        external_id, slug, url, html = page
+        try:
+            record = await self.parser.extract(self.spec.extractor, html, external_id, slug, url)
+        except Exception as e:
+            # Та же страница разберётся так же - повторять бессмысленно
+            self._validators.pop(external_id, None)
+            self._failed(external_id, f"ошибка разбора: {e}", retry=False)
+            return None
+        self.stats.add("parsed")
+        return record
+
+    async def _validate(self, record: dict):
+        problem = self.spec.validate(record)
+        if problem:
+            self.stats.add("invalid")
+            print(f"  ⚠️  [{record['external_id']}] {record.get('name') or '?'} - пропущено ({problem})")
+            self._validators.pop(record["external_id"], None)
+            self._done(record["external_id"])
+            return None
+        return record
+
+    async def _upsert(self) -> bool:
+        """Запись в БД; True - остановились по лимиту"""
+        reached_limit = False
+        while True:
+            record = await self._to_upsert.get()
+            if record is _DONE:
+                break
+
+            started = time.perf_counter()
+            status = self.sink.check(record)
+            if status == UNCHANGED:
+                # Содержимое не изменилось - не трогаем запись (и updated_at)
+                self.stats.add_time("upsert", time.perf_counter() - started)
+                self.stats.add("identical")
+                self._saved(record["external_id"])
+                continue
+
+            is_update = status != NEW
+            # Готовыми записи считаются только после commit их пачки
+            self._saved(*self.sink.add(record))
+            self.stats.add_time("upsert", time.perf_counter() - started)
+
+            self.stats.add("updated" if is_update else "created")
+            if self.verbose:
+                mark = "🔄" if is_update else "✅"
+                print(f"{mark} [{record['external_id']}] {record['name']}")
+            elif self.stats.changed % self.PROGRESS_EVERY == 0:
+                print(f"... {self.stats.progress()}")
+
+            if self.limit and self.stats.changed >= self.limit:
+                print(f"\n✅ Достигнут лимит: {self.limit}")
+                reached_limit = True
+                break
+
+        started = time.perf_counter()
+        self._saved(*self.sink.flush())
+        self.stats.add_time("upsert", time.perf_counter() - started)
+        return reached_limit
+
+    async def _stage(self, name: str, inbox: asyncio.Queue, outbox: asyncio.Queue, handle, workers: int):
+        """Несколько обработчиков между двумя очередями; None от обработчика - запись отброшена"""
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    # Возвращаем маркер конца для остальных обработчиков стадии
+                    await inbox.put(_DONE)
+                    return
+                started = time.perf_counter()
+                result = await handle(item)
+                self.stats.add_time(name, time.perf_counter() - started)
+                if result is not None:
+                    await outbox.put(result)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        await outbox.put(_DONE)
+
+    # ----- запуск -----
+
+    async def run(self, targets: AsyncIterator[Target], resume: bool = False) -> PipelineStats:
+        """
+        Прогнать конвейер по целям обхода, затем - по очереди повторов.
+        С resume=True продолжает прерванный запуск по сохранённому состоянию.
+        После изменений - новая версия справочника.
+        """
+        requeue: List[Target] = []
+        if self.state and resume:
+            requeue = self.state.unfinished()
+            print(f"⏯️  Продолжаем обход: в очереди {len(requeue)}, готово {self.state.counts().get('done', 0)}")
+            if self.state.get_meta("discovery_complete"):
+                targets = None
+        elif self.state:
+            self.state.reset()
+
+        try:
+            stopped = await self._run_round(targets, requeue)
+
+            # Очередь повторов: ждём ближайший срок, пока есть записи с попытками
+            while self.state and not stopped:
+                due, wait = self.state.retry_queue()
+                if not due:
+                    if wait is None:
+                        break
+                    print(f"🔁 Повторы через {wait:.1f} сек")
+                    await asyncio.sleep(wait)
+                    continue
+                self.stats.add("retried", len(due))
+                stopped = await self._run_round(None, due)
+        finally:
+            self.stats.finished = time.perf_counter()
+
+        # Новая версия набора данных сбрасывает кэши справочника (ETag, ответы API)
+        if self.sink.changed:
+            version = crud_reference.bump_dataset_version(self.db)
+            print(f"\n🏷️  Версия справочника: {version}")
+
+        return self.stats
+
+    async def _run_round(self, targets: Optional[AsyncIterator[Target]], requeue: List[Target]) -> bool:
+        """Один проход конвейера; True - остановились по лимиту"""
+        # Ограниченные очереди между стадиями
+        depth = self.fetch_workers * 2
+        self._to_fetch: asyncio.Queue = asyncio.Queue(maxsize=depth)
+        self._to_parse: asyncio.Queue = asyncio.Queue(maxsize=depth)
+        self._to_validate: asyncio.Queue = asyncio.Queue(maxsize=depth)
+        self._to_upsert: asyncio.Queue = asyncio.Queue(maxsize=depth)
+
+        tasks = [
+            asyncio.create_task(self._discover(targets, requeue)),
+            asyncio.create_task(self._stage("fetch", self._to_fetch, self._to_parse, self._fetch, self.fetch_workers)),
+            asyncio.create_task(self._stage("parse", self._to_parse, self._to_validate, self._parse, self.parse_workers)),
+            asyncio.create_task(self._stage("validate", self._to_validate, self._to_upsert, self._validate, 1)),
+        ]
+        upsert = asyncio.create_task(self._upsert())
+        pending = set(tasks) | {upsert}
+
+        try:
+            # Ждём запись в БД; ошибка любой стадии прерывает конвейер
+            while upsert in pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+        finally:
+            # Остановка по лимиту или ошибке: остальные стадии больше не нужны
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        return upsert.result()
@@ -0,0 +1,117 @@
+# app/ingest/sink.py
+"""
+Пакетная запись справочника в БД.
+
+Вместо get_*_by_external_id + create/update с commit на каждую запись:
+известные external_id загружаются одним запросом, записи копятся в буфере
+и пишутся пачками через INSERT ... ON CONFLICT(external_id) DO UPDATE
+(SQLite и PostgreSQL), один commit на пачку.
+
+Запись, у которой хэш содержимого совпал с сохранённым, не пишется вовсе:
+updated_at и версия справочника не меняются, кэши остаются тёплыми.
+"""
+
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .. import crud_reference, models_reference
+
+# Результат сравнения записи с БД
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+class ReferenceSink:
+    """Буферизованный upsert записей справочника по external_id"""
+
+    def __init__(self, db: Session, model, batch_size: int = 100):
+        dialect = db.get_bind().dialect.name
+        if dialect not in _INSERTS:
+            raise ValueError(f"Пакетная запись не поддерживается для {dialect}")
+
+        self.db = db
+        self.model = model
+        self.batch_size = batch_size
+        self._insert = _INSERTS[dialect]
+        self._columns = {c.name for c in model.__table__.columns} - {"id"}
+
+        # Все уже загруженные external_id и хэши их содержимого - одним запросом
+        self.known = crud_reference.get_content_hashes(db, model)
+
+        # external_id -> запись; повтор в одной пачке перезаписывает предыдущую
+        self._buffer: Dict[int, dict] = {}
+        self.stats = {"created": 0, "updated": 0, "batches": 0}
+
+    def check(self, record: dict) -> str:
+        """Сравнить запись с БД по хэшу содержимого (хэш сохраняется в record)"""
+        digest = crud_reference.content_hash(self.model, record)
+        record["content_hash"] = digest
+
+        external_id = record["external_id"]
+        if external_id not in self.known:
+            return NEW
+        if self.known[external_id] == digest:
+            return UNCHANGED
+        return CHANGED
+
+    def add(self, record: dict) -> List[int]:
+        """
+        Добавить запись; при заполнении буфера пачка уходит в БД.
+        Возвращает external_id записанных записей (пусто, если пачка ещё копится).
+        """
+        self._buffer[record["external_id"]] = record
+        if len(self._buffer) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self) -> List[int]:
+        """Записать накопленные записи одним запросом и одним commit; вернуть их external_id"""
+        if not self._buffer:
+            return []
+
+        now = datetime.utcnow()
+        rows: List[dict] = []
+        for record in self._buffer.values():
+            row = {key: value for key, value in record.items() if key in self._columns}
+            row["updated_at"] = now
+            rows.append(row)
+
+        # У всех строк пачки должен быть одинаковый набор колонок
+        keys = set().union(*(row.keys() for row in rows))
+        rows = [{key: row.get(key) for key in keys} for row in rows]
+
+        stmt = self._insert(self.model.__table__).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["external_id"],
+            set_={key: stmt.excluded[key] for key in keys if key != "external_id"},
+        )
+        self.db.execute(stmt)
+
+        external_ids = list(self._buffer)
+        if self.model is models_reference.ReferenceSpell:
+            crud_reference.sync_spell_classes_by_external_ids(self.db, external_ids)
+
+        self.db.commit()
+
+        for external_id, record in self._buffer.items():
+            if external_id in self.known:
+                self.stats["updated"] += 1
+            else:
+                self.stats["created"] += 1
+            self.known[external_id] = record.get("content_hash")
+        self.stats["batches"] += 1
+        self._buffer.clear()
+        return external_ids
+
+    @property
+    def changed(self) -> int:
+        return self.stats["created"] + self.stats["updated"]
@@ -0,0 +1,182 @@
+# app/ingest/state.py
+"""
+Состояние обхода справочника на диске.
+
+Для каждой записи (вид справочника + external_id) хранится статус:
+pending - найдена, но ещё не обработана; done - записана в БД или
+обработана без записи (304, 404, невалидная); failed - загрузка не
+удалась, запись ждёт повтора до next_attempt_at.
+
+Отдельный небольшой SQLite-файл (stdlib sqlite3), а не таблица основной БД:
+состояние нужно только загрузчикам и удаляется вместе с кэшем.
+"""
+
+import random
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawl_targets (
+    kind TEXT NOT NULL,
+    external_id INTEGER NOT NULL,
+    slug TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (kind, external_id)
+);
+CREATE INDEX IF NOT EXISTS idx_crawl_status ON crawl_targets (kind, status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS crawl_meta (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (kind, key)
+);
+"""
+
+
+class CrawlState:
+    """Статусы записей одного вида справочника и очередь повторов"""
+
+    BACKOFF_BASE = 5.0
+    BACKOFF_MAX = 300.0
+
+    def __init__(self, path: str, kind: str, max_attempts: int = 4):
+        """
+        Args:
+            path: Файл состояния (создаётся при первом обращении)
+            kind: spells | items | creatures
+            max_attempts: Сколько раз пробовать загрузить запись, прежде чем сдаться
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.kind = kind
+        self.max_attempts = max_attempts
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def reset(self):
+        """Начать обход заново: забыть статусы и отметки прошлого запуска"""
+        with self._conn:
+            self._conn.execute("DELETE FROM crawl_targets WHERE kind = ?", (self.kind,))
+            self._conn.execute("DELETE FROM crawl_meta WHERE kind = ?", (self.kind,))
+
+    # ----- отметки обхода -----
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT value FROM crawl_meta WHERE kind = ? AND key = ?", (self.kind, key)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value):
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO crawl_meta (kind, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (kind, key) DO UPDATE SET value = excluded.value",
+                (self.kind, key, str(value)),
+            )
+
+    # ----- записи -----
+
+    def add(self, external_id: int, slug: str) -> bool:
+        """Отметить найденную запись как pending; False, если она уже известна"""
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO crawl_targets (kind, external_id, slug, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.kind, external_id, slug, PENDING, time.time()),
+            )
+        return cursor.rowcount > 0
+
+    def mark_done(self, external_ids: Iterable[int]):
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE crawl_targets SET status = ?, last_error = NULL, updated_at = ? "
+                "WHERE kind = ? AND external_id = ?",
+                [(DONE, now, self.kind, external_id) for external_id in external_ids],
+            )
+
+    def mark_failed(self, external_id: int, error: str, retry: bool = True) -> Optional[float]:
+        """
+        Отметить неудачную загрузку. Возвращает задержку до повтора (сек)
+        или None, если попытки кончились.
+        """
+        row = self._conn.execute(
+            "SELECT attempts FROM crawl_targets WHERE kind = ? AND external_id = ?",
+            (self.kind, external_id),
+        ).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        if not retry:
+            attempts = max(attempts, self.max_attempts)
+
+        delay = None
+        next_attempt_at = 0.0
+        if attempts < self.max_attempts:
+            delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** (attempts - 1))
+            delay *= random.uniform(0.8, 1.2)
+            next_attempt_at = time.time() + delay
+
+        with self._conn:
+            self._conn.execute(
+                "UPDATE crawl_targets SET status = ?, attempts = ?, next_attempt_at = ?, "
+                "last_error = ?, updated_at = ? WHERE kind = ? AND external_id = ?",
+                (FAILED, attempts, next_attempt_at, error[:500], time.time(), self.kind, external_id),
+            )
+        return delay
+
+    def unfinished(self) -> List[Tuple[int, str]]:
+        """Записи, на которых прервался прошлый запуск: pending и failed с оставшимися попытками"""
+        rows = self._conn.execute(
+            "SELECT external_id, slug FROM crawl_targets "
+            "WHERE kind = ? AND (status = ? OR (status = ? AND attempts < ?)) "
+            "ORDER BY external_id",
+            (self.kind, PENDING, FAILED, self.max_attempts),
+        ).fetchall()
+        return [(external_id, slug) for external_id, slug in rows]
+
+    def retry_queue(self) -> Tuple[List[Tuple[int, str]], Optional[float]]:
+        """
+        Повторы: записи, которым уже пора, и через сколько секунд
+        наступит ближайший следующий повтор (None - повторов больше нет).
+        """
+        now = time.time()
+        rows = self._conn.execute(
+            "SELECT external_id, slug, next_attempt_at FROM crawl_targets "
+            "WHERE kind = ? AND status = ? AND attempts < ? ORDER BY next_attempt_at",
+            (self.kind, FAILED, self.max_attempts),
+        ).fetchall()
+
+        due = [(external_id, slug) for external_id, slug, at in rows if at <= now]
+        later = [at for _, _, at in rows if at > now]
+        wait = (min(later) - now) if later else None
+        return due, wait
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn.execute(
+            "SELECT status, COUNT(*) FROM crawl_targets WHERE kind = ? GROUP BY status",
+            (self.kind,),
+        ).fetchall()
+        return {status: count for status, count in rows}
+
+    def gave_up(self) -> int:
+        """Сколько записей так и не удалось загрузить"""
+        row = self._conn.execute(
+            "SELECT COUNT(*) FROM crawl_targets WHERE kind = ? AND status = ? AND attempts >= ?",
+            (self.kind, FAILED, self.max_attempts),
+        ).fetchone()
+        return row[0]
@@ -0,0 +1,111 @@
+# app/invite_cache.py
+# Кэш проверки инвайт-токенов и фоновая чистка таблицы инвайтов.
+#
+# GET /campaigns/invite/{token} открыт без авторизации: его дёргают превью
+# ссылок в мессенджерах и каждая загрузка join.html. Результат проверки
+# (кампания + валидность) держим в памяти, неизвестные токены - тоже
+# (negative caching), чтобы перебор случайных токенов не ходил в БД.
+# Само вступление всегда проверяется в БД (join_campaign_by_invite).
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from . import crud_multiplayer
+from .database import SessionLocal
+
+# Сколько держать результат проверки существующего и неизвестного токена
+POSITIVE_TTL_SECONDS = 30.0
+NEGATIVE_TTL_SECONDS = 60.0
+
+# Максимальное количество токенов в кэше
+MAX_ENTRIES = 4096
+
+# Как часто чистить таблицу инвайтов и через сколько дней удалять неактивные
+SWEEP_INTERVAL_SECONDS = 600.0
+PURGE_AFTER_DAYS = 30
+
+
+class InviteInfo:
+    """Результат проверки токена: кампания и ошибка валидации (None - инвайт годен)"""
+
+    __slots__ = ("campaign_id", "campaign_name", "error", "expires_at")
+
+    def __init__(self, campaign_id: int, campaign_name: str, error: Optional[str], expires_at: Optional[datetime]):
+        self.campaign_id = campaign_id
+        self.campaign_name = campaign_name
+        self.error = error
+        self.expires_at = expires_at
+
+    @property
+    def current_error(self) -> Optional[str]:
+        """Ошибка с учётом срока действия, который мог истечь уже после кэширования"""
+        if self.error is None and self.expires_at and self.expires_at < datetime.utcnow():
+            return "Срок действия приглашения истёк"
+        return self.error
+
+
+_lock = threading.Lock()
+# token -> (monotonic-время устаревания, InviteInfo или None для неизвестного токена)
+_entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def lookup(db: Session, token: str) -> Optional[InviteInfo]:
+    """Проверка токена из кэша или одним запросом к БД; None - токена нет"""
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(token)
+        if entry is not None and entry[0] > now:
+            _entries.move_to_end(token)
+            return entry[1]
+
+    row = crud_multiplayer.get_invite_with_campaign_name(db, token)
+    if row is None:
+        info = None
+        ttl = NEGATIVE_TTL_SECONDS
+    else:
+        invite, campaign_name = row
+        _, error = crud_multiplayer.validate_invite(invite)
+        info = InviteInfo(invite.campaign_id, campaign_name, error, invite.expires_at)
+        ttl = POSITIVE_TTL_SECONDS
+
+    with _lock:
+        _entries[token] = (now + ttl, info)
+        _entries.move_to_end(token)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+    return info
+
+
+def invalidate(token: str):
+    """Забыть токен (после вступления, создания или деактивации инвайта)"""
+    with _lock:
+        _entries.pop(token, None)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+def _sweep_once() -> tuple[int, int]:
+    with SessionLocal() as db:
+        return crud_multiplayer.sweep_invites(db, purge_after_days=PURGE_AFTER_DAYS)
+
+
+async def run_sweeper(interval: float = SWEEP_INTERVAL_SECONDS):
+    """Фоновая задача: периодически деактивирует истёкшие/исчерпанные инвайты и удаляет старые"""
+    while True:
+        try:
+            deactivated, purged = await asyncio.to_thread(_sweep_once)
+            if deactivated or purged:
+                clear()
+                print(f"🧹 Инвайты: деактивировано {deactivated}, удалено {purged}")
+        except Exception as e:
+            print(f"Invite sweeper error: {e}")
+        await asyncio.sleep(interval)
@@ -1,30 +1,63 @@
 # app/main.py
 from fastapi.staticfiles import StaticFiles
 from fastapi import Query
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Response
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
-from .database import engine, Base, get_db
+from .database import engine, Base, get_db, SessionLocal
 from . import models, schemas, crud
+from . import crud_reference
 from . import crud_multiplayer
+from . import crud_stats
+from . import invite_cache
+from . import reference_cache
+from . import notifications
+from . import dice
 from typing import Optional
 from typing import List
 from .deps import get_current_tg_user_id
 from sqlalchemy.orm import joinedload
 import json
+import hashlib
+import asyncio
+from contextlib import asynccontextmanager
 
 # Импортируем модели справочника для создания таблиц
 from .models_reference import ReferenceSpell, ReferenceItem, ReferenceCreature
 
-# Импортируем роутер справочника
-from .routers import reference
+# Импортируем роутеры справочника, кампаний и схваток
+from .routers import reference, campaigns, encounters
 
 
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
-
-# Подключаем роутер справочника
+# Дополняем базы, созданные до появления content_hash, индекса заклинаний по классам,
+# уникального индекса участников кампаний, привязки персонажей к игрокам
+# и индексов сводки наблюдателя
+with SessionLocal() as _db:
+    crud_reference.ensure_content_hash_columns(_db)
+    crud_reference.ensure_spell_class_index(_db)
+    crud_multiplayer.ensure_member_unique_index(_db)
+    crud_multiplayer.ensure_dashboard_indexes(_db)
+    crud.ensure_character_user_column(_db)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Фоновая чистка истёкших и исчерпанных инвайтов
+    sweeper = asyncio.create_task(invite_cache.run_sweeper())
+    # Очередь уведомлений игрокам через бота (нужен BOT_TOKEN)
+    await notifications.start()
+    yield
+    sweeper.cancel()
+    await notifications.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Подключаем роутеры справочника, кампаний и схваток
 app.include_router(reference.router)
+app.include_router(campaigns.router)
+app.include_router(encounters.router)
 
 
 @app.get("/health")
@@ -32,6 +65,58 @@ def health_check():
     return {"status": "ok"}
 
 
+@app.get("/notifications/metrics")
+def notifications_metrics(tg_user_id: int = Depends(get_current_tg_user_id)):
+    """Очередь уведомлений: глубина, отправлено/отброшено, задержка доставки"""
+    return notifications.metrics()
+
+
+# ----- DICE API -----
+
+# Бросков за один запрос (всего костей - не больше dice.MAX_ROLLED_DICE)
+MAX_DICE_ROLLS_PER_REQUEST = 100
+
+
+@app.post("/dice/roll", response_model=schemas.DiceRollResponse)
+def roll_dice(
+    data: schemas.DiceRollRequest,
+    tg_user_id: int = Depends(get_current_tg_user_id),
+):
+    """Бросить выражение (4d6kh3+2, 2d20kl1, 8d6) один или несколько раз"""
+    if not 1 <= data.times <= MAX_DICE_ROLLS_PER_REQUEST:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Бросков за раз должно быть от 1 до {MAX_DICE_ROLLS_PER_REQUEST}"
+        )
+    try:
+        expr = dice.parse(data.expression)
+        rolls = dice.roll_detailed(data.expression, data.times)
+    except dice.DiceError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return schemas.DiceRollResponse(
+        expression=str(expr),
+        min=expr.min,
+        max=expr.max,
+        average=round(expr.average, 2),
+        rolls=[
+            schemas.DiceRollResult(
+                total=r.total,
+                dice=[
+                    schemas.DiceTermRoll(
+                        notation=("-" if t.term.sign < 0 else "") + t.term.notation,
+                        values=t.values,
+                        kept=t.kept,
+                        subtotal=t.subtotal,
+                    )
+                    for t in r.terms
+                ],
+            )
+            for r in rolls
+        ],
+    )
+
+
 # ----- USER INFO API -----
 
 @app.get("/me/stats")
@@ -39,21 +124,14 @@ def get_my_stats(
     db: Session = Depends(get_db),
     tg_user_id: int = Depends(get_current_tg_user_id),
 ):
-    """Получить статистику пользователя: количество GM-кампаний и кампаний наблюдателя"""
-    # GM-кампании (где я владелец)
-    gm_campaigns = db.query(models.Campaign).filter(
-        models.Campaign.owner_id == tg_user_id
-    ).count()
-    
-    # Кампании наблюдателя
-    observer_campaigns = db.query(models.CampaignMember).filter(
-        models.CampaignMember.user_id == tg_user_id,
-        models.CampaignMember.role == models.MemberRole.observer
-    ).count()
+    """Получить статистику пользователя: количество GM-кампаний, кампаний наблюдателя и активных схваток"""
+    # Готовые счётчики - чтение по первичному ключу
+    stats = crud_stats.get_user_stats(db, tg_user_id)
     
     return {
-        "gm_campaigns_count": gm_campaigns,
-        "observer_campaigns_count": observer_campaigns
+        "gm_campaigns_count": stats.gm_campaigns,
+        "observer_campaigns_count": stats.observer_campaigns,
+        "active_encounters_count": stats.active_encounters
     }
 
 
@@ -107,6 +185,7 @@ def generate_campaign_invite(
     
     # Создаём инвайт (бессрочный, без лимита)
     invite = crud_multiplayer.create_campaign_invite(db, campaign_id)
+    invite_cache.invalidate(invite.invite_token)
     
     bot_username = "d20_bot"
     invite_url = f"https://t.me/{bot_username}?start=invite_{invite.invite_token}"
@@ -124,27 +203,20 @@ def check_campaign_invite(
     db: Session = Depends(get_db),
 ):
     """Проверить валидность инвайт-токена и получить информацию о кампании"""
-    invite = crud_multiplayer.get_invite_by_token(db, token)
+    # Инвайт вместе с кампанией - из кэша или одним запросом
+    info = invite_cache.lookup(db, token)
     
-    if not invite:
+    if not info:
         raise HTTPException(status_code=404, detail="Инвайт не найден")
     
     # Проверяем валидность
-    is_valid, error = crud_multiplayer.validate_invite(invite)
-    if not is_valid:
+    error = info.current_error
+    if error:
         raise HTTPException(status_code=400, detail=error)
     
-    # Получаем кампанию
-    campaign = db.query(models.Campaign).filter(
-        models.Campaign.id == invite.campaign_id
-    ).first()
-    
-    if not campaign:
-        raise HTTPException(status_code=404, detail="Кампания не найдена")
-    
     return {
-        "campaign_id": campaign.id,
-        "campaign_name": campaign.name,
+        "campaign_id": info.campaign_id,
+        "campaign_name": info.campaign_name,
         "valid": True
     }
 
@@ -159,6 +231,8 @@ def join_campaign(
     campaign, error = crud_multiplayer.join_campaign_by_invite(
         db, request.invite_token, tg_user_id
     )
+    # Счётчик использований изменился - следующая проверка токена пойдёт в БД
+    invite_cache.invalidate(request.invite_token)
     
     if error:
         raise HTTPException(status_code=400, detail=error)
@@ -182,6 +256,32 @@ def get_observer_campaigns(
     return campaigns
 
 
+_dashboard_adapter = TypeAdapter(List[schemas.ObserverDashboardEncounter])
+
+# Экран наблюдателя опрашивает сводку раз в несколько секунд - пусть всегда
+# перепроверяет, но без изменений получает пустой 304
+DASHBOARD_CACHE_CONTROL = "private, no-cache"
+
+
+@app.get("/campaigns/observer/dashboard", response_model=List[schemas.ObserverDashboardEncounter])
+def get_observer_dashboard(
+    if_none_match: Optional[str] = Header(default=None),
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+):
+    """
+    Активные схватки всех кампаний пользователя: раунд и чей ход.
+    Один запрос к БД; ETag по содержимому, без изменений - 304.
+    """
+    items = crud_multiplayer.get_active_encounters_dashboard(db, tg_user_id)
+    body = _dashboard_adapter.dump_json(items)
+    etag = f'"obs-{hashlib.sha1(body).hexdigest()[:20]}"'
+    headers = {"ETag": etag, "Cache-Control": DASHBOARD_CACHE_CONTROL}
+    if reference_cache.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @app.get("/campaigns/{campaign_id}/encounters/active")
 def get_active_encounters(
     campaign_id: int,
@@ -312,6 +412,44 @@ def update_character(
     return db_character
 
 
+@app.post("/characters/{character_id}/link", response_model=schemas.Character)
+def link_character(
+    character_id: int,
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+):
+    """Привязать персонажа к себе: бот будет присылать «Твой ход» (GM и наблюдатели кампании)"""
+    db_character = crud.get_character(db, character_id)
+    if db_character is None:
+        raise HTTPException(status_code=404, detail="Персонажи не найдены")
+
+    if not crud_multiplayer.has_campaign_access(db, db_character.campaign_id, tg_user_id):
+        raise HTTPException(status_code=403, detail="Нет доступа к этой кампании")
+
+    if db_character.user_id is not None and db_character.user_id != tg_user_id:
+        raise HTTPException(status_code=409, detail="Персонаж уже привязан к другому игроку")
+
+    return crud.set_character_user(db, character_id, tg_user_id)
+
+
+@app.delete("/characters/{character_id}/link", response_model=schemas.Character)
+def unlink_character(
+    character_id: int,
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+):
+    """Отвязать персонажа (сам игрок или GM)"""
+    db_character = crud.get_character(db, character_id)
+    if db_character is None:
+        raise HTTPException(status_code=404, detail="Персонажи не найдены")
+
+    if (db_character.user_id != tg_user_id
+            and not crud_multiplayer.is_campaign_gm(db, db_character.campaign_id, tg_user_id)):
+        raise HTTPException(status_code=403, detail="Отвязать может только сам игрок или GM")
+
+    return crud.set_character_user(db, character_id, None)
+
+
 @app.delete("/characters/{character_id}")
 def delete_character(
     character_id: int,
@@ -371,11 +509,11 @@ def add_participants_to_active(
     Добавить новых участников в активную схватку (во время боя).
     Новые участники автоматически получают инициативу и встают в порядок ходов.
     """
-    encounter = crud.add_participants_to_active_encounter(
+    encounter, error = crud.add_participants_to_active_encounter(
         db, encounter_id, participants_data
     )
     if encounter is None:
-        raise HTTPException(status_code=404, detail="Encounter not found")
+        raise HTTPException(status_code=404, detail=error)
     return {"status": "ok", "message": "Участники добавлены"}
 
 
@@ -1,5 +1,5 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Enum, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Enum, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy import Text
 from .database import Base
@@ -40,6 +40,10 @@ class Campaign(Base):
 
 class CampaignMember(Base):
     __tablename__ = "campaign_members"
+    __table_args__ = (
+        # Одно членство на пользователя: защищает вступление по инвайту от гонок
+        Index("uq_campaign_member", "campaign_id", "user_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=False, index=True)
@@ -73,6 +77,7 @@ class Character(Base):
     name = Column(String, nullable=False)
     ac = Column(Integer, nullable=False)
     base_initiative = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=True, index=True)  # tg id игрока, которому приходят уведомления о ходе
 
     campaign = relationship("Campaign", back_populates="characters")
 
@@ -84,7 +89,7 @@ class Encounter(Base):
     campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=False)
     name = Column(String, nullable=True)
     status = Column(Enum(EncounterStatus), nullable=False,
-                    default=EncounterStatus.draft)
+                    default=EncounterStatus.draft, index=True)
     gm_id = Column(Integer, index=True)  # tg id ГМа
 
     campaign = relationship("Campaign", back_populates="encounters")
@@ -104,7 +109,7 @@ class Participant(Base):
     __tablename__ = "participants"
 
     id = Column(Integer, primary_key=True, index=True)
-    encounter_id = Column(Integer, ForeignKey("encounters.id"), nullable=False)
+    encounter_id = Column(Integer, ForeignKey("encounters.id"), nullable=False, index=True)
     type = Column(Enum(ParticipantType), nullable=False)
     character_id = Column(Integer, ForeignKey("characters.id"), nullable=True)
 
@@ -131,3 +136,24 @@ class EncounterState(Base):
     current_index = Column(Integer, nullable=False, default=0)
 
     encounter = relationship("Encounter", back_populates="state")
+
+
+class EnemyTemplate(Base):
+    """Враг из библиотеки кампании. Характеристики и атаки - компактным JSON (см. crud)"""
+    __tablename__ = "enemy_templates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=False, index=True)
+    name = Column(String, nullable=False)
+    stats = Column(Text, nullable=False)  # {"max_hp":20,"ac":12,"initiative_mod":2,"attacks":[...]}
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UserStats(Base):
+    """Счётчики главного экрана пользователя (обновляются вместе с изменениями, см. crud_stats)"""
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, primary_key=True)  # tg id
+    gm_campaigns = Column(Integer, nullable=False, default=0)
+    observer_campaigns = Column(Integer, nullable=False, default=0)
+    active_encounters = Column(Integer, nullable=False, default=0)
@@ -1,5 +1,5 @@
 # app/models_reference.py
-from sqlalchemy import Column, Integer, String, Text, Boolean, JSON, DateTime, Index
+from sqlalchemy import Column, Integer, String, Text, Boolean, JSON, DateTime, Index, ForeignKey
 from sqlalchemy.dialects.postgresql import TSVECTOR
 from .database import Base
 from datetime import datetime
@@ -34,9 +34,25 @@ class ReferenceSpell(Base):
     
     # Мета-информация
     source_url = Column(String)
+    content_hash = Column(String(64), nullable=True)  # sha256 разобранной записи - для пропуска неизменившихся
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class ReferenceSpellClass(Base):
+    """Связь заклинания с классом или подклассом (нормализованные classes/subclasses)"""
+    __tablename__ = "reference_spell_classes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    spell_id = Column(Integer, ForeignKey("reference_spells.id", ondelete="CASCADE"), nullable=False, index=True)
+    class_key = Column(String, nullable=False)  # название в нижнем регистре: "волшебник"
+    is_subclass = Column(Boolean, nullable=False, default=False)
+    level = Column(Integer, nullable=False)  # копия уровня заклинания для выборки по диапазону
+
+    __table_args__ = (
+        Index("idx_spell_class_level", "class_key", "is_subclass", "level"),
+    )
+
+
 class ReferenceItem(Base):
     """Предметы и снаряжение из справочника D&D"""
     __tablename__ = "reference_items"
@@ -62,6 +78,7 @@ class ReferenceItem(Base):
     
     # Мета
     source_url = Column(String)
+    content_hash = Column(String(64), nullable=True)  # sha256 разобранной записи - для пропуска неизменившихся
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
@@ -131,6 +148,16 @@ class ReferenceCreature(Base):
     
     # Мета
     source_url = Column(String)
+    content_hash = Column(String(64), nullable=True)  # sha256 разобранной записи - для пропуска неизменившихся
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ReferenceMeta(Base):
+    """Служебные значения справочника (версия набора данных и т.п.)"""
+    __tablename__ = "reference_meta"
+
+    key = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
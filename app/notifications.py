@@ -0,0 +1,339 @@
+# app/notifications.py
+# Исходящие уведомления игрокам через бота ("Бой начался", "Твой ход").
+#
+# Эндпоинты синхронные и работают в пуле потоков, а отправка в Telegram -
+# в event loop приложения. notify() только кладёт сообщение в очередь и
+# сразу возвращается, запрос, вызвавший уведомление, никогда не ждёт Telegram.
+#
+# Лимиты Telegram: около 30 сообщений в секунду на бота и около одного в
+# секунду в один чат. Общий лимит - token bucket, для чата - интервал между
+# сообщениями. Всё, что накопилось для чата за время ожидания, уходит одним
+# сообщением; уведомление с тем же ключом (например, "ход" в той же схватке)
+# заменяет предыдущее, ещё не отправленное. На 429 отправка ставится на
+# паузу на retry_after из ответа.
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from .parsers.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Общий лимит бота и интервал между сообщениями в один чат
+GLOBAL_RATE = 30.0
+GLOBAL_BURST = 5
+PER_CHAT_INTERVAL = 1.0
+
+# Одновременных отправок (каждая - HTTP-запрос к Bot API)
+SEND_WORKERS = 4
+
+# Сколько сообщений может ждать отправки; лишние отбрасываются
+MAX_PENDING = 10000
+
+# Попыток на сетевые ошибки и 5xx (429 не считается)
+MAX_ATTEMPTS = 3
+RETRY_BASE_SECONDS = 1.0
+
+# Ограничение Telegram на длину сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+
+class _Pending:
+    __slots__ = ("text", "key", "enqueued_at")
+
+    def __init__(self, text: str, key: Optional[Hashable], enqueued_at: float):
+        self.text = text
+        self.key = key
+        self.enqueued_at = enqueued_at
+
+
+class Notifier:
+    """Очередь исходящих сообщений с лимитами Telegram"""
+
+    def __init__(
+        self,
+        send: Callable[[int, str], Awaitable[object]],
+        rate: float = GLOBAL_RATE,
+        burst: int = GLOBAL_BURST,
+        per_chat_interval: float = PER_CHAT_INTERVAL,
+        workers: int = SEND_WORKERS,
+        max_pending: int = MAX_PENDING,
+    ):
+        """
+        Args:
+            send: Корутина отправки (chat_id, text), обычно Bot.send_message
+            rate, burst: Общий лимит сообщений в секунду
+            per_chat_interval: Минимальный интервал между сообщениями в один чат (сек)
+            workers: Одновременных отправок
+            max_pending: Максимум сообщений в очереди
+        """
+        self._send = send
+        self._rate = rate
+        self._burst = burst
+        self.per_chat_interval = per_chat_interval
+        self.workers = workers
+        self.max_pending = max_pending
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self._ready: Optional[asyncio.Queue] = None
+        self._bucket: Optional[TokenBucket] = None
+
+        # chat_id -> ещё не отправленные сообщения
+        self._pending: Dict[int, List[_Pending]] = {}
+        # Чаты, которые уже стоят в очереди, ждут интервала или отправляются
+        self._scheduled: set = set()
+        # chat_id -> monotonic-время, раньше которого в чат писать нельзя
+        self._chat_next: Dict[int, float] = {}
+        self._attempts: Dict[int, int] = {}
+        self._paused_until = 0.0
+
+        self.depth = 0
+        self.stats = {
+            "enqueued": 0,
+            "sent": 0,
+            "messages": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "failed": 0,
+            "retry_after": 0,
+            "retried": 0,
+        }
+        self._latencies: Deque[float] = deque(maxlen=1000)
+
+    # ----- запуск -----
+
+    def start(self):
+        """Запустить отправку в текущем event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Queue()
+        self._bucket = TokenBucket(self._rate, self._burst)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    # ----- постановка в очередь -----
+
+    def enqueue(self, chat_id: int, text: str, key: Optional[Hashable] = None) -> bool:
+        """
+        Поставить сообщение в очередь. Можно вызывать из любого потока.
+        False - отправка не запущена.
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return False
+        loop.call_soon_threadsafe(self._add, chat_id, text, key, time.monotonic())
+        return True
+
+    def _add(self, chat_id: int, text: str, key: Optional[Hashable], enqueued_at: float):
+        self.stats["enqueued"] += 1
+        pending = self._pending.setdefault(chat_id, [])
+
+        if key is not None:
+            for item in pending:
+                if item.key == key:
+                    # Новое уведомление заменяет устаревшее; время ожидания считаем от первого
+                    item.text = text
+                    self.stats["coalesced"] += 1
+                    return
+
+        if self.depth >= self.max_pending:
+            self.stats["dropped"] += 1
+            if not pending:
+                del self._pending[chat_id]
+            return
+
+        pending.append(_Pending(text, key, enqueued_at))
+        self.depth += 1
+        if chat_id not in self._scheduled:
+            self._scheduled.add(chat_id)
+            self._ready.put_nowait(chat_id)
+
+    # ----- отправка -----
+
+    def _schedule(self, chat_id: int, delay: float):
+        if delay > 0:
+            self._loop.call_later(delay, self._ready.put_nowait, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    def _take_batch(self, chat_id: int) -> List[_Pending]:
+        """Сообщения чата, которые поместятся в одно сообщение Telegram"""
+        pending = self._pending.get(chat_id, [])
+        batch = []
+        length = 0
+        for item in pending:
+            extra = len(item.text) + (2 if batch else 0)
+            if batch and length + extra > MAX_MESSAGE_LENGTH:
+                break
+            batch.append(item)
+            length += extra
+        del pending[:len(batch)]
+        return batch
+
+    def _restore(self, chat_id: int, batch: List[_Pending]):
+        self._pending.setdefault(chat_id, [])[:0] = batch
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+
+            wait = self._chat_next.get(chat_id, 0.0) - time.monotonic()
+            if wait > 0:
+                self._schedule(chat_id, wait)
+                continue
+
+            # Пауза после 429 могла начаться, пока ждали токен: тогда ждём её
+            # и берём токен заново, чтобы после паузы не ушёл лишний всплеск
+            while True:
+                await self._bucket.acquire()
+                pause = self._paused_until - time.monotonic()
+                if pause <= 0:
+                    break
+                await asyncio.sleep(pause)
+
+            batch = self._take_batch(chat_id)
+            if not batch:
+                self._finish_chat(chat_id)
+                continue
+
+            text = "\n\n".join(item.text[:MAX_MESSAGE_LENGTH] for item in batch)
+            delay = self.per_chat_interval
+            try:
+                await self._send(chat_id, text)
+            except TelegramRetryAfter as e:
+                # Telegram сам говорит, сколько ждать; сообщения возвращаются в начало очереди
+                self.stats["retry_after"] += 1
+                self._restore(chat_id, batch)
+                delay = float(e.retry_after)
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                batch = []
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Пользователь заблокировал бота или ни разу его не запускал
+                logger.info("Notification to %s rejected: %s", chat_id, e)
+                self._discard(batch, "failed")
+                batch = []
+            except Exception as e:
+                attempts = self._attempts.get(chat_id, 0) + 1
+                if attempts < MAX_ATTEMPTS:
+                    self._attempts[chat_id] = attempts
+                    self.stats["retried"] += 1
+                    self._restore(chat_id, batch)
+                    delay = max(delay, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+                else:
+                    logger.warning("Notification to %s failed: %s", chat_id, e)
+                    self._attempts.pop(chat_id, None)
+                    self._discard(batch, "failed")
+                batch = []
+            else:
+                self._attempts.pop(chat_id, None)
+                now = time.monotonic()
+                self.stats["sent"] += len(batch)
+                self.stats["messages"] += 1
+                self._latencies.extend(now - item.enqueued_at for item in batch)
+                self.depth -= len(batch)
+
+            self._chat_next[chat_id] = time.monotonic() + delay
+            if self._pending.get(chat_id):
+                self._schedule(chat_id, delay)
+            else:
+                self._finish_chat(chat_id)
+
+    def _discard(self, batch: List[_Pending], reason: str):
+        self.stats[reason] += len(batch)
+        self.depth -= len(batch)
+
+    def _finish_chat(self, chat_id: int):
+        self._pending.pop(chat_id, None)
+        self._scheduled.discard(chat_id)
+        # Интервалы давно прошедших отправок больше не нужны
+        if len(self._chat_next) > 10000:
+            now = time.monotonic()
+            self._chat_next = {chat: at for chat, at in self._chat_next.items() if at > now}
+
+    # ----- метрики -----
+
+    def metrics(self) -> dict:
+        latencies = sorted(self._latencies)
+        latency = {"avg_ms": None, "p95_ms": None, "max_ms": None}
+        if latencies:
+            latency = {
+                "avg_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+                "p95_ms": round(latencies[math.ceil(len(latencies) * 0.95) - 1] * 1000, 1),
+                "max_ms": round(latencies[-1] * 1000, 1),
+            }
+        return {
+            "enabled": self._loop is not None,
+            "queue_depth": self.depth,
+            "chats_waiting": len(self._scheduled),
+            "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            **self.stats,
+            "send_latency": latency,
+        }
+
+
+_notifier: Optional[Notifier] = None
+_bot: Optional[Bot] = None
+
+
+def enabled() -> bool:
+    return _notifier is not None
+
+
+def notify(chat_id: int, text: str, key: Optional[Hashable] = None) -> bool:
+    """Отправить уведомление в фоне; False - уведомления выключены"""
+    if _notifier is None:
+        return False
+    return _notifier.enqueue(chat_id, text, key)
+
+
+def metrics() -> dict:
+    if _notifier is None:
+        return {"enabled": False}
+    return _notifier.metrics()
+
+
+async def start() -> Optional[Notifier]:
+    """
+    Запустить отправку уведомлений в текущем event loop.
+    Нужен BOT_TOKEN; NOTIFICATIONS_ENABLED=0 отключает уведомления.
+    """
+    global _notifier, _bot
+
+    token = os.getenv("BOT_TOKEN")
+    if not token or os.getenv("NOTIFICATIONS_ENABLED", "1") != "1":
+        return None
+
+    bot = Bot(token=token)
+
+    async def send(chat_id: int, text: str):
+        await bot.send_message(chat_id, text)
+
+    notifier = Notifier(send)
+    notifier.start()
+    _notifier, _bot = notifier, bot
+    return notifier
+
+
+async def stop():
+    global _notifier, _bot
+
+    notifier, bot = _notifier, _bot
+    _notifier = _bot = None
+    if notifier is None:
+        return
+    await notifier.stop()
+    await bot.session.close()
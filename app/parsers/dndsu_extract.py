@@ -0,0 +1,283 @@
+# app/parsers/dndsu_extract.py
+"""
+Извлечение данных из HTML-страниц next.dnd.su.
+
+Функции чистые (HTML на входе, dict на выходе) и определены на уровне
+модуля, поэтому их можно выполнять в пуле процессов, не блокируя
+asyncio-цикл загрузчиков.
+
+Разбираем не всю страницу, а только нужные элементы: SoupStrainer
+отбрасывает меню, сайдбары и подвал ещё на этапе построения дерева,
+а парсер lxml заметно быстрее встроенного html.parser.
+"""
+
+import re
+from typing import Dict, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+PARSER = "lxml"
+
+# Элементы страницы заклинания, из которых берутся данные
+SPELL_CLASSES = {
+    "card-title", "school_level", "cast_time", "range", "components",
+    "duration", "subsection", "classes", "subclasses",
+}
+
+# Страницы предметов и существ разбираются регулярками по тексту карточки
+CARD_CLASSES = {"card", "card-wrapper"}
+
+SCHOOLS = [
+    "Очарование", "Воплощение", "Преграждение",
+    "Иллюзия", "Некромантия", "Прорицание",
+    "Превращение", "Вызов",
+]
+
+SIZES = ["Крошечный", "Маленький", "Средний", "Большой", "Огромный", "Громадный"]
+
+STATS_MAP = {
+    "СИЛ": "strength", "ЛОВ": "dexterity", "ТЕЛ": "constitution",
+    "ИНТ": "intelligence", "МДР": "wisdom", "ХАР": "charisma",
+}
+
+_LEVEL_RE = re.compile(r"(\d+)\s*уровень")
+_CLASSES_RE = re.compile(r"(?<!Под)Классы:\**\s*([^*\n]+)")
+_SUBCLASSES_RE = re.compile(r"Подклассы:\**\s*([^*\n]+)")
+_HIGHER_LEVELS_RE = re.compile(r"На более высоких уровнях", re.IGNORECASE)
+_COST_RE = re.compile(r"(\d+)\s*(зм|см|мм)", re.IGNORECASE)
+_WEIGHT_RE = re.compile(r"(\d+[\.,]?\d*)\s*фнт")
+_DAMAGE_RE = re.compile(r"\d+к\d+")
+_AC_RE = re.compile(r"КД[:\s]*(\d+)")
+_CR_RE = re.compile(r"(Показатель опасности|CR)[:\s]*(\d+/?\d*)")
+_HP_RE = re.compile(r"(\d+)\s*\((\d+к\d+)")
+_STATS_RE = re.compile(r"(СИЛ|ЛОВ|ТЕЛ|ИНТ|МДР|ХАР)[:\s]*(\d+)")
+
+# Заголовки блоков статблока существа -> поле записи
+CREATURE_BLOCKS = {
+    "особенности": "features",
+    "действия": "actions",
+    "бонусные действия": "bonus_actions",
+    "реакции": "reactions",
+    "легендарные действия": "legendary_actions",
+}
+
+
+def _has_class(wanted: set):
+    def match(value) -> bool:
+        if not value:
+            return False
+        return any(cls in wanted for cls in value.split())
+    return match
+
+
+_SPELL_STRAINER = SoupStrainer(class_=_has_class(SPELL_CLASSES))
+_CARD_STRAINER = SoupStrainer(class_=_has_class(CARD_CLASSES))
+
+
+def _soup(html: str, strainer: SoupStrainer) -> BeautifulSoup:
+    """Разобрать только нужные элементы; если их нет - всю страницу"""
+    soup = BeautifulSoup(html, PARSER, parse_only=strainer)
+    if soup.find(class_="card-title") is None:
+        soup = BeautifulSoup(html, PARSER)
+    return soup
+
+
+def _text(soup: BeautifulSoup, class_: str) -> Optional[str]:
+    elem = soup.find(class_=class_)
+    return elem.text.strip() if elem else None
+
+
+def _split_list(match) -> list:
+    if not match:
+        return []
+    return [part.strip() for part in match.group(1).strip().split(",") if part.strip()]
+
+
+def extract_spell(html: str, external_id: int, slug: str, url: str) -> Dict:
+    """Данные заклинания со страницы"""
+    soup = _soup(html, _SPELL_STRAINER)
+    card_text = soup.get_text("\n")
+
+    # 1. Название - card-title
+    name = _text(soup, "card-title") or slug
+
+    # 2-3. Уровень и Школа - school_level
+    level = None
+    school = None
+    school_level = _text(soup, "school_level")
+    if school_level:
+        if "заговор" in school_level.lower():
+            level = 0
+        else:
+            level_match = _LEVEL_RE.search(school_level)
+            if level_match:
+                level = int(level_match.group(1))
+
+        for s in SCHOOLS:
+            if s in school_level:
+                school = s
+                break
+
+    # 4-7. Время сотворения, дистанция, компоненты, длительность
+    casting_time = _text(soup, "cast_time")
+    spell_range = _text(soup, "range")
+    components = _text(soup, "components")
+    duration = _text(soup, "duration")
+
+    concentration = bool(duration and "концентрац" in duration.lower())
+
+    # 8-9. Классы и подклассы
+    classes = _split_list(_CLASSES_RE.search(card_text))
+    subclasses = _split_list(_SUBCLASSES_RE.search(card_text))
+
+    # 10. Описание - subsection
+    description = None
+    at_higher_levels = None
+
+    subsection_elem = soup.find(class_="subsection")
+    if subsection_elem:
+        full_text = subsection_elem.get_text(separator="\n\n", strip=True)
+
+        # Разделяем основное описание и "На более высоких уровнях"
+        parts = _HIGHER_LEVELS_RE.split(full_text, maxsplit=1)
+        if len(parts) > 1:
+            description = parts[0].strip()
+            at_higher_levels = "На более высоких уровнях. " + parts[1].strip()
+        else:
+            description = full_text
+
+    # Ритуал
+    ritual = "ритуал" in card_text.lower()
+
+    return {
+        "external_id": external_id,
+        "slug": slug,
+        "name": name,
+        "source_url": url,
+        "level": level,
+        "school": school,
+        "casting_time": casting_time,
+        "range": spell_range,
+        "components": components,
+        "duration": duration,
+        "concentration": concentration,
+        "ritual": ritual,
+        "description": description,
+        "at_higher_levels": at_higher_levels,
+        "classes": classes,
+        "subclasses": subclasses,
+    }
+
+
+def extract_item(html: str, external_id: int, slug: str, url: str) -> Dict:
+    """Данные предмета со страницы"""
+    soup = _soup(html, _CARD_STRAINER)
+
+    name = _text(soup, "card-title") or slug
+
+    description_elem = soup.find(class_="description")
+    description = description_elem.get_text(separator="\n", strip=True) if description_elem else None
+
+    text_content = soup.get_text()
+    text_lower = text_content.lower()
+
+    category = None
+    if "оружие" in text_lower:
+        category = "Оружие"
+    elif "доспех" in text_lower:
+        category = "Доспехи"
+
+    cost_match = _COST_RE.search(text_content)
+    weight_match = _WEIGHT_RE.search(text_content)
+    damage_match = _DAMAGE_RE.search(text_content)
+    ac_match = _AC_RE.search(text_content)
+
+    return {
+        "external_id": external_id,
+        "slug": slug,
+        "name": name,
+        "source_url": url,
+        "category": category,
+        "subcategory": None,
+        "cost": cost_match.group(0) if cost_match else None,
+        "weight": weight_match.group(0) if weight_match else None,
+        "damage": damage_match.group(0) if damage_match else None,
+        "ac": int(ac_match.group(1)) if ac_match else None,
+        "properties": [],
+        "description": description,
+    }
+
+
+def _creature_blocks(soup: BeautifulSoup) -> Dict[str, list]:
+    """
+    Особенности, действия, реакции из блоков статблока: заголовок h3 и абзацы
+    вида "<strong>Скимитар.</strong> Рукопашная атака оружием: ...".
+    """
+    blocks: Dict[str, list] = {field: [] for field in CREATURE_BLOCKS.values()}
+    for section in soup.find_all(class_="subsection"):
+        field = None
+        for elem in section.find_all(["h3", "p"]):
+            if elem.name == "h3":
+                field = CREATURE_BLOCKS.get(elem.get_text(strip=True).lower())
+                continue
+            if field is None:
+                continue
+            title = elem.find("strong")
+            name = title.get_text(strip=True).rstrip(".") if title else ""
+            if title:
+                title.extract()
+            description = elem.get_text(" ", strip=True)
+            if name or description:
+                blocks[field].append({"name": name, "description": description})
+    return blocks
+
+
+def extract_creature(html: str, external_id: int, slug: str, url: str) -> Dict:
+    """Данные существа со страницы"""
+    soup = _soup(html, _CARD_STRAINER)
+
+    name = _text(soup, "card-title") or slug
+
+    text_content = soup.get_text()
+
+    size = None
+    for s in SIZES:
+        if s in text_content:
+            size = s
+            break
+
+    cr_match = _CR_RE.search(text_content)
+    ac_match = _AC_RE.search(text_content)
+    hp_match = _HP_RE.search(text_content)
+
+    stats = {}
+    for stat_abbr, value in _STATS_RE.findall(text_content):
+        if stat_abbr in STATS_MAP:
+            stats[STATS_MAP[stat_abbr]] = int(value)
+
+    return {
+        "external_id": external_id,
+        "slug": slug,
+        "name": name,
+        "source_url": url,
+        "size": size,
+        "creature_type": None,
+        "alignment": None,
+        "ac": int(ac_match.group(1)) if ac_match else None,
+        "hp": hp_match.group(0) if hp_match else None,
+        "initiative": None,
+        "speed": {},
+        "strength": stats.get("strength"),
+        "dexterity": stats.get("dexterity"),
+        "constitution": stats.get("constitution"),
+        "intelligence": stats.get("intelligence"),
+        "wisdom": stats.get("wisdom"),
+        "charisma": stats.get("charisma"),
+        "saving_throws": {},
+        "skills": {},
+        "senses": None,
+        "languages": None,
+        "cr": cr_match.group(2) if cr_match else None,
+        "xp": None,
+        **_creature_blocks(soup),
+    }
@@ -1,9 +1,20 @@
 # app/parsers/dndsu_parser.py
 import httpx
-from bs4 import BeautifulSoup
-from typing import Dict, Optional, List
+from bs4 import BeautifulSoup, SoupStrainer
+from typing import Dict, Optional, List, Tuple
 import re
+import time
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from .rate_limit import RateLimiter, parse_retry_after
+from .http_cache import CachedPage, HttpCache
+from .page_store import open_page_store
+from .dndsu_extract import PARSER, extract_spell, extract_item, extract_creature
+
+# Результат парсинга, когда сервер ответил 304: страница не менялась,
+# разбирать её и обновлять запись в БД не нужно
+NOT_MODIFIED = "not_modified"
 
 
 class DndSuParser:
@@ -12,25 +23,167 @@ class DndSuParser:
     BASE_URL = "https://next.dnd.su"
     TIMEOUT = 30.0
     
-    def __init__(self):
+    # Ответы, после которых сервер просит подождать - повторяем с backoff
+    RETRY_STATUSES = (429, 503)
+    
+    # Разделы сайта для каждого вида записей справочника
+    SECTIONS = {
+        'spells': 'spells',
+        'items': 'equipment',
+        'creatures': 'bestiary',
+    }
+    
+    def __init__(
+        self,
+        rate: float = 2.0,
+        burst: int = 2,
+        max_per_host: int = 4,
+        max_retries: int = 3,
+        cache_dir: Optional[str] = None,
+        replay_from: Optional[str] = None,
+        record_to: Optional[str] = None,
+        extract_workers: int = 0
+    ):
+        """
+        Args:
+            rate: Средняя частота запросов к хосту (в секунду)
+            burst: Допустимый всплеск запросов
+            max_per_host: Максимум одновременных запросов к хосту
+            max_retries: Повторы при 429/503
+            cache_dir: Каталог HTTP-кэша для условных запросов (None - без кэша)
+            replay_from: Каталог или .zip с сохранёнными страницами - работать без сети
+            record_to: Каталог или .zip, куда сохранять скачанные страницы
+            extract_workers: Размер пула процессов для разбора HTML (0 - разбирать в цикле asyncio)
+        """
         self.client = httpx.AsyncClient(
             timeout=self.TIMEOUT,
             follow_redirects=True,
             headers={
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            }
+            },
+            limits=httpx.Limits(max_connections=max_per_host)
         )
+        self.limiter = RateLimiter(rate=rate, burst=burst, max_per_host=max_per_host)
+        self.max_retries = max_retries
+        self.cache = HttpCache(cache_dir) if cache_dir else None
+        self.replay = open_page_store(replay_from) if replay_from else None
+        self.recorder = open_page_store(record_to, writable=True) if record_to else None
+        self.pool = ProcessPoolExecutor(max_workers=extract_workers) if extract_workers > 0 else None
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'not_modified': 0,
+            'bytes': 0,
+            'request_time': 0.0,
+        }
     
     async def close(self):
-        """Закрыть HTTP клиент"""
+        """Закрыть HTTP клиент и хранилища страниц"""
         await self.client.aclose()
+        if self.pool:
+            self.pool.shutdown()
+        if self.replay:
+            self.replay.close()
+        if self.recorder:
+            self.recorder.close()
+    
+    def _replay_get(self, url: str) -> httpx.Response:
+        """Ответ из сохранённых страниц: 200 с телом или 404"""
+        self.stats['requests'] += 1
+        text = self.replay.read(url)
+        request = httpx.Request("GET", url)
+        if text is None:
+            return httpx.Response(404, request=request)
+        return httpx.Response(200, text=text, request=request)
+    
+    async def _get(self, url: str, conditional: bool = False) -> httpx.Response:
+        """
+        GET с учётом лимитов хоста и повторами при 429/503.
+        С conditional=True и записью в кэше отправляет If-None-Match/If-Modified-Since
+        и может вернуть 304. В кэш ничего не пишет - см. fetch_entry / remember.
+        """
+        if self.replay:
+            return self._replay_get(url)
+        
+        headers = {}
+        if conditional and self.cache:
+            cached = self.cache.get(url)
+            if cached:
+                headers = cached.conditional_headers()
+        
+        for attempt in range(self.max_retries + 1):
+            async with self.limiter.slot(url) as host:
+                started = time.perf_counter()
+                response = await self.client.get(url, headers=headers)
+                self.stats['request_time'] += time.perf_counter() - started
+                self.stats['requests'] += 1
+                # Байты как пришли по сети (до распаковки gzip)
+                self.stats['bytes'] += response.num_bytes_downloaded
+            
+            if response.status_code not in self.RETRY_STATUSES:
+                host.on_success()
+                if response.status_code == 304:
+                    self.stats['not_modified'] += 1
+                elif response.status_code == 200 and self.recorder:
+                    self.recorder.write(url, response.text)
+                return response
+            
+            self.stats['throttled'] += 1
+            host.on_throttle(attempt, parse_retry_after(response.headers.get('Retry-After')))
+        
+        return response
     
-    async def parse_spell(self, external_id: int, slug: str) -> Optional[Dict]:
-        """Парсинг заклинания с next.dnd.su"""
-        url = f"{self.BASE_URL}/spells/{external_id}/"
+    def entry_url(self, kind: str, external_id: int, slug: Optional[str] = None) -> str:
+        """Адрес страницы записи справочника"""
+        section = self.SECTIONS[kind]
+        if kind == 'spells' or not slug or slug == str(external_id):
+            # По одному ID сайт сам редиректит на канонический адрес
+            return f"{self.BASE_URL}/{section}/{external_id}/"
+        return f"{self.BASE_URL}/{section}/{external_id}-{slug}/"
+    
+    async def fetch_page(self, url: str, conditional: bool = False):
+        """
+        HTML страницы; None, если страницы нет (404); NOT_MODIFIED на 304.
+        Остальные ошибки HTTP - исключением.
+        """
+        response = await self._get(url, conditional=conditional)
+        return _page_text(response)
+    
+    async def fetch_entry(self, url: str, conditional: bool = False) -> Tuple[object, Optional[CachedPage]]:
+        """
+        Страница записи и её валидаторы: (html как у fetch_page, CachedPage или None).
+        Валидаторы сохраняются вызывающим через remember(), когда запись со страницы
+        уже в БД: иначе следующий обход получит 304 на изменения, которые не записаны.
+        """
+        response = await self._get(url, conditional=conditional)
+        html = _page_text(response)
+        if self.cache is None or not isinstance(html, str):
+            return html, None
+        return html, CachedPage.from_response(url, response)
+    
+    def remember(self, page: Optional[CachedPage]):
+        """Сохранить валидаторы страницы в HTTP-кэш (если кэш включён)"""
+        if self.cache is not None and page is not None:
+            self.cache.put(page)
+    
+    async def extract(self, extractor, html: str, external_id: int, slug: str, url: str) -> Dict:
+        """Разбор страницы: в пуле процессов, если он есть, иначе в текущем потоке"""
+        if self.pool is None:
+            return extractor(html, external_id, slug, url)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, extractor, html, external_id, slug, url)
+    
+    async def parse_spell(self, external_id: int, slug: str, conditional: bool = False) -> Optional[Dict]:
+        """
+        Парсинг заклинания с next.dnd.su.
+        С conditional=True возвращает NOT_MODIFIED, если страница не менялась с прошлого обхода.
+        """
+        url = self.entry_url('spells', external_id, slug)
         
         try:
-            response = await self.client.get(url)
+            response = await self._get(url, conditional=conditional)
+            if response.status_code == 304:
+                return NOT_MODIFIED
             
             # Обработка 503 - сервер перегружен
             if response.status_code == 503:
@@ -38,271 +191,139 @@ class DndSuParser:
                 return None
             
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            html_text = soup.get_text()
-            
-            # 1. Название - card-title
-            name_elem = soup.find(class_='card-title')
-            name = name_elem.text.strip() if name_elem else slug
-            
-            # 2-3. Уровень и Школа - school_level
-            school_level_elem = soup.find(class_='school_level')
-            level = None
-            school = None
-            
-            if school_level_elem:
-                text = school_level_elem.text.strip()
-                # Уровень
-                if 'заговор' in text.lower():
-                    level = 0
-                else:
-                    level_match = re.search(r'(\d+)\s*уровень', text)
-                    if level_match:
-                        level = int(level_match.group(1))
-                
-                # Школа
-                schools = ['Очарование', 'Воплощение', 'Преграждение', 
-                           'Иллюзия', 'Некромантия', 'Прорицание', 
-                           'Превращение', 'Вызов']
-                for s in schools:
-                    if s in text:
-                        school = s
-                        break
-            
-            # 4. Время сотворения - cast_time
-            cast_time_elem = soup.find(class_='cast_time')
-            casting_time = cast_time_elem.text.strip() if cast_time_elem else None
-            
-            # 5. Дистанция - range
-            range_elem = soup.find(class_='range')
-            spell_range = range_elem.text.strip() if range_elem else None
-            
-            # 6. Компоненты - components
-            components_elem = soup.find(class_='components')
-            components = components_elem.text.strip() if components_elem else None
-            
-            # 7. Длительность - duration
-            duration_elem = soup.find(class_='duration')
-            duration = duration_elem.text.strip() if duration_elem else None
-            
-            # Концентрация
-            concentration = False
-            if duration and 'концентрац' in duration.lower():
-                concentration = True
-            
-            # 8. Классы - ищем **Классы:** в тексте
-            classes = []
-            classes_match = re.search(r'\*\*Классы:\*\*([^\*]+)', html_text)
-            if classes_match:
-                classes_text = classes_match.group(1).strip()
-                # Разбиваем по запятой
-                classes = [c.strip() for c in classes_text.split(',') if c.strip()]
-            
-            # 9. Подклассы - ищем **Подклассы:** в тексте
-            subclasses = []
-            subclasses_match = re.search(r'\*\*Подклассы:\*\*([^\*\n]+)', html_text)
-            if subclasses_match:
-                subclasses_text = subclasses_match.group(1).strip()
-                # Разбиваем по запятой
-                subclasses = [s.strip() for s in subclasses_text.split(',') if s.strip()]
-            
-            # 10. Описание - subsection (правильный класс!)
-            description = None
-            at_higher_levels = None
-            
-            subsection_elem = soup.find(class_='subsection')
-            if subsection_elem:
-                full_text = subsection_elem.get_text(separator='\n\n', strip=True)
-                
-                # Разделяем основное описание и "На более высоких уровнях"
-                if 'на более высоких уровнях' in full_text.lower():
-                    parts = re.split(r'На более высоких уровнях', full_text, 
-                                    maxsplit=1, flags=re.IGNORECASE)
-                    description = parts[0].strip()
-                    if len(parts) > 1:
-                        at_higher_levels = 'На более высоких уровнях. ' + parts[1].strip()
-                else:
-                    description = full_text
-            
-            # Ритуал
-            ritual = 'ритуал' in html_text.lower()
-            
-            return {
-                'external_id': external_id,
-                'slug': slug,
-                'name': name,
-                'source_url': url,
-                'level': level,
-                'school': school,
-                'casting_time': casting_time,
-                'range': spell_range,
-                'components': components,
-                'duration': duration,
-                'concentration': concentration,
-                'ritual': ritual,
-                'description': description,
-                'at_higher_levels': at_higher_levels,
-                'classes': classes,
-                'subclasses': subclasses
-            }
+            return await self.extract(extract_spell, response.text, external_id, slug, url)
             
         except Exception as e:
             print(f"Error parsing spell {external_id}: {e}")
             return None
     
-    async def parse_item(self, external_id: int, slug: str) -> Optional[Dict]:
-        """Парсинг предмета"""
-        url = f"{self.BASE_URL}/equipment/{external_id}-{slug}"
+    async def parse_item(self, external_id: int, slug: str, conditional: bool = False) -> Optional[Dict]:
+        """
+        Парсинг предмета.
+        С conditional=True возвращает NOT_MODIFIED, если страница не менялась с прошлого обхода.
+        """
+        url = self.entry_url('items', external_id, slug)
         
         try:
-            response = await self.client.get(url)
+            response = await self._get(url, conditional=conditional)
+            if response.status_code == 304:
+                return NOT_MODIFIED
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            name_elem = soup.find(class_='card-title')
-            name = name_elem.text.strip() if name_elem else slug
-            
-            description_elem = soup.find(class_='description')
-            description = description_elem.get_text(separator='\n', strip=True) if description_elem else None
-            
-            text_content = soup.get_text()
-            
-            category = None
-            if 'оружие' in text_content.lower():
-                category = 'Оружие'
-            elif 'доспех' in text_content.lower():
-                category = 'Доспехи'
-            
-            cost_match = re.search(r'(\d+)\s*(зм|см|мм)', text_content, re.IGNORECASE)
-            cost = cost_match.group(0) if cost_match else None
-            
-            weight_match = re.search(r'(\d+[\.,]?\d*)\s*фнт', text_content)
-            weight = weight_match.group(0) if weight_match else None
-            
-            damage_match = re.search(r'\d+к\d+', text_content)
-            damage = damage_match.group(0) if damage_match else None
-            
-            ac_match = re.search(r'КД[:\s]*(\d+)', text_content)
-            ac = int(ac_match.group(1)) if ac_match else None
-            
-            return {
-                'external_id': external_id,
-                'slug': slug,
-                'name': name,
-                'source_url': url,
-                'category': category,
-                'subcategory': None,
-                'cost': cost,
-                'weight': weight,
-                'damage': damage,
-                'ac': ac,
-                'properties': [],
-                'description': description
-            }
+            return await self.extract(extract_item, response.text, external_id, slug, url)
             
         except Exception as e:
             print(f"Error parsing item {external_id}-{slug}: {e}")
             return None
     
-    async def parse_creature(self, external_id: int, slug: str) -> Optional[Dict]:
-        """Парсинг существа"""
-        url = f"{self.BASE_URL}/bestiary/{external_id}-{slug}/"
+    async def parse_creature(self, external_id: int, slug: str, conditional: bool = False) -> Optional[Dict]:
+        """
+        Парсинг существа.
+        С conditional=True возвращает NOT_MODIFIED, если страница не менялась с прошлого обхода.
+        """
+        url = self.entry_url('creatures', external_id, slug)
         
         try:
-            response = await self.client.get(url)
+            response = await self._get(url, conditional=conditional)
+            if response.status_code == 304:
+                return NOT_MODIFIED
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            name_elem = soup.find(class_='card-title')
-            name = name_elem.text.strip() if name_elem else slug
-            
-            text_content = soup.get_text()
-            
-            size = None
-            sizes = ['Крошечный', 'Маленький', 'Средний', 'Большой', 'Огромный', 'Громадный']
-            for s in sizes:
-                if s in text_content:
-                    size = s
-                    break
-            
-            cr_match = re.search(r'(Показатель опасности|CR)[:\s]*(\d+/?\d*)', text_content)
-            cr = cr_match.group(2) if cr_match else None
-            
-            ac_match = re.search(r'КД[:\s]*(\d+)', text_content)
-            ac = int(ac_match.group(1)) if ac_match else None
-            
-            hp_match = re.search(r'(\d+)\s*\((\d+к\d+)', text_content)
-            hp = hp_match.group(0) if hp_match else None
-            
-            stats = {}
-            stats_pattern = r'(СИЛ|ЛОВ|ТЕЛ|ИНТ|МДР|ХАР)[:\s]*(\d+)'
-            stats_matches = re.findall(stats_pattern, text_content)
-            
-            stats_map = {'СИЛ': 'strength', 'ЛОВ': 'dexterity', 'ТЕЛ': 'constitution',
-                        'ИНТ': 'intelligence', 'МДР': 'wisdom', 'ХАР': 'charisma'}
-            
-            for stat_abbr, value in stats_matches:
-                if stat_abbr in stats_map:
-                    stats[stats_map[stat_abbr]] = int(value)
-            
-            return {
-                'external_id': external_id,
-                'slug': slug,
-                'name': name,
-                'source_url': url,
-                'size': size,
-                'creature_type': None,
-                'alignment': None,
-                'ac': ac,
-                'hp': hp,
-                'initiative': None,
-                'speed': {},
-                'strength': stats.get('strength'),
-                'dexterity': stats.get('dexterity'),
-                'constitution': stats.get('constitution'),
-                'intelligence': stats.get('intelligence'),
-                'wisdom': stats.get('wisdom'),
-                'charisma': stats.get('charisma'),
-                'saving_throws': {},
-                'skills': {},
-                'senses': None,
-                'languages': None,
-                'cr': cr,
-                'xp': None,
-                'features': [],
-                'actions': [],
-                'bonus_actions': [],
-                'reactions': [],
-                'legendary_actions': []
-            }
+            return await self.extract(extract_creature, response.text, external_id, slug, url)
             
         except Exception as e:
             print(f"Error parsing creature {external_id}-{slug}: {e}")
             return None
     
+    async def get_listing(self, kind: str, page: int = 1) -> Optional[List[Dict]]:
+        """
+        Записи со страницы списка раздела (spells, items, creatures).
+        None - такой страницы нет (404), пустой список - на странице нет ссылок на записи.
+        Остальные ошибки загрузки - исключением.
+        """
+        section = self.SECTIONS[kind]
+        url = f"{self.BASE_URL}/{section}/"
+        if page > 1:
+            url += f"?page={page}"
+        
+        # Ошибки загрузки (503 после повторов, таймаут) - исключением: обход
+        # должен отличать сбой от конца списка
+        html = await self.fetch_page(url)
+        if html is None:
+            return None
+        soup = BeautifulSoup(html, PARSER, parse_only=SoupStrainer('a'))
+        return _entry_links(section, (
+            (link.get('href') or '', link.text.strip()) for link in soup.find_all('a')
+        ))
+    
     async def get_spells_list(self, page: int = 1) -> List[Dict]:
         """Получить список заклинаний"""
-        url = f"{self.BASE_URL}/spells/"
-        try:
-            response = await self.client.get(url)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            spell_links = soup.find_all('a', href=re.compile(r'/spells/\d+-[\w-]+/'))
-            
-            spells = []
-            for link in spell_links:
-                href = link.get('href')
-                match = re.search(r'/spells/(\d+)-([\w-]+)/', href)
-                if match:
-                    spells.append({
-                        'external_id': int(match.group(1)),
-                        'slug': match.group(2),
-                        'name': link.text.strip()
-                    })
-            
-            return spells
-            
-        except Exception as e:
-            print(f"Error getting spells list: {e}")
-            return []
+        return await self.get_listing('spells', page) or []
+    
+    async def get_sitemap_entries(self, kind: str) -> List[Dict]:
+        """Записи раздела из sitemap.xml (вложенные sitemap тоже обходятся)"""
+        section = self.SECTIONS[kind]
+        pending = [f"{self.BASE_URL}/sitemap.xml"]
+        seen_sitemaps = set()
+        locations = []
+        
+        while pending:
+            url = pending.pop(0)
+            if url in seen_sitemaps:
+                continue
+            seen_sitemaps.add(url)
+            try:
+                xml = await self.fetch_page(url)
+            except Exception as e:
+                print(f"Error getting sitemap {url}: {e}")
+                continue
+            if not xml:
+                continue
+            
+            for loc in _SITEMAP_LOC_RE.findall(xml):
+                loc = loc.strip()
+                if loc.endswith('.xml'):
+                    pending.append(loc)
+                else:
+                    locations.append(loc)
+        
+        return _entry_links(section, ((loc, None) for loc in locations))
+
+
+def _page_text(response: httpx.Response):
+    """HTML ответа; None на 404, NOT_MODIFIED на 304, остальные ошибки - исключением"""
+    if response.status_code == 304:
+        return NOT_MODIFIED
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.text
+
+
+_SITEMAP_LOC_RE = re.compile(r'<loc>\s*([^<]+?)\s*</loc>')
+
+# Регулярка ссылок на записи раздела (/spells/10001-fireball/) по имени раздела
+_ENTRY_LINK_RES = {}
+
+
+def _entry_links(section: str, links) -> List[Dict]:
+    """Уникальные записи раздела среди ссылок (href, текст) в порядке появления"""
+    pattern = _ENTRY_LINK_RES.get(section)
+    if pattern is None:
+        pattern = re.compile(rf'/{section}/(\d+)-([\w-]+)/?(?:[?#]|$)')
+        _ENTRY_LINK_RES[section] = pattern
+    
+    entries = []
+    seen = set()
+    for href, name in links:
+        match = pattern.search(href)
+        if not match:
+            continue
+        external_id = int(match.group(1))
+        if external_id in seen:
+            continue
+        seen.add(external_id)
+        entries.append({
+            'external_id': external_id,
+            'slug': match.group(2),
+            'name': name or None
+        })
+    return entries
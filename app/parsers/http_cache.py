@@ -0,0 +1,85 @@
+# app/parsers/http_cache.py
+"""
+Постоянный кэш HTTP-валидаторов для парсеров справочника.
+
+Для каждого URL на диске хранятся ETag / Last-Modified страницы. При повторном
+обходе по ним строятся условные заголовки If-None-Match / If-Modified-Since, и
+неизменившаяся страница приходит ответом 304 без тела. Тело не хранится: на 304
+страница не разбирается, запись в БД уже совпадает с ней.
+
+Поэтому валидаторы можно сохранять только после того, как запись со страницы
+попала в БД (см. IngestPipeline): иначе следующий обход получит 304 на страницу,
+изменения которой так и не были записаны.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+import httpx
+
+
+class CachedPage:
+    """Запись кэша: валидаторы страницы"""
+
+    def __init__(self, url: str, etag: Optional[str], last_modified: Optional[str]):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @classmethod
+    def from_response(cls, url: str, response: httpx.Response) -> Optional["CachedPage"]:
+        """Валидаторы успешного ответа; None, если сервер их не прислал"""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return None
+        return cls(url, etag, last_modified)
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """Кэш валидаторов в каталоге: <sha256 url>.json"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, url: str) -> Path:
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.json"
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        """Запись кэша для URL или None"""
+        try:
+            meta = json.loads(self._path(url).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return CachedPage(url, meta.get("etag"), meta.get("last_modified"))
+
+    def put(self, page: CachedPage):
+        """Сохранить валидаторы страницы"""
+        path = self._path(page.url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Пишем через временный файл, чтобы прерванный обход не оставил битую запись
+        _write_atomic(path, json.dumps({
+            "url": page.url,
+            "etag": page.etag,
+            "last_modified": page.last_modified,
+        }, ensure_ascii=False).encode("utf-8"))
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
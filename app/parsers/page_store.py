@@ -0,0 +1,119 @@
+# app/parsers/page_store.py
+"""
+Локальные хранилища HTML-страниц для парсеров справочника.
+
+Позволяют записать страницы, скачанные с сайта (режим записи), и потом
+разбирать их без сети (режим воспроизведения) - для тестов, профилирования
+и сборки на машинах без доступа в интернет.
+
+Хранилище - каталог или один zip-архив. Страница лежит по пути из URL:
+https://next.dnd.su/spells/10001/ -> spells/10001.html
+"""
+
+import threading
+import zipfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote, urlparse
+
+
+def page_key(url: str) -> str:
+    """Путь страницы внутри хранилища"""
+    parsed = urlparse(url)
+    key = parsed.path.strip("/") or "index"
+    if parsed.query:
+        key += "@" + quote(parsed.query, safe="")
+    return key + ".html"
+
+
+class PageStore(ABC):
+    """Базовый интерфейс хранилища страниц"""
+
+    @abstractmethod
+    def read(self, url: str) -> Optional[str]:
+        """HTML страницы; None, если её нет в хранилище"""
+
+    @abstractmethod
+    def write(self, url: str, text: str):
+        """Сохранить страницу"""
+
+    @abstractmethod
+    def keys(self):
+        """Пути всех страниц хранилища"""
+
+    @abstractmethod
+    def close(self):
+        """Освободить файлы хранилища"""
+
+
+class DirectoryPageStore(PageStore):
+    """Страницы - обычные файлы в каталоге"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def read(self, url: str) -> Optional[str]:
+        path = self.directory / page_key(url)
+        try:
+            return path.read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+    def write(self, url: str, text: str):
+        path = self.directory / page_key(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+    def keys(self):
+        return sorted(
+            str(p.relative_to(self.directory)).replace("\\", "/")
+            for p in self.directory.rglob("*.html")
+        )
+
+    def close(self):
+        pass
+
+
+class ZipPageStore(PageStore):
+    """Страницы в одном zip-архиве (deflate)"""
+
+    def __init__(self, path: str, writable: bool = False):
+        self.path = Path(path)
+        mode = "a" if writable else "r"
+        if writable:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._zip = zipfile.ZipFile(self.path, mode, compression=zipfile.ZIP_DEFLATED)
+        self._names = set(self._zip.namelist())
+        self._lock = threading.Lock()
+
+    def read(self, url: str) -> Optional[str]:
+        key = page_key(url)
+        if key not in self._names:
+            return None
+        with self._lock:
+            return self._zip.read(key).decode("utf-8")
+
+    def write(self, url: str, text: str):
+        key = page_key(url)
+        with self._lock:
+            # zip не умеет перезаписывать файлы - оставляем первую запись
+            if key in self._names:
+                return
+            self._zip.writestr(key, text.encode("utf-8"))
+            self._names.add(key)
+
+    def keys(self):
+        return sorted(self._names)
+
+    def close(self):
+        self._zip.close()
+
+
+def open_page_store(path: str, writable: bool = False) -> PageStore:
+    """Каталог или zip-архив (по расширению .zip)"""
+    if str(path).endswith(".zip"):
+        return ZipPageStore(path, writable=writable)
+    if writable:
+        Path(path).mkdir(parents=True, exist_ok=True)
+    return DirectoryPageStore(path)
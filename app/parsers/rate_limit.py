@@ -0,0 +1,116 @@
+# app/parsers/rate_limit.py
+"""
+Ограничение частоты запросов к сайтам-источникам справочника.
+
+На каждый хост - token bucket (средняя частота + допустимый всплеск),
+лимит одновременных запросов и адаптивный backoff: на 429/503 частота
+снижается вдвое и хост ставится на паузу, успешные ответы постепенно
+возвращают частоту к исходной.
+"""
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше burst в запасе"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Дождаться и забрать один токен (ожидающие обслуживаются по очереди)"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostState:
+    """Лимиты и состояние backoff для одного хоста"""
+
+    BACKOFF_BASE = 1.0
+    BACKOFF_MAX = 60.0
+
+    def __init__(self, rate: float, burst: int, max_concurrency: int, min_rate: float):
+        self.base_rate = rate
+        self.min_rate = min_rate
+        self.bucket = TokenBucket(rate, burst)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.paused_until = 0.0
+
+    async def wait_turn(self):
+        """Дождаться окончания паузы и токена"""
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.bucket.acquire()
+
+    def on_throttle(self, attempt: int, retry_after: Optional[float] = None):
+        """Сервер попросил сбавить темп (429/503): мультипликативное снижение частоты и пауза"""
+        self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+        if retry_after is None:
+            retry_after = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt)
+            retry_after *= random.uniform(0.8, 1.2)
+        self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def on_success(self):
+        """Успешный ответ: аддитивно возвращаем частоту к исходной"""
+        if self.bucket.rate < self.base_rate:
+            self.bucket.rate = min(self.base_rate, self.bucket.rate + self.base_rate * 0.1)
+
+
+class RateLimiter:
+    """Ограничитель запросов с отдельным состоянием для каждого хоста"""
+
+    def __init__(
+        self,
+        rate: float = 2.0,
+        burst: int = 2,
+        max_per_host: int = 4,
+        min_rate: float = 0.2,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_per_host = max_per_host
+        self.min_rate = min(min_rate, rate)
+        self._hosts: Dict[str, HostState] = {}
+
+    def host(self, url: str) -> HostState:
+        netloc = urlparse(url).netloc
+        state = self._hosts.get(netloc)
+        if state is None:
+            state = HostState(self.rate, self.burst, self.max_per_host, self.min_rate)
+            self._hosts[netloc] = state
+        return state
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Занять слот для запроса к хосту url"""
+        state = self.host(url)
+        async with state.semaphore:
+            await state.wait_turn()
+            yield state
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Заголовок Retry-After в секундах (формат HTTP-даты не поддерживаем)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
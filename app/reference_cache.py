@@ -0,0 +1,93 @@
+# app/reference_cache.py
+# Кэш ответов справочника, привязанный к версии набора данных.
+#
+# Справочник меняется только когда отрабатывают загрузчики (scripts/),
+# они же увеличивают версию в reference_meta. Пока версия не изменилась,
+# сериализованные ответы можно отдавать из памяти, а клиенту - 304.
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from sqlalchemy.orm import Session
+
+from . import crud_reference
+
+# Как часто перечитывать версию из БД (загрузчики работают в отдельном процессе)
+VERSION_TTL_SECONDS = 5.0
+
+# Максимальное количество закэшированных ответов
+MAX_ENTRIES = 2048
+
+# Ответы требуют авторизации, поэтому кэшировать их может только клиент
+CACHE_CONTROL = "private, max-age=60, must-revalidate"
+
+_lock = threading.Lock()
+_responses: "OrderedDict[Hashable, bytes]" = OrderedDict()
+_version: Optional[int] = None
+_version_checked_at = 0.0
+
+
+def get_dataset_version(db: Session) -> int:
+    """Версия набора данных. Из БД читается не чаще раза в VERSION_TTL_SECONDS."""
+    global _version, _version_checked_at
+
+    now = time.monotonic()
+    if _version is not None and now - _version_checked_at < VERSION_TTL_SECONDS:
+        return _version
+
+    version = crud_reference.get_dataset_version(db)
+    with _lock:
+        if version != _version:
+            # Данные поменялись - старые ответы больше не нужны
+            _responses.clear()
+        _version = version
+        _version_checked_at = now
+    return version
+
+
+def make_etag(version: int, encoding: Optional[str] = None) -> str:
+    """
+    ETag ответа справочника: содержимое по URL зависит только от версии.
+    Сжатое и несжатое тело - разные представления, у них разные ETag.
+    """
+    if encoding:
+        return f'"ref-v{version}-{encoding}"'
+    return f'"ref-v{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверить заголовок If-None-Match"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def get_or_build(key: Hashable, build: Callable[[], bytes]) -> bytes:
+    """Получить сериализованный ответ из кэша или построить его"""
+    with _lock:
+        body = _responses.get(key)
+        if body is not None:
+            _responses.move_to_end(key)
+            return body
+
+    body = build()
+
+    with _lock:
+        _responses[key] = body
+        _responses.move_to_end(key)
+        while len(_responses) > MAX_ENTRIES:
+            _responses.popitem(last=False)
+    return body
+
+
+def clear():
+    """Сбросить кэш (например, после загрузки в том же процессе)"""
+    global _version
+    with _lock:
+        _responses.clear()
+        _version = None
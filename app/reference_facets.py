@@ -0,0 +1,173 @@
+# app/reference_facets.py
+# Фасетные счётчики для браузера справочника.
+#
+# Для каждого значения фасета (уровень, школа, класс, CR, ...) заранее
+# строится битовая карта позиций записей - обычный int Python. Комбинация
+# фильтров - это пересечение битовых карт (&), а количество - bit_count().
+# Индекс строится один раз на версию набора данных.
+
+import threading
+from fractions import Fraction
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import models_reference, reference_cache
+
+SPELL_FACETS = ("level", "school", "class", "concentration", "ritual")
+CREATURE_FACETS = ("cr", "creature_type")
+
+_lock = threading.Lock()
+_indexes: Dict[str, Tuple[int, "FacetIndex"]] = {}
+
+
+def _bitmap_from_positions(positions: Iterable[int], size: int) -> int:
+    """Собрать битовую карту из списка позиций"""
+    buf = bytearray((size + 7) // 8)
+    for pos in positions:
+        buf[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _value_sort_key(value: str):
+    """Числа (в т.ч. CR вида 1/4) сортируем как числа, остальное - по алфавиту"""
+    try:
+        return (0, Fraction(value), "")
+    except (ValueError, ZeroDivisionError):
+        return (1, 0, value)
+
+
+def _bool_key(value: Optional[bool]) -> str:
+    return "true" if value else "false"
+
+
+class FacetIndex:
+    """Битовые карты значений фасетов по позициям записей"""
+
+    def __init__(self, names: List[str], facet_values: Dict[str, List[List[str]]]):
+        self.size = len(names)
+        self.names = [name.lower() for name in names]
+        self.all = (1 << self.size) - 1
+
+        # facet -> value -> позиции записей
+        postings: Dict[str, Dict[str, List[int]]] = {}
+        for facet, per_row in facet_values.items():
+            values: Dict[str, List[int]] = {}
+            for pos, row_values in enumerate(per_row):
+                for value in row_values:
+                    values.setdefault(value, []).append(pos)
+            postings[facet] = values
+
+        self.bitmaps: Dict[str, Dict[str, int]] = {
+            facet: {
+                value: _bitmap_from_positions(positions, self.size)
+                for value, positions in sorted(
+                    values.items(), key=lambda kv: _value_sort_key(kv[0])
+                )
+            }
+            for facet, values in postings.items()
+        }
+
+    def match_text(self, query: str) -> int:
+        """Битовая карта записей, в названии которых есть подстрока"""
+        if not query:
+            return self.all
+        needle = query.lower()
+        return _bitmap_from_positions(
+            (pos for pos, name in enumerate(self.names) if needle in name),
+            self.size,
+        )
+
+    def counts(
+        self,
+        query: str,
+        filters: Dict[str, Optional[str]],
+    ) -> Tuple[int, Dict[str, Dict[str, int]]]:
+        """
+        Количество результатов для текущего запроса и по каждому значению фасетов.
+        Счётчики фасета учитывают все фильтры, кроме фильтра этого же фасета,
+        чтобы было видно, сколько даст переключение на другое значение.
+        """
+        text_bits = self.match_text(query)
+
+        selected: Dict[str, int] = {}
+        for facet, value in filters.items():
+            if value is None:
+                continue
+            selected[facet] = self.bitmaps.get(facet, {}).get(value, 0)
+
+        total_bits = text_bits
+        for bits in selected.values():
+            total_bits &= bits
+
+        facets: Dict[str, Dict[str, int]] = {}
+        for facet, values in self.bitmaps.items():
+            base = text_bits
+            for other, bits in selected.items():
+                if other != facet:
+                    base &= bits
+            facets[facet] = {
+                value: count
+                for value, bits in values.items()
+                if (count := (base & bits).bit_count())
+            }
+
+        return total_bits.bit_count(), facets
+
+
+def _build_spell_index(db: Session) -> FacetIndex:
+    rows = db.query(
+        models_reference.ReferenceSpell.name,
+        models_reference.ReferenceSpell.level,
+        models_reference.ReferenceSpell.school,
+        models_reference.ReferenceSpell.classes,
+        models_reference.ReferenceSpell.concentration,
+        models_reference.ReferenceSpell.ritual
+    ).all()
+
+    return FacetIndex(
+        names=[r.name for r in rows],
+        facet_values={
+            "level": [[str(r.level)] if r.level is not None else [] for r in rows],
+            "school": [[r.school] if r.school else [] for r in rows],
+            "class": [list(r.classes or []) for r in rows],
+            "concentration": [[_bool_key(r.concentration)] for r in rows],
+            "ritual": [[_bool_key(r.ritual)] for r in rows],
+        },
+    )
+
+
+def _build_creature_index(db: Session) -> FacetIndex:
+    rows = db.query(
+        models_reference.ReferenceCreature.name,
+        models_reference.ReferenceCreature.cr,
+        models_reference.ReferenceCreature.creature_type
+    ).all()
+
+    return FacetIndex(
+        names=[r.name for r in rows],
+        facet_values={
+            "cr": [[r.cr] if r.cr else [] for r in rows],
+            "creature_type": [[r.creature_type] if r.creature_type else [] for r in rows],
+        },
+    )
+
+
+_BUILDERS = {
+    "spells": _build_spell_index,
+    "creatures": _build_creature_index,
+}
+
+
+def get_index(db: Session, kind: str) -> FacetIndex:
+    """Индекс фасетов для текущей версии справочника (перестраивается после загрузки)"""
+    version = reference_cache.get_dataset_version(db)
+    with _lock:
+        cached = _indexes.get(kind)
+        if cached and cached[0] == version:
+            return cached[1]
+
+    index = _BUILDERS[kind](db)
+    with _lock:
+        _indexes[kind] = (version, index)
+    return index
@@ -0,0 +1,165 @@
+# app/reference_mobs.py
+# Существа бестиария как шаблоны мобов для схватки.
+#
+# Из статблока берутся хиты ("190 (20к10 + 80)" - среднее и кости), КД,
+# модификатор инициативы по Ловкости и атаки из текста действий
+# ("Рукопашная атака оружием: +4 к попаданию, досягаемость 5 фт., одна цель.
+# Попадание: 5 (1к6 + 2) рубящего урона."). Действия сохраняет загрузчик
+# (extract_creature); у записей, загруженных до этого, их нет - такие существа
+# появляются без атак, пока бестиарий не загружен заново с --no-cache (иначе
+# неизменившиеся страницы отвечают 304 и не разбираются). Разбор делается один раз
+# на существо и версию набора данных, спавн орды - только броски.
+
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import dice, models_reference, reference_cache, schemas
+
+# Существ в кэше; при переполнении кэш просто сбрасывается
+MAX_CACHED = 4096
+
+_HP_RE = re.compile(r"(\d+)\s*(?:\(([^)]*)(\))?)?")
+_HIT_RE = re.compile(r"([+\-−])\s*(\d+)\s+к\s+попаданию")
+_DAMAGE_RE = re.compile(
+    r"Попадание:\s*\d+\s*\(\s*(\d+)\s*[кd]\s*(\d+)\s*(?:([+\-−])\s*(\d+)\s*)?\)"
+    r"\s*(?:([а-яё]+)\s+)?урона(?:\s+([а-яё]+))?",
+    re.IGNORECASE,
+)
+_FLAT_DAMAGE_RE = re.compile(r"Попадание:\s*(\d+)\s+(?:([а-яё]+)\s+)?урона", re.IGNORECASE)
+_RANGE_RE = re.compile(r"(?:досягаемость|дистанция)\s+(\d+(?:/\d+)?)\s*фт", re.IGNORECASE)
+_INITIATIVE_RE = re.compile(r"([+\-−])\s*(\d+)")
+
+_lock = threading.Lock()
+_cache: Tuple[Optional[int], Dict[int, schemas.CreatureTemplate]] = (None, {})
+
+
+def _signed(sign: Optional[str], value: str) -> int:
+    return -int(value) if sign in ("-", "−") else int(value)
+
+
+def parse_hp(hp: Optional[str]) -> Tuple[Optional[int], Optional[str]]:
+    """
+    "190 (20к10 + 80)" -> (190, "20d10+80").
+    Кости None, если их нет или не удалось разобрать.
+    """
+    match = _HP_RE.search((hp or "").replace("−", "-"))
+    if not match:
+        return None, None
+    average = int(match.group(1))
+    if not match.group(2):
+        return average, None
+
+    try:
+        expr = dice.parse(match.group(2))
+    except dice.DiceError:
+        return average, None
+    if not expr.terms:
+        return average, None
+
+    if not match.group(3) and not expr.modifier:
+        # Загрузчик сохраняет хиты без бонуса ("7 (2к6") - восстанавливаем его по среднему
+        expr = dice.DiceExpression(expr.terms, average - int(expr.average))
+    return average, str(expr)
+
+
+def initiative_modifier(dexterity: Optional[int], initiative: Optional[str] = None) -> int:
+    """Модификатор Ловкости; без неё - из строки инициативы ("+12 (22)")"""
+    if dexterity is not None:
+        return (dexterity - 10) // 2
+    match = _INITIATIVE_RE.match((initiative or "").strip())
+    return _signed(match.group(1), match.group(2)) if match else 0
+
+
+def _action_parts(action) -> Tuple[str, str]:
+    """Название и текст действия (словарь из загрузчика или строка "Скимитар. Рукопашная...")"""
+    if isinstance(action, dict):
+        name = action.get("name") or ""
+        text = action.get("description") or action.get("desc") or action.get("text") or ""
+    else:
+        name, _, text = str(action).partition(".")
+    return name.strip().rstrip("."), text.strip()
+
+
+def parse_attack(action) -> Optional[schemas.Attack]:
+    """Атака из действия; None, если действие - не бросок атаки"""
+    name, text = _action_parts(action)
+    hit = _HIT_RE.search(text)
+    if not name or not hit:
+        return None
+
+    damage = _DAMAGE_RE.search(text)
+    if damage:
+        dice_count, die = int(damage.group(1)), int(damage.group(2))
+        bonus = _signed(damage.group(3), damage.group(4)) if damage.group(4) else 0
+        damage_type = damage.group(5) or damage.group(6) or ""
+    else:
+        flat = _FLAT_DAMAGE_RE.search(text)
+        dice_count, die = 0, 0
+        bonus = int(flat.group(1)) if flat else 0
+        damage_type = (flat.group(2) if flat else None) or ""
+
+    reach = _RANGE_RE.search(text)
+    return schemas.Attack(
+        name=name,
+        hit_bonus=_signed(hit.group(1), hit.group(2)),
+        damage_dice=dice_count,
+        damage_die=die,
+        damage_bonus=bonus,
+        damage_type=damage_type,
+        range=reach.group(1) if reach else "",
+    )
+
+
+def to_template(creature: models_reference.ReferenceCreature) -> Optional[schemas.CreatureTemplate]:
+    """Шаблон моба из записи бестиария; None, если у существа нет хитов"""
+    average, hp_dice = parse_hp(creature.hp)
+    if not average:
+        return None
+
+    attacks = [attack for attack in map(parse_attack, creature.actions or []) if attack]
+    return schemas.CreatureTemplate(
+        creature_id=creature.id,
+        name=creature.name,
+        max_hp=average,
+        ac=creature.ac or 10,
+        initiative_mod=initiative_modifier(creature.dexterity, creature.initiative),
+        attacks=attacks or None,
+        hp_dice=hp_dice,
+    )
+
+
+def get_template(db: Session, creature_id: int) -> Optional[schemas.CreatureTemplate]:
+    """Шаблон существа для текущей версии справочника (разбирается один раз)"""
+    global _cache
+
+    version = reference_cache.get_dataset_version(db)
+    with _lock:
+        if _cache[0] != version:
+            _cache = (version, {})
+        template = _cache[1].get(creature_id)
+    if template is not None:
+        return template
+
+    creature = db.query(models_reference.ReferenceCreature).filter(
+        models_reference.ReferenceCreature.id == creature_id
+    ).first()
+    template = to_template(creature) if creature else None
+    if template is None:
+        return None
+
+    with _lock:
+        if _cache[0] == version:
+            if len(_cache[1]) >= MAX_CACHED:
+                _cache[1].clear()
+            _cache[1][creature_id] = template
+    return template
+
+
+def spawn_hp(template: schemas.CreatureTemplate, count: int, rolled: bool) -> List[int]:
+    """max_hp для count копий: среднее или бросок костей хитов (не меньше 1)"""
+    if not rolled or not template.hp_dice:
+        return [template.max_hp] * count
+    return [max(1, hp) for hp in dice.roll_many(template.hp_dice, count)]
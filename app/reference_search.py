@@ -0,0 +1,185 @@
+# app/reference_search.py
+# Поиск по названиям справочника для inline-режима бота (@bot огненный шар).
+#
+# Названия всех записей (заклинания, предметы, существа) разбиваются на
+# слова, слова складываются в отсортированный список. Запрос ищется по
+# префиксам слов: диапазон в отсортированном списке находится bisect'ом,
+# поэтому поиск не зависит от размера справочника линейно и укладывается
+# в доли миллисекунды. Индекс строится один раз на версию набора данных.
+
+import heapq
+import re
+import threading
+from bisect import bisect_left
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import models_reference, reference_cache
+
+# Сколько результатов отдавать за раз (Telegram принимает не больше 50)
+DEFAULT_LIMIT = 20
+
+_TOKEN_RE = re.compile(r"\w+")
+
+_lock = threading.Lock()
+_index: Optional[Tuple[int, "NameIndex"]] = None
+
+
+class SearchEntry(NamedTuple):
+    kind: str  # spell | item | creature
+    id: int
+    name: str
+    summary: str  # короткое описание для подсказки: "3 уровень, Воплощение"
+    source_url: Optional[str]
+
+
+def normalize(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize(text))
+
+
+class NameIndex:
+    """Отсортированные слова названий и позиции записей, в которых они встречаются"""
+
+    def __init__(self, entries: List[SearchEntry]):
+        # Записи хранятся в порядке выдачи (короткие названия раньше, затем по
+        # алфавиту), поэтому позиция записи сама по себе - ключ сортировки
+        self.entries = sorted(entries, key=lambda entry: (len(entry.name), normalize(entry.name)))
+        self._entry_tokens = [tokenize(entry.name) for entry in self.entries]
+
+        postings: Dict[str, List[int]] = {}
+        for pos, tokens in enumerate(self._entry_tokens):
+            for token in set(tokens):
+                postings.setdefault(token, []).append(pos)
+
+        self._tokens = sorted(postings)
+        self._postings = [postings[token] for token in self._tokens]
+
+        # Полные названия - чтобы поднять наверх те, что начинаются с запроса
+        by_name = sorted((normalize(entry.name), pos) for pos, entry in enumerate(self.entries))
+        self._names = [name for name, _ in by_name]
+        self._name_positions = [pos for _, pos in by_name]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _prefix_positions(self, prefix: str) -> set:
+        """Записи, в названии которых есть слово, начинающееся с prefix"""
+        start = bisect_left(self._tokens, prefix)
+        end = bisect_left(self._tokens, prefix + "\uffff", start)
+        positions = set()
+        for postings in self._postings[start:end]:
+            positions.update(postings)
+        return positions
+
+    def _name_prefix_positions(self, prefix: str) -> List[int]:
+        """Записи, название которых целиком начинается с prefix"""
+        start = bisect_left(self._names, prefix)
+        end = bisect_left(self._names, prefix + "\uffff", start)
+        return self._name_positions[start:end]
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT, offset: int = 0) -> List[SearchEntry]:
+        """
+        Записи, у которых каждое слово запроса - префикс какого-то слова названия.
+        Сначала названия, начинающиеся с запроса, затем короткие, затем по алфавиту.
+        """
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+
+        # Начинаем с самого длинного (самого избирательного) слова
+        query_tokens.sort(key=len, reverse=True)
+        candidates = self._prefix_positions(query_tokens[0])
+        for token in query_tokens[1:]:
+            if not candidates:
+                break
+            candidates &= self._prefix_positions(token)
+
+        wanted = offset + limit
+        head = sorted(
+            pos for pos in self._name_prefix_positions(normalize(query).strip())
+            if pos in candidates
+        )[:wanted]
+        if len(head) < wanted:
+            candidates.difference_update(head)
+            head += heapq.nsmallest(wanted - len(head), candidates)
+        return [self.entries[pos] for pos in head[offset:]]
+
+
+def _spell_summary(level: Optional[int], school: Optional[str]) -> str:
+    level_text = "Заговор" if level == 0 else f"{level} уровень"
+    return f"{level_text}, {school}" if school else level_text
+
+
+def _join(*parts: Optional[str]) -> str:
+    return ", ".join(part for part in parts if part)
+
+
+def _build_index(db: Session) -> NameIndex:
+    entries: List[SearchEntry] = []
+
+    spells = db.query(
+        models_reference.ReferenceSpell.id,
+        models_reference.ReferenceSpell.name,
+        models_reference.ReferenceSpell.level,
+        models_reference.ReferenceSpell.school,
+        models_reference.ReferenceSpell.source_url
+    ).all()
+    entries.extend(
+        SearchEntry("spell", r.id, r.name, _spell_summary(r.level, r.school), r.source_url)
+        for r in spells
+    )
+
+    items = db.query(
+        models_reference.ReferenceItem.id,
+        models_reference.ReferenceItem.name,
+        models_reference.ReferenceItem.category,
+        models_reference.ReferenceItem.cost,
+        models_reference.ReferenceItem.source_url
+    ).all()
+    entries.extend(
+        SearchEntry("item", r.id, r.name, _join(r.category, r.cost), r.source_url)
+        for r in items
+    )
+
+    creatures = db.query(
+        models_reference.ReferenceCreature.id,
+        models_reference.ReferenceCreature.name,
+        models_reference.ReferenceCreature.size,
+        models_reference.ReferenceCreature.creature_type,
+        models_reference.ReferenceCreature.cr,
+        models_reference.ReferenceCreature.source_url
+    ).all()
+    entries.extend(
+        SearchEntry(
+            "creature", r.id, r.name,
+            _join(" ".join(part for part in (r.size, r.creature_type) if part), f"ПО {r.cr}" if r.cr else None),
+            r.source_url,
+        )
+        for r in creatures
+    )
+
+    return NameIndex(entries)
+
+
+def get_index(db: Session) -> NameIndex:
+    """Индекс названий для текущей версии справочника (перестраивается после загрузки)"""
+    global _index
+
+    version = reference_cache.get_dataset_version(db)
+    with _lock:
+        if _index and _index[0] == version:
+            return _index[1]
+
+    index = _build_index(db)
+    with _lock:
+        _index = (version, index)
+    return index
+
+
+def search(db: Session, query: str, limit: int = DEFAULT_LIMIT, offset: int = 0) -> List[SearchEntry]:
+    return get_index(db).search(query, limit=limit, offset=offset)
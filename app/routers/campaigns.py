@@ -0,0 +1,57 @@
+# app/routers/campaigns.py
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List
+
+from ..database import get_db
+from ..deps import get_current_tg_user_id
+from .. import crud, crud_multiplayer, schemas
+
+router = APIRouter(prefix="/campaigns", tags=["campaigns"])
+
+
+def _require_gm(db: Session, campaign_id: int, tg_user_id: int):
+    if crud.get_campaign(db, campaign_id) is None:
+        raise HTTPException(status_code=404, detail="Кампании не найдены")
+    if not crud_multiplayer.is_campaign_gm(db, campaign_id, tg_user_id):
+        raise HTTPException(status_code=403, detail="Только GM может управлять библиотекой врагов")
+
+
+# ----- БИБЛИОТЕКА ВРАГОВ -----
+
+@router.get("/{campaign_id}/enemies", response_model=List[schemas.EnemyTemplate])
+def list_enemies(
+    campaign_id: int,
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+):
+    """Шаблоны врагов кампании (GM only)"""
+    _require_gm(db, campaign_id, tg_user_id)
+    return [crud.enemy_template_to_schema(t) for t in crud.get_enemy_templates(db, campaign_id)]
+
+
+@router.post("/{campaign_id}/enemies", response_model=schemas.EnemyTemplate)
+def create_enemy(
+    campaign_id: int,
+    data: schemas.EnemyTemplateCreate,
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+):
+    """Добавить врага в библиотеку кампании (GM only)"""
+    _require_gm(db, campaign_id, tg_user_id)
+    template = crud.create_enemy_template(db, campaign_id, data)
+    return crud.enemy_template_to_schema(template)
+
+
+@router.delete("/{campaign_id}/enemies/{enemy_id}")
+def delete_enemy(
+    campaign_id: int,
+    enemy_id: int,
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+):
+    """Удалить врага из библиотеки кампании (GM only)"""
+    _require_gm(db, campaign_id, tg_user_id)
+    if not crud.delete_enemy_template(db, campaign_id, enemy_id):
+        raise HTTPException(status_code=404, detail="Враг не найден")
+    return {"status": "deleted"}
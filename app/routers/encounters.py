@@ -0,0 +1,46 @@
+# app/routers/encounters.py
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..deps import get_current_tg_user_id
+from .. import crud, crud_multiplayer, models, reference_mobs, schemas
+
+router = APIRouter(prefix="/encounters", tags=["encounters"])
+
+# Максимум копий существа за один запрос - как для шаблонов мобов
+MAX_SPAWN_COUNT = schemas.MAX_MOB_COUNT
+
+
+# ----- СУЩЕСТВА ИЗ БЕСТИАРИЯ -----
+
+@router.post("/{encounter_id}/spawn_creature", response_model=schemas.SpawnCreatureResponse)
+def spawn_creature(
+    encounter_id: int,
+    data: schemas.SpawnCreatureRequest,
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+):
+    """
+    Добавить в активную схватку count копий существа из бестиария (GM only).
+    Хиты, КД, инициатива и атаки берутся из статблока; hp=rolled - хиты
+    каждой копии бросаются по костям хитов.
+    """
+    if not 1 <= data.count <= MAX_SPAWN_COUNT:
+        raise HTTPException(status_code=400, detail=f"Количество должно быть от 1 до {MAX_SPAWN_COUNT}")
+
+    encounter = db.query(models.Encounter).filter(models.Encounter.id == encounter_id).first()
+    if encounter is None:
+        raise HTTPException(status_code=404, detail="Encounter not found")
+    if not crud_multiplayer.is_campaign_gm(db, encounter.campaign_id, tg_user_id):
+        raise HTTPException(status_code=403, detail="Только GM может добавлять участников")
+    if encounter.status != models.EncounterStatus.active or encounter.state is None:
+        raise HTTPException(status_code=409, detail="Схватка не активна")
+
+    template = reference_mobs.get_template(db, data.creature_id)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Существо не найдено или у него нет хитов")
+
+    hp = reference_mobs.spawn_hp(template, data.count, data.hp == schemas.SpawnHpMode.rolled)
+    crud.spawn_mobs_in_active_encounter(db, encounter_id, template, hp)
+    return schemas.SpawnCreatureResponse(status="ok", template=template, hp=hp)
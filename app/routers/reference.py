@@ -1,15 +1,200 @@
 # app/routers/reference.py
-from fastapi import APIRouter, Depends, HTTPException, Query
+import gzip
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Callable, Optional, List, Tuple
 
 from ..database import get_db
 from ..deps import get_current_tg_user_id
-from .. import crud_reference, schemas_reference
+from .. import crud_reference, schemas_reference, reference_cache, reference_facets
 
 router = APIRouter(prefix="/reference", tags=["reference"])
 
 
+_spell_adapter = TypeAdapter(schemas_reference.Spell)
+_spell_list_adapter = TypeAdapter(List[schemas_reference.Spell])
+_item_adapter = TypeAdapter(schemas_reference.Item)
+_item_list_adapter = TypeAdapter(List[schemas_reference.Item])
+_creature_adapter = TypeAdapter(schemas_reference.Creature)
+_creature_list_adapter = TypeAdapter(List[schemas_reference.Creature])
+_facets_adapter = TypeAdapter(schemas_reference.FacetCounts)
+_spell_batch_adapter = TypeAdapter(List[schemas_reference.SpellBatchEntry])
+_item_batch_adapter = TypeAdapter(List[schemas_reference.ItemBatchEntry])
+_creature_batch_adapter = TypeAdapter(List[schemas_reference.CreatureBatchEntry])
+_mixed_batch_adapter = TypeAdapter(List[schemas_reference.MixedBatchEntry])
+
+# Максимальное количество записей в одном batch-запросе
+MAX_BATCH_SIZE = 100
+
+# Тип записи -> (загрузчик, схема)
+_BATCH_LOADERS = {
+    "spell": (crud_reference.get_spells_by_ids, schemas_reference.Spell),
+    "item": (crud_reference.get_items_by_ids, schemas_reference.Item),
+    "creature": (crud_reference.get_creatures_by_ids, schemas_reference.Creature),
+}
+
+
+def _cached_response(
+    db: Session,
+    if_none_match: Optional[str],
+    key: tuple,
+    build: Callable[[], bytes],
+) -> Response:
+    """
+    Ответ справочника с ETag/Cache-Control.
+    Повторный запрос той же версии - 304 или готовые байты из памяти.
+    """
+    version, headers, not_modified = _version_headers(db, if_none_match)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+
+    body = reference_cache.get_or_build(key + (version,), build)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _facet_counts_json(
+    db: Session,
+    kind: str,
+    q: str,
+    filters: dict,
+) -> bytes:
+    index = reference_facets.get_index(db, kind)
+    total, facets = index.counts(q, filters)
+    return _facets_adapter.dump_json(
+        schemas_reference.FacetCounts(total=total, facets=facets)
+    )
+
+
+def _parse_ids(raw: str) -> List[int]:
+    """Разобрать список ID вида "1,2,3" """
+    try:
+        ids = [int(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ID должны быть числами через запятую")
+    if not ids:
+        raise HTTPException(status_code=400, detail="Не указаны ID")
+    if len(ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Не больше {MAX_BATCH_SIZE} ID за запрос")
+    return ids
+
+
+def _parse_refs(raw: str) -> List[Tuple[str, int]]:
+    """Разобрать список ссылок вида "spell:1,creature:7" """
+    refs = []
+    for part in raw.split(","):
+        if not part.strip():
+            continue
+        ref_type, _, ref_id = part.strip().partition(":")
+        if ref_type not in _BATCH_LOADERS or not ref_id.strip().isdigit():
+            raise HTTPException(
+                status_code=400,
+                detail=f"Неверная ссылка «{part.strip()}», ожидается spell:ID, item:ID или creature:ID"
+            )
+        refs.append((ref_type, int(ref_id)))
+    if not refs:
+        raise HTTPException(status_code=400, detail="Не указаны ID")
+    if len(refs) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Не больше {MAX_BATCH_SIZE} ID за запрос")
+    return refs
+
+
+def _batch_entries(db: Session, ref_type: str, ids: List[int]) -> List[dict]:
+    """Записи одного типа в порядке запроса, с found=False для отсутствующих"""
+    loader, schema = _BATCH_LOADERS[ref_type]
+    found = loader(db, ids)
+    return [
+        {
+            "id": ref_id,
+            "found": ref_id in found,
+            "data": schema.model_validate(found[ref_id]) if ref_id in found else None,
+        }
+        for ref_id in ids
+    ]
+
+
+def _version_headers(
+    db: Session, if_none_match: Optional[str], encoding: Optional[str] = None
+) -> Tuple[int, dict, bool]:
+    """Версия данных, заголовки кэширования и признак совпадения If-None-Match"""
+    version = reference_cache.get_dataset_version(db)
+    etag = reference_cache.make_etag(version, encoding)
+    headers = {"ETag": etag, "Cache-Control": reference_cache.CACHE_CONTROL}
+    return version, headers, reference_cache.etag_matches(if_none_match, etag)
+
+
+# ============ CLIENT BUNDLE ============
+
+@router.get("/bundle", response_model=schemas_reference.ReferenceBundle)
+async def get_reference_bundle(
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
+    accept_encoding: Optional[str] = Header(default=None),
+):
+    """
+    Весь индекс названий справочника одним сжатым ответом.
+    Клиент ищет по нему локально и запрашивает только детальные карточки.
+    """
+    use_gzip = bool(accept_encoding) and "gzip" in accept_encoding.lower()
+    version, headers, not_modified = _version_headers(db, if_none_match, "gz" if use_gzip else None)
+    headers["Vary"] = "Accept-Encoding"
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+
+    def build() -> bytes:
+        return crud_reference.get_reference_bundle(db, version).model_dump_json().encode()
+
+    # Сериализуем и сжимаем один раз на версию, дальше отдаём готовые байты
+    body = reference_cache.get_or_build(("bundle", version), build)
+    if use_gzip:
+        body = reference_cache.get_or_build(
+            ("bundle", version, "gzip"),
+            lambda: gzip.compress(body, compresslevel=9, mtime=0),
+        )
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# ============ BATCH ============
+
+@router.get("/batch", response_model=List[schemas_reference.MixedBatchEntry])
+async def get_mixed_batch(
+    refs: str = Query(..., description="Ссылки через запятую: spell:1,item:4,creature:7"),
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """Записи разных типов за один запрос: по одному IN-запросу на таблицу, в порядке запроса"""
+    parsed = _parse_refs(refs)
+
+    def build() -> bytes:
+        by_type: dict = {}
+        for ref_type, ref_id in parsed:
+            by_type.setdefault(ref_type, []).append(ref_id)
+
+        found = {}
+        for ref_type, ids in by_type.items():
+            loader, schema = _BATCH_LOADERS[ref_type]
+            for ref_id, row in loader(db, ids).items():
+                found[(ref_type, ref_id)] = schema.model_validate(row)
+
+        entries = [
+            {
+                "type": ref_type,
+                "id": ref_id,
+                "found": (ref_type, ref_id) in found,
+                "data": found.get((ref_type, ref_id)),
+            }
+            for ref_type, ref_id in parsed
+        ]
+        return _mixed_batch_adapter.dump_json(_mixed_batch_adapter.validate_python(entries))
+
+    return _cached_response(db, if_none_match, ("batch", tuple(parsed)), build)
+
+
 # ============ AUTOCOMPLETE / SUGGESTIONS ============
 
 @router.get("/search/suggestions", response_model=schemas_reference.AllSuggestions)
@@ -18,13 +203,17 @@ async def get_search_suggestions(
     limit: int = Query(5, le=10, description="Количество результатов на каждый тип"),
     db: Session = Depends(get_db),
     tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
 ):
     """
     Быстрый поиск для автодополнения.
     Возвращает подсказки по заклинаниям, предметам и существам.
     """
-    suggestions = crud_reference.get_all_suggestions(db, q, limit_per_type=limit)
-    return suggestions
+    def build() -> bytes:
+        suggestions = crud_reference.get_all_suggestions(db, q, limit_per_type=limit)
+        return suggestions.model_dump_json().encode()
+
+    return _cached_response(db, if_none_match, ("suggestions", q, limit), build)
 
 
 # ============ SPELLS ============
@@ -37,10 +226,93 @@ async def search_spells(
     limit: int = Query(20, le=100),
     db: Session = Depends(get_db),
     tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
 ):
     """Поиск заклинаний с фильтрами"""
-    spells = crud_reference.search_spells(db, q, level, school, limit)
-    return spells
+    def build() -> bytes:
+        spells = crud_reference.search_spells(db, q, level, school, limit)
+        return _spell_list_adapter.dump_json(
+            _spell_list_adapter.validate_python(spells, from_attributes=True)
+        )
+
+    return _cached_response(
+        db, if_none_match, ("spells/search", q, level, school, limit), build
+    )
+
+
+@router.get("/spells/batch", response_model=List[schemas_reference.SpellBatchEntry])
+async def get_spells_batch(
+    ids: str = Query(..., description="ID через запятую: 1,2,3"),
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """Несколько заклинаний за один запрос, в порядке ID"""
+    parsed = _parse_ids(ids)
+
+    def build() -> bytes:
+        entries = _batch_entries(db, "spell", parsed)
+        return _spell_batch_adapter.dump_json(_spell_batch_adapter.validate_python(entries))
+
+    return _cached_response(db, if_none_match, ("spells/batch", tuple(parsed)), build)
+
+
+@router.get("/spells/by-class", response_model=List[schemas_reference.Spell])
+async def list_spells_by_class(
+    class_name: Optional[str] = Query(None, alias="class", description="Класс, например «Волшебник»"),
+    subclass: Optional[str] = Query(None, description="Подкласс"),
+    min_level: int = Query(0, ge=0, le=9, description="Минимальный уровень"),
+    max_level: int = Query(9, ge=0, le=9, description="Максимальный уровень"),
+    limit: int = Query(100, le=500),
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """Список заклинаний класса/подкласса по диапазону уровней (сортировка: уровень, название)"""
+    if not class_name and not subclass:
+        raise HTTPException(status_code=400, detail="Укажите класс или подкласс")
+
+    def build() -> bytes:
+        spells = crud_reference.get_spells_by_class(
+            db, class_name, subclass, min_level, max_level, limit
+        )
+        return _spell_list_adapter.dump_json(
+            _spell_list_adapter.validate_python(spells, from_attributes=True)
+        )
+
+    return _cached_response(
+        db, if_none_match,
+        ("spells/by-class", class_name, subclass, min_level, max_level, limit), build
+    )
+
+
+@router.get("/spells/facets", response_model=schemas_reference.FacetCounts)
+async def get_spell_facets(
+    q: str = Query("", description="Поиск по названию"),
+    level: Optional[int] = Query(None, ge=0, le=9, description="Уровень заклинания"),
+    school: Optional[str] = Query(None, description="Школа магии"),
+    class_name: Optional[str] = Query(None, alias="class", description="Класс"),
+    concentration: Optional[bool] = Query(None, description="Концентрация"),
+    ritual: Optional[bool] = Query(None, description="Ритуал"),
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """Счётчики по уровням, школам, классам, концентрации и ритуалам для текущего запроса"""
+    filters = {
+        "level": str(level) if level is not None else None,
+        "school": school,
+        "class": class_name,
+        "concentration": None if concentration is None else str(concentration).lower(),
+        "ritual": None if ritual is None else str(ritual).lower(),
+    }
+
+    def build() -> bytes:
+        return _facet_counts_json(db, "spells", q, filters)
+
+    return _cached_response(
+        db, if_none_match, ("spells/facets", q, tuple(filters.values())), build
+    )
 
 
 @router.get("/spells/{spell_id}", response_model=schemas_reference.Spell)
@@ -48,12 +320,18 @@ async def get_spell(
     spell_id: int,
     db: Session = Depends(get_db),
     tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
 ):
     """Получить полную информацию о заклинании"""
-    spell = crud_reference.get_spell_by_id(db, spell_id)
-    if not spell:
-        raise HTTPException(status_code=404, detail="Заклинание не найдено")
-    return spell
+    def build() -> bytes:
+        spell = crud_reference.get_spell_by_id(db, spell_id)
+        if not spell:
+            raise HTTPException(status_code=404, detail="Заклинание не найдено")
+        return _spell_adapter.dump_json(
+            _spell_adapter.validate_python(spell, from_attributes=True)
+        )
+
+    return _cached_response(db, if_none_match, ("spells", spell_id), build)
 
 
 # ============ ITEMS ============
@@ -65,10 +343,35 @@ async def search_items(
     limit: int = Query(20, le=100),
     db: Session = Depends(get_db),
     tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
 ):
     """Поиск предметов с фильтрами"""
-    items = crud_reference.search_items(db, q, category, limit)
-    return items
+    def build() -> bytes:
+        items = crud_reference.search_items(db, q, category, limit)
+        return _item_list_adapter.dump_json(
+            _item_list_adapter.validate_python(items, from_attributes=True)
+        )
+
+    return _cached_response(
+        db, if_none_match, ("items/search", q, category, limit), build
+    )
+
+
+@router.get("/items/batch", response_model=List[schemas_reference.ItemBatchEntry])
+async def get_items_batch(
+    ids: str = Query(..., description="ID через запятую: 1,2,3"),
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """Несколько предметов за один запрос, в порядке ID"""
+    parsed = _parse_ids(ids)
+
+    def build() -> bytes:
+        entries = _batch_entries(db, "item", parsed)
+        return _item_batch_adapter.dump_json(_item_batch_adapter.validate_python(entries))
+
+    return _cached_response(db, if_none_match, ("items/batch", tuple(parsed)), build)
 
 
 @router.get("/items/{item_id}", response_model=schemas_reference.Item)
@@ -76,12 +379,18 @@ async def get_item(
     item_id: int,
     db: Session = Depends(get_db),
     tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
 ):
     """Получить полную информацию о предмете"""
-    item = crud_reference.get_item_by_id(db, item_id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Предмет не найден")
-    return item
+    def build() -> bytes:
+        item = crud_reference.get_item_by_id(db, item_id)
+        if not item:
+            raise HTTPException(status_code=404, detail="Предмет не найден")
+        return _item_adapter.dump_json(
+            _item_adapter.validate_python(item, from_attributes=True)
+        )
+
+    return _cached_response(db, if_none_match, ("items", item_id), build)
 
 
 # ============ CREATURES ============
@@ -94,10 +403,55 @@ async def search_creatures(
     limit: int = Query(20, le=100),
     db: Session = Depends(get_db),
     tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
 ):
     """Поиск существ с фильтрами"""
-    creatures = crud_reference.search_creatures(db, q, cr, creature_type, limit)
-    return creatures
+    def build() -> bytes:
+        creatures = crud_reference.search_creatures(db, q, cr, creature_type, limit)
+        return _creature_list_adapter.dump_json(
+            _creature_list_adapter.validate_python(creatures, from_attributes=True)
+        )
+
+    return _cached_response(
+        db, if_none_match, ("creatures/search", q, cr, creature_type, limit), build
+    )
+
+
+@router.get("/creatures/batch", response_model=List[schemas_reference.CreatureBatchEntry])
+async def get_creatures_batch(
+    ids: str = Query(..., description="ID через запятую: 1,2,3"),
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """Несколько существ за один запрос, в порядке ID"""
+    parsed = _parse_ids(ids)
+
+    def build() -> bytes:
+        entries = _batch_entries(db, "creature", parsed)
+        return _creature_batch_adapter.dump_json(_creature_batch_adapter.validate_python(entries))
+
+    return _cached_response(db, if_none_match, ("creatures/batch", tuple(parsed)), build)
+
+
+@router.get("/creatures/facets", response_model=schemas_reference.FacetCounts)
+async def get_creature_facets(
+    q: str = Query("", description="Поиск по названию"),
+    cr: Optional[str] = Query(None, description="Показатель опасности"),
+    creature_type: Optional[str] = Query(None, description="Тип существа"),
+    db: Session = Depends(get_db),
+    tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """Счётчики по CR и типам существ для текущего запроса"""
+    filters = {"cr": cr, "creature_type": creature_type}
+
+    def build() -> bytes:
+        return _facet_counts_json(db, "creatures", q, filters)
+
+    return _cached_response(
+        db, if_none_match, ("creatures/facets", q, cr, creature_type), build
+    )
 
 
 @router.get("/creatures/{creature_id}", response_model=schemas_reference.Creature)
@@ -105,9 +459,15 @@ async def get_creature(
     creature_id: int,
     db: Session = Depends(get_db),
     tg_user_id: int = Depends(get_current_tg_user_id),
+    if_none_match: Optional[str] = Header(default=None),
 ):
     """Получить полную информацию о существе"""
-    creature = crud_reference.get_creature_by_id(db, creature_id)
-    if not creature:
-        raise HTTPException(status_code=404, detail="Существо не найдено")
-    return creature
+    def build() -> bytes:
+        creature = crud_reference.get_creature_by_id(db, creature_id)
+        if not creature:
+            raise HTTPException(status_code=404, detail="Существо не найдено")
+        return _creature_adapter.dump_json(
+            _creature_adapter.validate_python(creature, from_attributes=True)
+        )
+
+    return _cached_response(db, if_none_match, ("creatures", creature_id), build)
@@ -1,5 +1,5 @@
 # app/schemas.py
-from pydantic import BaseModel, ConfigDict
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field, computed_field
 from typing import Optional, List
 from enum import Enum
 from datetime import datetime
@@ -124,6 +124,7 @@ class CharacterUpdate(BaseModel):
 class Character(CharacterBase):
     id: int
     campaign_id: int
+    user_id: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -227,6 +228,21 @@ class EncounterStateObserver(EncounterStateBase):
     participants: List[EncounterParticipantObserver]
 
 
+class ObserverDashboardEncounter(BaseModel):
+    """Активная схватка на главном экране наблюдателя"""
+    encounter_id: int
+    encounter_name: Optional[str] = None
+    campaign_id: int
+    campaign_name: str
+    round: int
+    current_index: int
+    participants_count: int
+    # Чей сейчас ход (None, если участников нет)
+    current_participant_id: Optional[int] = None
+    current_participant_name: Optional[str] = None
+    current_is_enemy: Optional[bool] = None
+
+
 class EncounterMyItem(BaseModel):
     id: int
     name: Optional[str] = None
@@ -286,27 +302,85 @@ class EncounterParticipantsCreate(BaseModel):
 
 # ----- Шаблоны мобов для добавления в активную схватку -----
 
-class MobTemplate(BaseModel):
-    """Шаблон моба для добавления в схватку.
-    ГМ передаёт характеристики одного моба и количество.
-    """
+# Максимум копий одного моба за раз
+MAX_MOB_COUNT = 100
+
+
+class MobStats(BaseModel):
+    """Характеристики одного моба"""
     name: str
     max_hp: int
     ac: int
-    initiative_mod: int
+    # библиотека врагов на фронте присылает initiative_modifier
+    initiative_mod: int = Field(validation_alias=AliasChoices("initiative_mod", "initiative_modifier"))
     attacks: Optional[List[Attack]] = None
-    count: int = 1  # количество мобов этого типа
+
+
+class MobTemplate(MobStats):
+    """Шаблон моба для добавления в схватку.
+    ГМ передаёт характеристики одного моба и количество.
+    """
+    count: int = Field(1, ge=1, le=MAX_MOB_COUNT)  # количество мобов этого типа
+
+
+class LibraryEnemyInput(BaseModel):
+    """Враг из библиотеки кампании: достаточно id шаблона и количества"""
+    enemy_id: int
+    count: int = Field(1, ge=1, le=MAX_MOB_COUNT)
 
 
 class AddParticipantsToActiveEncounter(BaseModel):
     """Схема для добавления новых участников во время боя.
-    Использует шаблоны вместо библиотеки врагов.
+    Мобы задаются шаблонами целиком или ссылкой на библиотеку врагов кампании.
     """
     from_templates: List[MobTemplate] = []
+    from_library: List[LibraryEnemyInput] = []
     unique_monsters: List[UniqueMonsterInput] = []
     group_monsters: List[GroupMonsterInput] = []
 
 
+# ----- Библиотека врагов кампании -----
+
+class EnemyTemplateCreate(MobStats):
+    pass
+
+
+class EnemyTemplate(MobStats):
+    id: int
+    campaign_id: int
+
+    @computed_field
+    @property
+    def initiative_modifier(self) -> int:
+        # имя поля, которое читает библиотека врагов на фронте
+        return self.initiative_mod
+
+
+# ----- Существа бестиария в схватке -----
+
+class SpawnHpMode(str, Enum):
+    average = "average"  # среднее из статблока
+    rolled = "rolled"  # бросок костей хитов, у каждой копии свой
+
+
+class CreatureTemplate(MobStats):
+    """Существо справочника, переведённое в шаблон моба"""
+    creature_id: int
+    hp_dice: Optional[str] = None  # "20d10+80"
+
+
+class SpawnCreatureRequest(BaseModel):
+    creature_id: int
+    count: int = 1
+    hp: SpawnHpMode = SpawnHpMode.average
+
+
+class SpawnCreatureResponse(BaseModel):
+    status: str
+    template: CreatureTemplate
+    hp: List[int]  # max_hp каждой добавленной копии
+
+
 class EncounterStartRequest(BaseModel):
     as_active: bool = True  # пока просто флаг, можно не менять
 
@@ -318,3 +392,30 @@ class NextTurnRequest(BaseModel):
 
 class HpChangeRequest(BaseModel):
     delta: int  # отрицательное значение = урон, положительное = хил
+
+
+# ----- Броски костей -----
+
+class DiceRollRequest(BaseModel):
+    expression: str  # "4d6kh3+2", "2d20kl1", "1к20+5"
+    times: int = 1  # сколько раз бросить выражение
+
+
+class DiceTermRoll(BaseModel):
+    notation: str  # "4d6kh3"
+    values: List[int]  # все выпавшие кости
+    kept: List[int]  # учтённые в сумме
+    subtotal: int
+
+
+class DiceRollResult(BaseModel):
+    total: int
+    dice: List[DiceTermRoll]
+
+
+class DiceRollResponse(BaseModel):
+    expression: str  # выражение в нормальной записи
+    min: int
+    max: int
+    average: float
+    rolls: List[DiceRollResult]
@@ -1,6 +1,6 @@
 # app/schemas_reference.py
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union
 from datetime import datetime
 
 
@@ -144,3 +144,48 @@ class AllSuggestions(BaseModel):
     spells: List[SpellSuggestion]
     items: List[ItemSuggestion]
     creatures: List[CreatureSuggestion]
+
+
+# ============ REFERENCE BUNDLE ============
+
+class ReferenceBundle(BaseModel):
+    """Компактный индекс всего справочника для поиска на клиенте"""
+    version: int
+    spells: List[SpellSuggestion]
+    items: List[ItemSuggestion]
+    creatures: List[CreatureSuggestion]
+
+
+# ============ FACETS ============
+
+class FacetCounts(BaseModel):
+    """Количество результатов и счётчики по значениям каждого фасета"""
+    total: int
+    facets: Dict[str, Dict[str, int]]
+
+
+# ============ BATCH ============
+
+class SpellBatchEntry(BaseModel):
+    id: int
+    found: bool
+    data: Optional[Spell] = None
+
+
+class ItemBatchEntry(BaseModel):
+    id: int
+    found: bool
+    data: Optional[Item] = None
+
+
+class CreatureBatchEntry(BaseModel):
+    id: int
+    found: bool
+    data: Optional[Creature] = None
+
+
+class MixedBatchEntry(BaseModel):
+    type: str  # spell | item | creature
+    id: int
+    found: bool
+    data: Optional[Union[Spell, Item, Creature]] = None
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# benchmarks/bench_bot_webhook.py
+"""
+Локальная проверка webhook-режима бота: синтетические апдейты отправляются
+POST-запросами в aiohttp-приложение из bot.create_webhook_app, как это
+делает Telegram. Запросы к Bot API не уходят в сеть - их перехватывает
+фейковая сессия и отвечает заготовками.
+
+Проверяется, что:
+    - запрос без секрета или с чужим секретом отклоняется (401);
+    - каждый апдейт получает ровно один ответ бота.
+
+Печатается пропускная способность обработчиков (апдейтов/сек) и задержки.
+
+    python benchmarks/bench_bot_webhook.py
+    python benchmarks/bench_bot_webhook.py --updates 5000 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+# bot.py требует токен при импорте; формат "<id>:<секрет>" проверяет aiogram
+os.environ.setdefault("BOT_TOKEN", "123456:bench-token")
+
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message
+
+import bot as bot_module
+
+SECRET = "bench-secret"
+PATH = "/telegram/webhook"
+
+# Сообщения, на которые у бота есть обработчики
+TEXTS = [
+    "/start",
+    "/start invite_abcdef",
+    "/roll",
+    "/roll 4d6kh3+2",
+    "/roll 40d6",
+    "/info",
+    "/reference",
+    bot_module.BTN_ROLL,
+    bot_module.BTN_INFO,
+    bot_module.BTN_CRIT,
+    bot_module.BTN_REFERENCE,
+]
+
+
+class FakeSession(BaseSession):
+    """Сессия Bot API без сети: считает вызовы и отвечает заготовками"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = {}
+
+    async def make_request(self, bot, method, timeout=None):
+        name = type(method).__name__
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if isinstance(method, SendMessage):
+            return _message(method.chat_id, method.text)
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def _message(chat_id: int, text: str) -> Message:
+    return Message(
+        message_id=1,
+        date=int(time.time()),
+        chat=Chat(id=chat_id, type="private"),
+        text=text,
+    )
+
+
+def make_update(update_id: int, text: str) -> dict:
+    user_id = 10_000 + update_id % 500
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+
+async def run(updates: int, concurrency: int) -> bool:
+    session = FakeSession()
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    dp = bot_module.create_dispatcher()
+    # handle_in_background=False: ответ на POST приходит после обработчика,
+    # поэтому задержка запроса - это время обработки апдейта
+    app = bot_module.create_webhook_app(
+        bot, dp, secret_token=SECRET, path=PATH,
+        handle_in_background=False, register_webhook=False,
+    )
+
+    checks = {}
+    latencies = []
+
+    async with TestClient(TestServer(app)) as client:
+        # Секрет
+        response = await client.post(PATH, json=make_update(0, "/roll"))
+        checks["без секрета - 401"] = response.status == 401
+        response = await client.post(
+            PATH, json=make_update(0, "/roll"),
+            headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"},
+        )
+        checks["чужой секрет - 401"] = response.status == 401
+
+        queue = asyncio.Queue()
+        for i in range(1, updates + 1):
+            queue.put_nowait(make_update(i, TEXTS[i % len(TEXTS)]))
+        statuses = {}
+
+        async def worker():
+            while not queue.empty():
+                update = queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.post(
+                    PATH, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+                )
+                await response.read()
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    await bot.session.close()
+
+    sent = session.calls.get("SendMessage", 0)
+    checks["все апдейты приняты (200)"] = statuses.get(200, 0) == updates
+    checks["на каждый апдейт один ответ"] = sent == updates
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    print(f"\n🤖 {updates} апдейтов, одновременно {concurrency}: {elapsed:.2f} сек, "
+          f"{updates / elapsed:.0f} апдейтов/сек")
+    print(f"   задержка: медиана {statistics.median(latencies) * 1000:.1f} мс, "
+          f"p95 {p95 * 1000:.1f} мс")
+    print(f"   ответы: {statuses}, вызовы Bot API: {session.calls}")
+    for name, ok in checks.items():
+        print(f"   {'✅' if ok else '❌'} {name}")
+    return all(checks.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность обработчиков бота в webhook-режиме")
+    parser.add_argument('--updates', type=int, default=2000, help="Сколько апдейтов отправить (по умолчанию 2000)")
+    parser.add_argument('--concurrency', type=int, default=50,
+                        help="Одновременных запросов (по умолчанию 50)")
+    args = parser.parse_args()
+
+    ok = asyncio.run(run(args.updates, args.concurrency))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# benchmarks/bench_ingest.py
+"""
+Бенчмарк загрузки справочника: разбор страниц и запись в БД.
+
+Страницы берутся из сохранённого корпуса (каталог или .zip, как для --replay),
+запись идёт во временную SQLite-базу, рабочая dnd.db не трогается.
+
+Стадии:
+    read      - чтение страниц из корпуса (DndSuParser.fetch_page)
+    extract   - разбор HTML без чтения
+    parse     - parse_spell / parse_item / parse_creature целиком, по видам
+    upsert    - пакетная запись новых записей (ReferenceSink)
+    unchanged - повторная запись тех же записей (пропуск по хэшу)
+
+Результаты печатаются и сохраняются в JSON (по умолчанию benchmarks/results/),
+чтобы сравнивать прогоны между коммитами:
+
+    python benchmarks/bench_ingest.py
+    python benchmarks/bench_ingest.py --corpus pages.zip --repeat 20 --parse-workers 3
+    python benchmarks/bench_ingest.py --compare benchmarks/results/<старый>.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.ingest.pipeline import KINDS
+from app.ingest.sink import UNCHANGED, ReferenceSink
+from app.parsers.dndsu_parser import DndSuParser
+from app.parsers.page_store import open_page_store
+
+# Страницы записей в корпусе: spells/10001.html, equipment/10001-longsword.html
+_CORPUS_PAGES = {
+    "spells": re.compile(r"^spells/(\d+)(?:-([\w-]+))?\.html$"),
+    "items": re.compile(r"^equipment/(\d+)-([\w-]+)\.html$"),
+    "creatures": re.compile(r"^bestiary/(\d+)-([\w-]+)\.html$"),
+}
+
+_PARSE_METHODS = {
+    "spells": "parse_spell",
+    "items": "parse_item",
+    "creatures": "parse_creature",
+}
+
+
+def corpus_entries(corpus: str) -> dict:
+    """Записи корпуса по видам: kind -> [(external_id, slug)]"""
+    store = open_page_store(corpus)
+    try:
+        keys = store.keys()
+    finally:
+        store.close()
+
+    entries = {kind: [] for kind in _CORPUS_PAGES}
+    for key in keys:
+        for kind, pattern in _CORPUS_PAGES.items():
+            match = pattern.match(key)
+            if match:
+                external_id = int(match.group(1))
+                entries[kind].append((external_id, match.group(2) or str(external_id)))
+                break
+    return entries
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS процесса в МБ (ru_maxrss: КБ в Linux, байты в macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds else 0.0
+
+
+async def bench_parser(corpus: str, entries: dict, repeat: int, parse_workers: int) -> dict:
+    """Стадии read / extract / parse по корпусу"""
+    parser = DndSuParser(replay_from=corpus, extract_workers=parse_workers)
+    stages = {}
+    records = {kind: [] for kind in entries}
+
+    try:
+        pages = []
+        for kind, targets in entries.items():
+            for external_id, slug in targets:
+                pages.append((kind, external_id, slug, parser.entry_url(kind, external_id, slug)))
+
+        # read: только чтение страниц
+        html_by_url = {}
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for _, _, _, url in pages:
+                html_by_url[url] = await parser.fetch_page(url)
+        elapsed = time.perf_counter() - started
+        stages["read"] = {"seconds": round(elapsed, 4), "pages": len(pages) * repeat,
+                          "pages_per_sec": _rate(len(pages) * repeat, elapsed)}
+
+        # extract: только разбор HTML
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for kind, external_id, slug, url in pages:
+                await parser.extract(KINDS[kind].extractor, html_by_url[url], external_id, slug, url)
+        elapsed = time.perf_counter() - started
+        stages["extract"] = {"seconds": round(elapsed, 4), "pages": len(pages) * repeat,
+                             "pages_per_sec": _rate(len(pages) * repeat, elapsed)}
+
+        # parse: публичные parse_* по видам (чтение + разбор)
+        for kind, targets in entries.items():
+            if not targets:
+                continue
+            method = getattr(parser, _PARSE_METHODS[kind])
+            started = time.perf_counter()
+            for i in range(repeat):
+                for external_id, slug in targets:
+                    record = await method(external_id, slug)
+                    if i == 0 and record:
+                        records[kind].append(record)
+            elapsed = time.perf_counter() - started
+            count = len(targets) * repeat
+            stages[f"parse_{kind}"] = {"seconds": round(elapsed, 4), "pages": count,
+                                       "pages_per_sec": _rate(count, elapsed)}
+    finally:
+        await parser.close()
+
+    return {"stages": stages, "records": records}
+
+
+def _replicate(records: list, copies: int) -> list:
+    """Копии записей с другими external_id/slug - чтобы запись в БД была заметной по объёму"""
+    result = []
+    for copy in range(copies):
+        for record in records:
+            clone = dict(record)
+            clone["external_id"] = record["external_id"] + copy * 1_000_000
+            clone["slug"] = f"{record['slug']}-{copy}"
+            result.append(clone)
+    return result
+
+
+def bench_upsert(records: dict, copies: int, batch_size: int) -> dict:
+    """Стадии upsert / unchanged во временной SQLite-базе"""
+    stages = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db")
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+
+        for stage in ("upsert", "unchanged"):
+            total = 0
+            written = 0
+            started = time.perf_counter()
+            for kind, kind_records in records.items():
+                if not kind_records:
+                    continue
+                with Session() as db:
+                    sink = ReferenceSink(db, KINDS[kind].model, batch_size=batch_size)
+                    for record in _replicate(kind_records, copies):
+                        total += 1
+                        if sink.check(record) != UNCHANGED:
+                            sink.add(record)
+                    sink.flush()
+                    written += sink.changed
+            elapsed = time.perf_counter() - started
+            stages[stage] = {"seconds": round(elapsed, 4), "records": total, "written": written,
+                             "records_per_sec": _rate(total, elapsed)}
+        engine.dispose()
+    return stages
+
+
+def print_results(results: dict, baseline: dict = None):
+    print(f"\n📊 Бенчмарк загрузки справочника ({results['git']}, {results['timestamp']})")
+    print(f"   корпус: {results['params']['corpus']}, страниц: {results['corpus_pages']}, "
+          f"повторов: {results['params']['repeat']}\n")
+
+    base_stages = baseline["stages"] if baseline else {}
+    for name, stage in results["stages"].items():
+        metric = "pages_per_sec" if "pages_per_sec" in stage else "records_per_sec"
+        unit = "стр/сек" if metric == "pages_per_sec" else "зап/сек"
+        line = f"  {name:<18} {stage['seconds']:>8.3f} с  {stage[metric]:>10.1f} {unit}"
+        old = base_stages.get(name, {}).get(metric)
+        if old:
+            line += f"  ({(stage[metric] - old) / old * 100:+.1f}% к {baseline['git']})"
+        print(line)
+
+    print(f"\n  Пиковый RSS: {results['peak_rss_mb']} МБ", end="")
+    if baseline:
+        print(f" (было {baseline['peak_rss_mb']} МБ)", end="")
+    print("\n")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора страниц и записи справочника в БД")
+    parser.add_argument(
+        '--corpus',
+        default=str(ROOT / "fixtures" / "dndsu"),
+        help="Каталог или .zip с сохранёнными страницами (по умолчанию fixtures/dndsu)"
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=50,
+        help="Сколько раз прогонять корпус через парсер (по умолчанию 50)"
+    )
+    parser.add_argument(
+        '--copies',
+        type=int,
+        default=200,
+        help="Сколько копий разобранных записей писать в БД (по умолчанию 200)"
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=100,
+        help="Размер пачки записи в БД (по умолчанию 100)"
+    )
+    parser.add_argument(
+        '--parse-workers',
+        type=int,
+        default=0,
+        help="Процессов для разбора HTML (по умолчанию 0 - без пула)"
+    )
+    parser.add_argument(
+        '--output',
+        help="Файл результатов (по умолчанию benchmarks/results/<время>-<коммит>.json)"
+    )
+    parser.add_argument(
+        '--compare',
+        metavar='JSON',
+        help="Сравнить с результатами прошлого прогона"
+    )
+    args = parser.parse_args()
+
+    entries = corpus_entries(args.corpus)
+    pages = sum(len(targets) for targets in entries.values())
+    if not pages:
+        print(f"❌ В корпусе {args.corpus} нет страниц записей")
+        sys.exit(1)
+
+    parsed = await bench_parser(args.corpus, entries, args.repeat, args.parse_workers)
+    stages = dict(parsed["stages"])
+    stages.update(bench_upsert(parsed["records"], args.copies, args.batch_size))
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "corpus": args.corpus,
+            "repeat": args.repeat,
+            "copies": args.copies,
+            "batch_size": args.batch_size,
+            "parse_workers": args.parse_workers,
+        },
+        "corpus_pages": {kind: len(targets) for kind, targets in entries.items()},
+        "stages": stages,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+    print_results(results, baseline)
+
+    output = Path(args.output) if args.output else (
+        ROOT / "benchmarks" / "results" / f"{datetime.now():%Y%m%d-%H%M%S}-{results['git']}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"💾 Результаты: {output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# benchmarks/bench_notifications.py
+"""
+Проверка очереди уведомлений (app/notifications.py) без Telegram.
+
+Уведомления ставятся в очередь из нескольких потоков, как из синхронных
+эндпоинтов; отправка подменена фейковой с задержкой сети и одним ответом
+429 (retry_after). Проверяется, что:
+    - доставлены все уведомления, ничего не потеряно;
+    - общий темп не выше лимита, а в один чат - не чаще интервала;
+    - после 429 отправка ждёт retry_after;
+    - постановка в очередь не блокирует вызывающий поток.
+
+    python benchmarks/bench_notifications.py
+    python benchmarks/bench_notifications.py --chats 200 --per-chat 5 --rate 60
+"""
+
+import argparse
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from app.notifications import Notifier
+
+
+async def run(chats: int, per_chat: int, rate: float, burst: int, interval: float, latency: float,
+              retry_after: int) -> bool:
+    sent = []  # (monotonic, chat_id, text)
+    throttled = {"at": None, "done": False}
+
+    async def send(chat_id: int, text: str):
+        # Время начала запроса: именно его ограничивают лимиты
+        at = time.monotonic()
+        await asyncio.sleep(latency)
+        # Один раз, посреди прогона, Telegram просит подождать
+        if not throttled["done"] and len(sent) == chats // 2:
+            throttled["done"] = True
+            throttled["at"] = time.monotonic()
+            raise TelegramRetryAfter(
+                method=SendMessage(chat_id=chat_id, text=text),
+                message="Too Many Requests",
+                retry_after=retry_after,
+            )
+        sent.append((at, chat_id, text))
+
+    notifier = Notifier(send, rate=rate, burst=burst, per_chat_interval=interval)
+    notifier.start()
+
+    # Постановка в очередь из пула потоков, как из синхронных эндпоинтов
+    enqueue_times = []
+    lock = threading.Lock()
+
+    def produce(chat_id: int, i: int):
+        started = time.perf_counter()
+        notifier.enqueue(chat_id, f"Уведомление {i} для {chat_id}")
+        with lock:
+            enqueue_times.append(time.perf_counter() - started)
+
+    # Волнами: часть уведомлений чата успевает уйти отдельными сообщениями,
+    # остальные копятся за интервал и склеиваются
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for i in range(per_chat):
+            await asyncio.gather(*(loop.run_in_executor(pool, produce, 1000 + c, i) for c in range(chats)))
+            await asyncio.sleep(interval / 2)
+
+    total = chats * per_chat
+    while notifier.metrics()["sent"] + notifier.metrics()["failed"] < total:
+        await asyncio.sleep(0.05)
+        if time.monotonic() - started > 120:
+            break
+    elapsed = time.monotonic() - started
+    metrics = notifier.metrics()
+    await notifier.stop()
+
+    # Доставлено: каждое уведомление ровно в одном сообщении
+    delivered = sum(text.count("Уведомление") for _, _, text in sent)
+
+    # Максимум сообщений в любом окне в 1 секунду (+ допустимый всплеск)
+    sent.sort()
+    times = [t for t, _, _ in sent]
+    peak = 0
+    j = 0
+    for i, t in enumerate(times):
+        while times[j] < t - 1.0:
+            j += 1
+        peak = max(peak, i - j + 1)
+
+    # Минимальный интервал между сообщениями в один чат
+    last = {}
+    min_gap = float("inf")
+    for t, chat_id, _ in sent:
+        if chat_id in last:
+            min_gap = min(min_gap, t - last[chat_id])
+        last[chat_id] = t
+
+    # Запросы, начатые после 429 (начатые до него могли закончиться позже)
+    after_throttle = sorted(t for t in times if throttled["at"] and t > throttled["at"])
+    waited = (after_throttle[0] - throttled["at"]) if after_throttle else 0.0
+
+    print(f"\n📨 {total} уведомлений в {chats} чатов: {elapsed:.2f} сек, "
+          f"сообщений {len(sent)} (склеено по чатам)")
+    print(f"   пик: {peak} сообщений/сек при лимите {rate:g} (+всплеск {burst}), "
+          f"мин. интервал в чат: {min_gap:.2f} сек")
+    print(f"   после 429: пауза {waited:.2f} сек (retry_after {retry_after})")
+    print(f"   постановка в очередь: максимум {max(enqueue_times) * 1e6:.0f} мкс")
+    print(f"   метрики: {metrics}")
+
+    checks = {
+        "все уведомления доставлены": delivered == total and metrics["sent"] == total,
+        "общий лимит соблюдён": peak <= rate + burst,
+        "интервал в чат соблюдён": min_gap >= interval * 0.99,
+        "после 429 ждём retry_after": not throttled["done"] or waited >= retry_after * 0.99,
+        "очередь пуста": metrics["queue_depth"] == 0,
+    }
+    for name, ok in checks.items():
+        print(f"   {'✅' if ok else '❌'} {name}")
+    return all(checks.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Очередь уведомлений: лимиты, 429, доставка")
+    parser.add_argument('--chats', type=int, default=100, help="Чатов (по умолчанию 100)")
+    parser.add_argument('--per-chat', type=int, default=4, help="Уведомлений в чат (по умолчанию 4)")
+    parser.add_argument('--rate', type=float, default=30.0, help="Общий лимит сообщений/сек (по умолчанию 30)")
+    parser.add_argument('--burst', type=int, default=5, help="Допустимый всплеск (по умолчанию 5)")
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help="Интервал между сообщениями в чат, сек (по умолчанию 1)")
+    parser.add_argument('--latency', type=float, default=0.03,
+                        help="Задержка фейковой отправки, сек (по умолчанию 0.03)")
+    parser.add_argument('--retry-after', type=int, default=2, help="retry_after в ответе 429 (по умолчанию 2)")
+    args = parser.parse_args()
+
+    ok = asyncio.run(run(args.chats, args.per_chat, args.rate, args.burst, args.interval, args.latency, args.retry_after))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# benchmarks/bench_reference_search.py
+"""
+Задержка поиска по названиям справочника (inline-режим бота).
+
+По умолчанию индекс строится из синтетических названий заданного объёма,
+с --db - из реального справочника (тот же индекс, что использует бот).
+Запросы - префиксы слов разной длины, как при наборе "@bot огн", "@bot огненный ш".
+
+    python benchmarks/bench_reference_search.py
+    python benchmarks/bench_reference_search.py --entries 50000
+    python benchmarks/bench_reference_search.py --db dnd.db
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import reference_search
+from app.reference_search import NameIndex, SearchEntry
+
+_WORDS = [
+    "огненный", "шар", "стрела", "ледяной", "щит", "молния", "волшебная", "рука",
+    "длинный", "меч", "кольчуга", "древний", "красный", "дракон", "гоблин", "тень",
+    "призрачный", "страж", "лечение", "ран", "малое", "великое", "кислотная", "брызги",
+    "посох", "силы", "плащ", "эльфийский", "доспех", "зелье", "бехолдер", "лич",
+]
+
+
+def synthetic_index(size: int, seed: int = 1) -> NameIndex:
+    rng = random.Random(seed)
+    entries = []
+    for i in range(size):
+        name = " ".join(rng.sample(_WORDS, rng.randint(1, 4))).capitalize() + f" {i}"
+        entries.append(SearchEntry("spell", i, name, "3 уровень, Воплощение", None))
+    return NameIndex(entries)
+
+
+def db_index(path: str) -> NameIndex:
+    engine = create_engine(f"sqlite:///{path}")
+    with sessionmaker(bind=engine)() as db:
+        index = reference_search._build_index(db)
+    engine.dispose()
+    return index
+
+
+def make_queries(index: NameIndex, count: int, seed: int = 2) -> list:
+    """Префиксы названий: первые 2-8 букв одного-двух слов"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        words = reference_search.tokenize(rng.choice(index.entries).name)
+        picked = words[:rng.randint(1, min(2, len(words)))]
+        queries.append(" ".join(word[:rng.randint(2, 8)] for word in picked))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка поиска по названиям справочника")
+    parser.add_argument('--entries', type=int, default=10000,
+                        help="Синтетических записей в индексе (по умолчанию 10000)")
+    parser.add_argument('--db', help="SQLite-база справочника вместо синтетических записей")
+    parser.add_argument('--queries', type=int, default=5000, help="Запросов (по умолчанию 5000)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = db_index(args.db) if args.db else synthetic_index(args.entries)
+    build = time.perf_counter() - started
+    if not len(index):
+        print("❌ В справочнике нет записей")
+        sys.exit(1)
+
+    queries = make_queries(index, args.queries)
+    latencies = []
+    found = 0
+    for query in queries:
+        started = time.perf_counter()
+        results = index.search(query)
+        latencies.append(time.perf_counter() - started)
+        found += bool(results)
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"\n🔍 Индекс: {len(index)} записей, построен за {build * 1000:.0f} мс")
+    print(f"   {len(queries)} запросов, с результатами: {found}")
+    print(f"   задержка: медиана {statistics.median(latencies) * 1e6:.0f} мкс, "
+          f"p99 {p99 * 1e6:.0f} мкс, максимум {latencies[-1] * 1e6:.0f} мкс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# benchmarks/stress_invites.py
+"""
+Нагрузочная проверка вступления по инвайту: сотни одновременных
+join_campaign_by_invite во временной SQLite-базе.
+
+Проверяется, что:
+    - участников не больше max_uses, и current_uses совпадает с их числом;
+    - повторные одновременные вступления одного пользователя не создают дублей
+      и не расходуют лишние использования.
+
+    python benchmarks/stress_invites.py
+    python benchmarks/stress_invites.py --joins 500 --max-uses 120 --threads 64
+"""
+
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from app import crud_multiplayer, models
+from app.database import Base
+
+GM_ID = 1
+
+
+def run(joins: int, max_uses: int, threads: int, repeat_users: int) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(
+            f"sqlite:///{tmp}/stress.db",
+            connect_args={"check_same_thread": False, "timeout": 30},
+            pool_size=threads,
+            max_overflow=0,
+        )
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+
+        with Session() as db:
+            campaign = models.Campaign(name="Стресс", owner_id=GM_ID)
+            db.add(campaign)
+            db.commit()
+            invite = crud_multiplayer.create_campaign_invite(db, campaign.id, max_uses=max_uses)
+            campaign_id, token = campaign.id, invite.invite_token
+
+        # Часть пользователей вступает несколько раз одновременно
+        users = [1000 + i for i in range(joins)]
+        users += [1000 + i for i in range(repeat_users)] * 2
+
+        barrier = threading.Barrier(min(threads, len(users)))
+        results = {"joined": 0, "rejected": 0, "errors": 0}
+        lock = threading.Lock()
+
+        def join(user_id: int):
+            try:
+                barrier.wait(timeout=1)
+            except threading.BrokenBarrierError:
+                pass
+            try:
+                with Session() as db:
+                    campaign, error = crud_multiplayer.join_campaign_by_invite(db, token, user_id)
+                key = "joined" if campaign else "rejected"
+            except Exception as e:
+                print(f"  💥 {user_id}: {e}")
+                key = "errors"
+            with lock:
+                results[key] += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(join, users))
+        elapsed = time.perf_counter() - started
+
+        with Session() as db:
+            members = db.query(func.count(models.CampaignMember.id)).filter(
+                models.CampaignMember.campaign_id == campaign_id
+            ).scalar()
+            distinct_users = db.query(func.count(func.distinct(models.CampaignMember.user_id))).filter(
+                models.CampaignMember.campaign_id == campaign_id
+            ).scalar()
+            current_uses = db.query(models.CampaignInvite.current_uses).filter(
+                models.CampaignInvite.invite_token == token
+            ).scalar()
+        engine.dispose()
+
+    print(f"\n🧪 {len(users)} вступлений ({repeat_users} пользователей дважды повторно), "
+          f"max_uses={max_uses}, потоков {threads}: {elapsed:.2f} сек")
+    print(f"   успешно: {results['joined']}, отказ: {results['rejected']}, ошибок: {results['errors']}")
+    print(f"   участников: {members}, разных: {distinct_users}, current_uses: {current_uses}")
+
+    # max_uses = 0 - без лимита
+    limit = max_uses or joins
+    checks = {
+        "нет ошибок": results["errors"] == 0,
+        "нет дублей членства": members == distinct_users,
+        "лимит не превышен": members <= limit,
+        "лимит исчерпан полностью": members == min(limit, joins),
+        "current_uses = число участников": current_uses == members,
+    }
+    for name, ok in checks.items():
+        print(f"   {'✅' if ok else '❌'} {name}")
+    return all(checks.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Одновременные вступления по одному инвайту")
+    parser.add_argument('--joins', type=int, default=300, help="Разных пользователей (по умолчанию 300)")
+    parser.add_argument('--max-uses', type=int, default=100, help="Лимит инвайта (по умолчанию 100)")
+    parser.add_argument('--threads', type=int, default=32, help="Потоков (по умолчанию 32)")
+    parser.add_argument('--repeat-users', type=int, default=20,
+                        help="Пользователей, которые вступают ещё дважды параллельно (по умолчанию 20)")
+    args = parser.parse_args()
+
+    ok = run(args.joins, args.max_uses, args.threads, args.repeat_users)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,19 @@
 import asyncio
+import html
 import logging
 import os
 import random
 
 
-from aiogram import Bot, Dispatcher, F
-from aiogram.filters import CommandStart, Command
+from aiohttp import web
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.filters import CommandStart, Command, CommandObject
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiogram.types import (
     Message,
+    InlineQuery,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
     BotCommand,
     ReplyKeyboardMarkup,
     KeyboardButton,
@@ -16,6 +22,9 @@ from aiogram.types import (
     InlineKeyboardButton,
 )
 
+from app import dice, reference_search
+from app.database import SessionLocal
+
 
 logging.basicConfig(level=logging.INFO)
 
@@ -29,6 +38,24 @@ WEBAPP_URL = "https://pavelcode.ru"
 CRIT_BOT_URL = "https://t.me/dndcriticalsfbot"
 
 
+# Режим работы: polling (один экземпляр) или webhook (несколько реплик за балансировщиком)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Настройки webhook-режима
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # публичный адрес, например https://pavelcode.ru
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # приходит от Telegram в X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8081"))
+# Регистрировать webhook в Telegram при старте (достаточно одной реплики)
+WEBHOOK_REGISTER = os.getenv("WEBHOOK_REGISTER", "1") == "1"
+
+# Inline-поиск по справочнику (@bot огненный шар; inline-режим включается в @BotFather).
+# Ответы одинаковы для всех пользователей, поэтому Telegram кэширует их у себя
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))
+INLINE_PAGE_SIZE = 20
+
+
 D20_PHRASES = [
     "Кости брошены — судьба улыбается или скалится.",
     "Таверна стихла: все ждут, что покажет грань.",
@@ -100,7 +127,7 @@ def main_kb() -> ReplyKeyboardMarkup:
 
 
 def roll_d20_text() -> str:
-    roll = random.randint(1, 20)
+    roll = dice.roll("1d20").total
     phrase = random.choice(D20_PHRASES)
     if roll == 20:
         header = "💥 Натуральная 20! Крит!"
@@ -111,105 +138,253 @@ def roll_d20_text() -> str:
     return f"{header}\n{phrase}\n\nРезультат: {roll}"
 
 
-async def main():
-    if not API_TOKEN:
-        raise RuntimeError("Не задан BOT_TOKEN в переменных окружения")
+# Сколько костей слагаемого показывать в ответе на /roll
+ROLL_SHOWN_DICE = 50
 
-    bot = Bot(token=API_TOKEN)
-    dp = Dispatcher()
 
-    await bot.set_my_commands([
-        BotCommand(command="roll", description="Бросить d20 🎲"),
-        BotCommand(command="info", description="Информация"),
-        BotCommand(command="reference", description="Справочник D&D 📚"),
-    ])
+def _dice_values_text(values: list, kept: list) -> str:
+    """Кости слагаемого; отброшенные (kh/kl) зачёркнуты"""
+    remaining = list(kept)
+    parts = []
+    for value in values[:ROLL_SHOWN_DICE]:
+        if value in remaining:
+            remaining.remove(value)
+            parts.append(str(value))
+        else:
+            parts.append(f"<s>{value}</s>")
+    if len(values) > ROLL_SHOWN_DICE:
+        parts.append(f"… ещё {len(values) - ROLL_SHOWN_DICE}")
+    return " ".join(parts)
 
-    @dp.message(CommandStart())
-    async def cmd_start(message: Message):
-        # Проверяем наличие deep link параметра
-        start_param = message.text.split(maxsplit=1)[1] if len(
-            message.text.split()) > 1 else None
 
-        if start_param and start_param.startswith("invite_"):
-            # Извлекаем токен из invite_{token}
-            invite_token = start_param[7:]  # убираем "invite_"
+def roll_expression_text(expression: str) -> str:
+    try:
+        expr = dice.parse(expression)
+        result = dice.roll(expression)
+    except dice.DiceError as e:
+        return f"🤔 {html.escape(str(e))}\n\nПримеры: /roll 4d6kh3+2, /roll 2d20kl1, /roll 8d6"
 
-            # Создаём inline-кнопку для перехода к join.html
-            join_url = f"{WEBAPP_URL}/static/join.html?token={invite_token}"
+    lines = [
+        f"{'−' if t.term.sign < 0 else ''}{t.term.notation}: {_dice_values_text(t.values, t.kept)}"
+        for t in result.terms
+    ]
+    if result.modifier:
+        lines.append(f"модификатор: {result.modifier:+d}")
+    return f"🎲 {expr}\n" + "\n".join(lines) + f"\n\nРезультат: <b>{result.total}</b>"
 
-            kb = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(
-                    text="✅ Присоединиться к кампании", web_app=WebAppInfo(url=join_url))]
-            ])
 
-            await message.answer(
-                "🎲 Тебя пригласили в D&D кампанию!\n\n"
-                "Нажми кнопку ниже, чтобы присоединиться как наблюдатель.",
-                reply_markup=kb
-            )
-        else:
-            # Обычный старт
-            await message.answer(
-                "Кидай d20 — выбери действие на клавиатуре снизу.",
-                reply_markup=main_kb(),
-            )
+# Обработчики не хранят состояния в памяти процесса: любой апдейт может
+# обработать любая реплика бота
+router = Router()
 
-    @dp.message(Command("roll"))
-    async def cmd_roll(message: Message):
-        await message.answer(roll_d20_text(), reply_markup=main_kb())
 
-    @dp.message(Command("info"))
-    async def cmd_info(message: Message):
-        await message.answer(INFO_TEXT, parse_mode='HTML', reply_markup=main_kb())
+BOT_COMMANDS = [
+    BotCommand(command="roll", description="Бросить d20 или выражение: /roll 4d6kh3+2 🎲"),
+    BotCommand(command="info", description="Информация"),
+    BotCommand(command="reference", description="Справочник D&D 📚"),
+]
+
+
+def reference_kb() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text="📚 Открыть справочник",
+            web_app=WebAppInfo(url=f"{WEBAPP_URL}/static/reference.html")
+        )]
+    ])
+
+
+REFERENCE_TEXT = (
+    "📚 D&D Справочник\n\n"
+    "✨ Заклинания с фильтрами по уровню и школе магии\n"
+    "🗡️ Предметы: оружие, доспехи, снаряжение\n"
+    "🐉 Существа из бестиария с полными характеристиками\n\n"
+    "🔍 Поиск с автодополнением для быстрого доступа"
+)
+
+
+@router.message(CommandStart())
+async def cmd_start(message: Message):
+    # Проверяем наличие deep link параметра
+    start_param = message.text.split(maxsplit=1)[1] if len(
+        message.text.split()) > 1 else None
+
+    if start_param and start_param.startswith("invite_"):
+        # Извлекаем токен из invite_{token}
+        invite_token = start_param[7:]  # убираем "invite_"
+
+        # Создаём inline-кнопку для перехода к join.html
+        join_url = f"{WEBAPP_URL}/static/join.html?token={invite_token}"
 
-    @dp.message(Command("reference"))
-    async def cmd_reference(message: Message):
         kb = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(
-                text="📚 Открыть справочник",
-                web_app=WebAppInfo(url=f"{WEBAPP_URL}/static/reference.html")
-            )]
+                text="✅ Присоединиться к кампании", web_app=WebAppInfo(url=join_url))]
         ])
+
         await message.answer(
-            "📚 D&D Справочник\n\n"
-            "✨ Заклинания с фильтрами по уровню и школе магии\n"
-            "🗡️ Предметы: оружие, доспехи, снаряжение\n"
-            "🐉 Существа из бестиария с полными характеристиками\n\n"
-            "🔍 Поиск с автодополнением для быстрого доступа",
+            "🎲 Тебя пригласили в D&D кампанию!\n\n"
+            "Нажми кнопку ниже, чтобы присоединиться как наблюдатель.",
             reply_markup=kb
         )
+    else:
+        # Обычный старт
+        await message.answer(
+            "Кидай d20 — выбери действие на клавиатуре снизу.",
+            reply_markup=main_kb(),
+        )
+
 
-    @dp.message(F.text == BTN_ROLL)
-    async def on_btn_roll(message: Message):
+@router.message(Command("roll"))
+async def cmd_roll(message: Message, command: CommandObject):
+    # /roll - классический d20, /roll 4d6kh3+2 - любое выражение
+    if command.args:
+        await message.answer(roll_expression_text(command.args), parse_mode='HTML', reply_markup=main_kb())
+    else:
         await message.answer(roll_d20_text(), reply_markup=main_kb())
 
-    @dp.message(F.text == BTN_INFO)
-    async def on_btn_info(message: Message):
-        await message.answer(INFO_TEXT, parse_mode='HTML', reply_markup=main_kb())
 
-    @dp.message(F.text == BTN_CRIT)
-    async def on_btn_crit(message: Message):
-        await message.answer(f"Открыть крит-бота: {CRIT_BOT_URL}", reply_markup=main_kb())
+@router.message(Command("info"))
+async def cmd_info(message: Message):
+    await message.answer(INFO_TEXT, parse_mode='HTML', reply_markup=main_kb())
 
-    @dp.message(F.text == BTN_REFERENCE)
-    async def on_btn_reference(message: Message):
-        kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(
-                text="📚 Открыть справочник",
-                web_app=WebAppInfo(url=f"{WEBAPP_URL}/static/reference.html")
-            )]
-        ])
-        await message.answer(
-            "📚 D&D Справочник\n\n"
-            "✨ Заклинания с фильтрами по уровню и школе магии\n"
-            "🗡️ Предметы: оружие, доспехи, снаряжение\n"
-            "🐉 Существа из бестиария с полными характеристиками\n\n"
-            "🔍 Поиск с автодополнением для быстрого доступа",
-            reply_markup=kb
-        )
 
+@router.message(Command("reference"))
+async def cmd_reference(message: Message):
+    await message.answer(REFERENCE_TEXT, reply_markup=reference_kb())
+
+
+@router.message(F.text == BTN_ROLL)
+async def on_btn_roll(message: Message):
+    await message.answer(roll_d20_text(), reply_markup=main_kb())
+
+
+@router.message(F.text == BTN_INFO)
+async def on_btn_info(message: Message):
+    await message.answer(INFO_TEXT, parse_mode='HTML', reply_markup=main_kb())
+
+
+@router.message(F.text == BTN_CRIT)
+async def on_btn_crit(message: Message):
+    await message.answer(f"Открыть крит-бота: {CRIT_BOT_URL}", reply_markup=main_kb())
+
+
+@router.message(F.text == BTN_REFERENCE)
+async def on_btn_reference(message: Message):
+    await message.answer(REFERENCE_TEXT, reply_markup=reference_kb())
+
+
+_KIND_ICONS = {"spell": "✨", "item": "🗡️", "creature": "🐉"}
+
+
+def _search_reference(query: str, offset: int) -> list:
+    with SessionLocal() as db:
+        return reference_search.search(db, query, limit=INLINE_PAGE_SIZE, offset=offset)
+
+
+def _inline_result(entry: reference_search.SearchEntry) -> InlineQueryResultArticle:
+    icon = _KIND_ICONS.get(entry.kind, "📚")
+    text = f"{icon} <b>{html.escape(entry.name)}</b>"
+    if entry.summary:
+        text += f"\n<i>{html.escape(entry.summary)}</i>"
+    if entry.source_url:
+        text += f"\n\n{html.escape(entry.source_url)}"
+
+    return InlineQueryResultArticle(
+        id=f"{entry.kind}-{entry.id}",
+        title=f"{icon} {entry.name}",
+        description=entry.summary or None,
+        input_message_content=InputTextMessageContent(message_text=text, parse_mode="HTML"),
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="📚 Справочник", url=f"{WEBAPP_URL}/static/reference.html")]
+        ]),
+    )
+
+
+@router.inline_query()
+async def on_inline_query(inline_query: InlineQuery):
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    # Индекс строится из БД один раз на версию справочника - не в event loop
+    entries = await asyncio.to_thread(_search_reference, inline_query.query, offset)
+
+    next_offset = str(offset + len(entries)) if len(entries) == INLINE_PAGE_SIZE else ""
+    await inline_query.answer(
+        [_inline_result(entry) for entry in entries],
+        cache_time=INLINE_CACHE_TIME,
+        is_personal=False,
+        next_offset=next_offset,
+    )
+
+
+def create_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+def create_webhook_app(
+    bot: Bot,
+    dp: Dispatcher,
+    secret_token: str = WEBHOOK_SECRET,
+    path: str = WEBHOOK_PATH,
+    handle_in_background: bool = True,
+    register_webhook: bool = WEBHOOK_REGISTER,
+) -> web.Application:
+    """
+    aiohttp-приложение для приёма апдейтов от Telegram.
+    Запросы без правильного X-Telegram-Bot-Api-Secret-Token отклоняются (401).
+    """
+    if not secret_token:
+        raise RuntimeError("Для webhook-режима задайте WEBHOOK_SECRET")
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,
+        handle_in_background=handle_in_background,
+    ).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    app.router.add_get("/health", health)
+
+    if register_webhook:
+        async def on_startup(bot: Bot):
+            if not WEBHOOK_BASE_URL:
+                raise RuntimeError("Для регистрации webhook задайте WEBHOOK_BASE_URL")
+            await bot.set_my_commands(BOT_COMMANDS)
+            await bot.set_webhook(
+                url=WEBHOOK_BASE_URL.rstrip("/") + path,
+                secret_token=secret_token,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+
+        dp.startup.register(on_startup)
+
+    return app
+
+
+async def run_polling():
+    bot = Bot(token=API_TOKEN)
+    dp = create_dispatcher()
+
+    await bot.set_my_commands(BOT_COMMANDS)
+    # Если раньше работал webhook, Telegram не отдаст апдейты через getUpdates
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
 
+def run_webhook():
+    bot = Bot(token=API_TOKEN)
+    dp = create_dispatcher()
+    app = create_webhook_app(bot, dp)
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_MODE == "webhook":
+        run_webhook()
+    else:
+        asyncio.run(run_polling())
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# scripts/load_reference.py
+"""
+Загрузка справочника с next.dnd.su: заклинания, предметы, существа.
+
+Использование:
+    python scripts/load_reference.py --kind spells
+    python scripts/load_reference.py --kind items --limit 50
+    python scripts/load_reference.py --kind creatures --workers 8 --rate 4
+    python scripts/load_reference.py --kind spells --discovery sitemap
+    python scripts/load_reference.py --kind spells --start 10000 --end 10100  # перебор ID
+    python scripts/load_reference.py --kind spells --replay pages.zip
+    python scripts/load_reference.py --kind creatures --resume  # продолжить прерванный обход
+"""
+
+import asyncio
+import os
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.database import SessionLocal, engine, Base
+from app import crud_reference
+from app.parsers.dndsu_parser import DndSuParser
+from app.ingest.pipeline import (
+    DISCOVERY_MODES, KINDS, IngestPipeline, listing_targets, range_targets, sitemap_targets
+)
+from app.ingest.state import CrawlState
+
+
+async def load_reference(
+    kind: str,
+    discovery: str = "listing",
+    start_id: int = None,
+    end_id: int = None,
+    max_pages: int = None,
+    limit: int = None,
+    workers: int = 4,
+    rate: float = 2.0,
+    burst: int = 2,
+    cache_dir: str = None,
+    replay_from: str = None,
+    record_to: str = None,
+    parse_workers: int = 0,
+    batch_size: int = 100,
+    verbose: bool = True,
+    state_path: str = None,
+    resume: bool = False,
+    max_attempts: int = 4
+):
+    """
+    Загрузка записей справочника
+
+    Args:
+        kind: spells | items | creatures
+        discovery: Откуда брать записи: listing (страницы списка), sitemap
+            или range (перебор ID от start_id до end_id)
+        start_id: Начальный ID (для range)
+        end_id: Конечный ID (для range)
+        max_pages: Не больше стольких страниц списка (для listing)
+        limit: Максимальное количество новых/обновлённых записей
+        workers: Количество параллельных загрузчиков
+        rate: Средняя частота запросов к сайту (в секунду)
+        burst: Допустимый всплеск запросов
+        cache_dir: Каталог HTTP-кэша для условных запросов (None - без кэша)
+        replay_from: Каталог или .zip с сохранёнными страницами вместо сайта
+        record_to: Каталог или .zip, куда сохранять скачанные страницы
+        parse_workers: Процессов для разбора HTML (0 - разбирать в цикле asyncio)
+        batch_size: Сколько записей записывать в БД одним запросом
+        verbose: Печатать каждую записанную запись
+        state_path: Файл состояния обхода (None - без повторов и продолжения)
+        resume: Продолжить прерванный обход с места остановки
+        max_attempts: Попыток загрузить страницу, прежде чем сдаться
+    """
+    spec = KINDS[kind]
+
+    print(f"✨ Загрузка справочника с next.dnd.su: {spec.title}\n")
+    if discovery == "range":
+        print(f"📊 Перебор ID: {start_id} - {end_id}")
+    else:
+        print(f"📊 Поиск записей: {discovery}")
+    print(f"🐌 Лимиты: {workers} загрузчиков, {rate} запр/сек (всплеск до {burst}), "
+          f"backoff при 429/503\n")
+
+    # Создаем таблицы
+    Base.metadata.create_all(bind=engine)
+
+    if replay_from:
+        print(f"📼 Воспроизведение сохранённых страниц: {replay_from}")
+        cache_dir = None
+    if record_to:
+        print(f"⏺️  Запись страниц в: {record_to}")
+
+    parser = DndSuParser(
+        rate=rate,
+        burst=burst,
+        max_per_host=workers,
+        cache_dir=cache_dir,
+        replay_from=replay_from,
+        record_to=record_to,
+        extract_workers=parse_workers
+    )
+    db = SessionLocal()
+    crud_reference.ensure_content_hash_columns(db)
+    state = CrawlState(state_path, kind, max_attempts=max_attempts) if state_path else None
+
+    try:
+        pipeline = IngestPipeline(
+            kind,
+            parser,
+            db,
+            fetch_workers=workers,
+            parse_workers=max(1, parse_workers),
+            batch_size=batch_size,
+            limit=limit,
+            conditional=cache_dir is not None,
+            verbose=verbose,
+            state=state
+        )
+        if discovery == "range":
+            targets = range_targets(start_id, end_id)
+        elif discovery == "sitemap":
+            targets = sitemap_targets(parser, kind)
+        else:
+            # При продолжении - со страницы списка после последней пройденной
+            start_page = 1
+            if state and resume:
+                start_page = int(state.get_meta("listing_page") or 0) + 1
+            targets = listing_targets(
+                parser, kind,
+                max_pages=max_pages,
+                start_page=start_page,
+                on_page=(lambda page: state.set_meta("listing_page", page)) if state else None
+            )
+        stats = await pipeline.run(targets, resume=resume)
+        print()
+        print(stats.report(parser))
+        if state:
+            print(f"💾 Состояние обхода: {state.counts()}, "
+                  f"попытки кончились: {state.gave_up()}")
+        return stats
+
+    finally:
+        if state:
+            state.close()
+        db.close()
+        await parser.close()
+
+
+def add_common_arguments(parser: argparse.ArgumentParser):
+    """Общие параметры загрузчиков справочника"""
+    parser.add_argument(
+        '--discovery',
+        choices=DISCOVERY_MODES,
+        help="Откуда брать записи: listing - страницы списка (по умолчанию), sitemap, "
+             "range - перебор ID от --start до --end (по умолчанию, если задан диапазон)"
+    )
+    parser.add_argument(
+        '--start',
+        type=int,
+        help="Начальный ID для перебора"
+    )
+    parser.add_argument(
+        '--end',
+        type=int,
+        help="Конечный ID для перебора"
+    )
+    parser.add_argument(
+        '--max-pages',
+        type=int,
+        help="Не больше стольких страниц списка"
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        help="Максимальное количество записей для загрузки/обновления"
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=4,
+        help="Количество параллельных загрузчиков (по умолчанию 4)"
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=2.0,
+        help="Средняя частота запросов к сайту в секунду (по умолчанию 2)"
+    )
+    parser.add_argument(
+        '--burst',
+        type=int,
+        default=2,
+        help="Допустимый всплеск запросов (по умолчанию 2)"
+    )
+    parser.add_argument(
+        '--cache-dir',
+        default='.cache/dndsu',
+        help="Каталог HTTP-кэша для условных запросов (по умолчанию .cache/dndsu)"
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help="Не использовать HTTP-кэш: всегда скачивать страницы целиком"
+    )
+    parser.add_argument(
+        '--replay',
+        metavar='PATH',
+        help="Брать страницы из каталога или .zip вместо сайта (без сети)"
+    )
+    parser.add_argument(
+        '--record',
+        metavar='PATH',
+        help="Сохранять скачанные страницы в каталог или .zip для последующего --replay"
+    )
+    parser.add_argument(
+        '--parse-workers',
+        type=int,
+        default=max(0, min(4, (os.cpu_count() or 1) - 1)),
+        help="Процессов для разбора HTML (0 - без пула; по умолчанию число ядер - 1, не больше 4)"
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=100,
+        help="Сколько записей записывать в БД одним запросом (по умолчанию 100)"
+    )
+    parser.add_argument(
+        '--state',
+        default='.cache/crawl_state.sqlite3',
+        help="Файл состояния обхода для повторов и --resume (по умолчанию .cache/crawl_state.sqlite3)"
+    )
+    parser.add_argument(
+        '--no-state',
+        action='store_true',
+        help="Не сохранять состояние обхода: без очереди повторов и --resume"
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="Продолжить прерванный обход с места остановки"
+    )
+    parser.add_argument(
+        '--max-attempts',
+        type=int,
+        default=4,
+        help="Попыток загрузить страницу при ошибках (по умолчанию 4)"
+    )
+    parser.add_argument(
+        '--quiet',
+        action='store_true',
+        help="Не печатать каждую запись, только периодический прогресс"
+    )
+    parser.add_argument(
+        '--all',
+        action='store_true',
+        help="Загрузить/обновить все найденные записи (игнорирует --limit)"
+    )
+
+
+def resolve_discovery(parser: argparse.ArgumentParser, args) -> str:
+    """Режим поиска записей: перебор ID - только если его попросили явно или задали диапазон"""
+    discovery = args.discovery
+    if discovery is None:
+        discovery = "range" if args.start is not None or args.end is not None else "listing"
+
+    if discovery == "range":
+        if args.start is None or args.end is None:
+            parser.error("для перебора ID нужны --start и --end")
+        # Валидация диапазона
+        if args.start > args.end:
+            parser.error("--start должен быть меньше или равен --end")
+    if args.resume and args.no_state:
+        parser.error("--resume нужен файл состояния, уберите --no-state")
+    return discovery
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Загрузка справочника (заклинания, предметы, существа) с next.dnd.su",
+        epilog="Примеры:\n"
+               "  python scripts/load_reference.py --kind spells\n"
+               "  python scripts/load_reference.py --kind items --limit 50\n"
+               "  python scripts/load_reference.py --kind creatures --discovery sitemap --quiet\n"
+               "  python scripts/load_reference.py --kind spells --start 10000 --end 10100",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        '--kind',
+        choices=sorted(KINDS),
+        required=True,
+        help="Что загружать"
+    )
+    add_common_arguments(parser)
+
+    args = parser.parse_args()
+    discovery = resolve_discovery(parser, args)
+
+    await load_reference(
+        kind=args.kind,
+        discovery=discovery,
+        start_id=args.start,
+        end_id=args.end,
+        max_pages=args.max_pages,
+        limit=None if args.all else args.limit,
+        workers=args.workers,
+        rate=args.rate,
+        burst=args.burst,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        replay_from=args.replay,
+        record_to=args.record,
+        parse_workers=args.parse_workers,
+        batch_size=args.batch_size,
+        verbose=not args.quiet,
+        state_path=None if args.no_state else args.state,
+        resume=args.resume,
+        max_attempts=args.max_attempts
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -8,6 +8,9 @@ const API_BASE = '';
 let currentTab = 'spells';
 let searchTimeout;
 
+// Локальный индекс справочника (см. /reference/bundle)
+let referenceBundle = null;
+
 // =========================
 // Инициализация
 // =========================
@@ -16,8 +19,57 @@ document.addEventListener('DOMContentLoaded', () => {
     setupTabs();
     setupSearch();
     loadContent();
+    loadBundle();
 });
 
+// =========================
+// Локальный индекс для автодополнения
+// =========================
+
+async function loadBundle() {
+    try {
+        const response = await fetch(`${API_BASE}/reference/bundle`, {
+            headers: {
+                'Authorization': `tma ${tg.initData}`
+            }
+        });
+
+        if (!response.ok) throw new Error('Failed to load bundle');
+
+        const data = await response.json();
+        // Приводим названия к нижнему регистру один раз, а не на каждое нажатие
+        ['spells', 'items', 'creatures'].forEach(key => {
+            data[key].forEach(entry => {
+                entry._search = entry.name.toLowerCase();
+            });
+        });
+        referenceBundle = data;
+    } catch (error) {
+        // Без индекса работаем через серверные подсказки
+        console.error('Error loading reference bundle:', error);
+    }
+}
+
+function localSuggestions(query, limit) {
+    const needle = query.toLowerCase();
+    const pick = (list) => {
+        const result = [];
+        for (const entry of list) {
+            if (entry._search.includes(needle)) {
+                result.push(entry);
+                if (result.length >= limit) break;
+            }
+        }
+        return result;
+    };
+
+    return {
+        spells: pick(referenceBundle.spells),
+        items: pick(referenceBundle.items),
+        creatures: pick(referenceBundle.creatures)
+    };
+}
+
 // =========================
 // Вкладки
 // =========================
@@ -50,6 +102,12 @@ function setupSearch() {
             return;
         }
 
+        // Индекс загружен - ищем локально, без запросов к серверу
+        if (referenceBundle) {
+            showSuggestions(localSuggestions(query, 5));
+            return;
+        }
+
         // Debounce: ждем 300мс после последнего ввода
         searchTimeout = setTimeout(async () => {
             await fetchSuggestions(query);